@@ -1,12 +1,24 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from models.schemas import ChatRequest, ChatResponse, ErrorResponse
-from services.intent_classifier import classify_intent
-from services.retriever import retrieve
-from services.rag_engine import generate_response
+from services.intent_classifier import classify_intent_async
+from services.retriever import retrieve_async
+from services.rag_engine import generate_response_async, stream_response_async
+from services.response_cache import collect_cache_tags
+from services.speculative import SPECULATIVE_RETRIEVAL, classify_and_retrieve_speculative
+from services.single_call import SINGLE_CALL_MODE, classify_and_answer
+from services.llm_clients import finish_llm_call_count, start_llm_call_count
+import asyncio
+import json
 import traceback
+from collections import Counter, deque
 
 router = APIRouter()
 
+# Messages a WebSocket connection keeps in memory, the same window /chat reads per request
+WS_HISTORY_SIZE = 10
+WEBSOCKET_STATS = Counter()
+
 
 @router.post(
     "/chat",
@@ -37,66 +49,19 @@ async def chat(request: ChatRequest):
     Main chat endpoint - handles all customer support queries with conversation memory.
     """
     try:
-        from database.sql_db import add_message, get_conversation_history, create_conversation
-        
-        # Validate input
-        if not request.query or not request.query.strip():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Query cannot be empty"
-            )
-        
-        query = request.query.strip()
-        user_email = request.user_email
-        
-        # Get or generate session_id
-        session_id = request.session_id if request.session_id else None
-        if not session_id:
-            import uuid
-            session_id = f"session_{uuid.uuid4().hex[:16]}"
-            create_conversation(session_id, user_email)
-        
-        # Get conversation history
-        conversation_history = get_conversation_history(session_id, limit=10)
-        
-        # Store user message
-        add_message(session_id, "user", query)
+        from database.sql_db import add_message
         
-        # Step 1: Classify intent
-        try:
-            intent_result = classify_intent(query)
-            intent = intent_result['intent']
-            entities = intent_result.get('entities', {})
-            reasoning = intent_result.get('reasoning', '')
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Intent classification failed: {str(e)}"
-            )
+        calls = start_llm_call_count()
+        turn = await prepare_chat_turn(request)
         
-        # Step 2: Retrieve relevant data
+        # Step 3: Generate response using RAG with conversation history (single-call mode may have one)
         try:
-            retrieval_result = retrieve(
-                intent=intent,
-                query=query,
-                entities=entities,
-                user_email=user_email
-            )
-            context = retrieval_result['context']
-            data_source = retrieval_result['data_source']
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Data retrieval failed: {str(e)}"
-            )
-        
-        # Step 3: Generate response using RAG with conversation history
-        try:
-            ai_response = generate_response(
-                query=query,
-                context=context,
-                intent=intent,
-                conversation_history=conversation_history
+            ai_response = turn.get("answer") or await generate_response_async(
+                query=turn["query"],
+                context=turn["context"],
+                intent=turn["intent"],
+                conversation_history=turn["conversation_history"],
+                cache_tags=turn_cache_tags(turn)
             )
         except Exception as e:
             raise HTTPException(
@@ -104,23 +69,21 @@ async def chat(request: ChatRequest):
                 detail=f"Response generation failed: {str(e)}"
             )
         
+        turn["llm_calls"] = finish_llm_call_count(calls)
+        
         # Store assistant message
-        add_message(session_id, "assistant", ai_response, intent, data_source)
+        await asyncio.to_thread(
+            add_message, turn["session_id"], "assistant", ai_response, turn["intent"], turn["data_source"]
+        )
         
         # Return successful response
         return ChatResponse(
             success=True,
-            query=query,
-            intent=intent,
-            data_source=data_source,
+            query=turn["query"],
+            intent=turn["intent"],
+            data_source=turn["data_source"],
             response=ai_response,
-            metadata={
-                "session_id": session_id,
-                "entities": entities,
-                "reasoning": reasoning,
-                "context_length": len(context),
-                "conversation_length": len(conversation_history)
-            }
+            metadata=build_chat_metadata(turn)
         )
     
     except HTTPException:
@@ -136,6 +99,363 @@ async def chat(request: ChatRequest):
         )
 
 
+async def prepare_chat_turn(request: ChatRequest) -> dict:
+    """
+    Everything before generation, shared by /chat and /chat/stream: session,
+    history, storing the user message, intent classification and retrieval.
+    """
+    from database.sql_db import add_message, get_conversation_history, create_conversation
+    
+    # Validate input
+    if not request.query or not request.query.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Query cannot be empty"
+        )
+    
+    query = request.query.strip()
+    user_email = request.user_email
+    
+    # Get or generate session_id
+    session_id = request.session_id if request.session_id else None
+    if not session_id:
+        import uuid
+        session_id = f"session_{uuid.uuid4().hex[:16]}"
+        await asyncio.to_thread(create_conversation, session_id, user_email)
+    
+    async def load_history():
+        # Get conversation history
+        conversation_history = await asyncio.to_thread(get_conversation_history, session_id, 10)
+        
+        # Store user message
+        await asyncio.to_thread(add_message, session_id, "user", query)
+        return conversation_history
+    
+    if SPECULATIVE_RETRIEVAL and not SINGLE_CALL_MODE:
+        # History, classification and the likely retrievals all run at once
+        result = await run_speculative(query, user_email, load_history())
+        return {
+            "query": query,
+            "session_id": session_id,
+            "user_email": user_email,
+            "conversation_history": result["history"],
+            **turn_fields(result["intent_result"], result["retrieval_result"]),
+            "timings": result["timings"]
+        }
+    
+    conversation_history = await load_history()
+    
+    return {
+        "query": query,
+        "session_id": session_id,
+        "user_email": user_email,
+        "conversation_history": conversation_history,
+        **await classify_and_retrieve(query, user_email, conversation_history)
+    }
+
+
+async def classify_and_retrieve(query: str, user_email: str, conversation_history: list = None) -> dict:
+    """Steps 1 and 2 of the pipeline: intent classification, then SQL / vector retrieval."""
+    if SINGLE_CALL_MODE:
+        # The history is part of the prompt, so the answer may come back with the intent
+        try:
+            result = await classify_and_answer(query, user_email, conversation_history)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Intent classification or retrieval failed: {str(e)}"
+            )
+        return {
+            **turn_fields(result["intent_result"], result["retrieval_result"]),
+            "answer": result["answer"]
+        }
+    
+    if SPECULATIVE_RETRIEVAL:
+        result = await run_speculative(query, user_email)
+        return {
+            **turn_fields(result["intent_result"], result["retrieval_result"]),
+            "timings": result["timings"]
+        }
+    
+    # Step 1: Classify intent
+    try:
+        intent_result = await classify_intent_async(query)
+        intent = intent_result['intent']
+        entities = intent_result.get('entities', {})
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Intent classification failed: {str(e)}"
+        )
+    
+    # Step 2: Retrieve relevant data
+    try:
+        retrieval_result = await retrieve_async(
+            intent=intent,
+            query=query,
+            entities=entities,
+            user_email=user_email
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Data retrieval failed: {str(e)}"
+        )
+    
+    return turn_fields(intent_result, retrieval_result)
+
+
+async def run_speculative(query: str, user_email: str, history=None) -> dict:
+    """Steps 1 and 2 overlapped (SPECULATIVE_RETRIEVAL); see services/speculative.py."""
+    try:
+        return await classify_and_retrieve_speculative(query, user_email, history)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Intent classification or retrieval failed: {str(e)}"
+        )
+
+
+def turn_fields(intent_result: dict, retrieval_result: dict) -> dict:
+    return {
+        "intent": intent_result['intent'],
+        "entities": intent_result.get('entities', {}),
+        "reasoning": intent_result.get('reasoning', ''),
+        "intent_source": intent_result.get('source', 'llm'),
+        "retrieval_result": retrieval_result,
+        "context": retrieval_result['context'],
+        "data_source": retrieval_result['data_source']
+    }
+
+
+def turn_cache_tags(turn: dict) -> list:
+    """Ids (and, for order answers, the user) a cached answer for this turn is invalidated by."""
+    return collect_cache_tags(turn["retrieval_result"], turn["intent"], turn.get("user_email"))
+
+
+def build_chat_metadata(turn: dict) -> dict:
+    metadata = {
+        "session_id": turn["session_id"],
+        "entities": turn["entities"],
+        "reasoning": turn["reasoning"],
+        "intent_source": turn["intent_source"],
+        "context_length": len(turn["context"]),
+        "conversation_length": len(turn["conversation_history"])
+    }
+    for key in ("timings", "llm_calls"):
+        if key in turn:
+            metadata[key] = turn[key]
+    return metadata
+
+
+def stream_turn_answer(turn: dict):
+    """Step 3, streamed: pieces of the answer as the LLM generates them."""
+    if turn.get("answer"):
+        return answer_once(turn["answer"])
+    return stream_response_async(
+        query=turn["query"],
+        context=turn["context"],
+        intent=turn["intent"],
+        conversation_history=turn["conversation_history"],
+        cache_tags=turn_cache_tags(turn)
+    )
+
+
+async def answer_once(answer: str):
+    """An answer single-call mode already has, sent as one piece."""
+    yield answer
+
+
+def sse_event(event: str, data: dict) -> str:
+    """One server-sent event; data is JSON so newlines in tokens stay inside the frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post(
+    "/chat/stream",
+    responses={
+        200: {"description": "text/event-stream of meta, token and done events"},
+        400: {"model": ErrorResponse, "description": "Bad request"},
+        500: {"model": ErrorResponse, "description": "Internal server error"}
+    },
+    summary="Chat with streamed response (SSE)",
+    description="""
+    Same pipeline as /chat, but the answer is streamed as server-sent events while the LLM generates it:
+    
+    - `meta`: session_id, intent and data_source, sent before generation starts
+    - `token`: `{"text": ...}` for each piece of the answer
+    - `done`: the full response and metadata, once it has been saved to the conversation
+    - `error`: `{"detail": ...}` if generation fails mid-stream
+    """
+)
+async def chat_stream(request: ChatRequest):
+    """Streaming chat endpoint - time to first token instead of time to full answer."""
+    from database.sql_db import add_message
+    
+    # Errors up to retrieval are still plain HTTP errors; nothing has been streamed yet
+    calls = start_llm_call_count()
+    turn = await prepare_chat_turn(request)
+    
+    async def events():
+        yield sse_event("meta", {
+            "session_id": turn["session_id"],
+            "intent": turn["intent"],
+            "data_source": turn["data_source"]
+        })
+        
+        parts = []
+        try:
+            async for text in stream_turn_answer(turn):
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+        except Exception as e:
+            print(f"❌ Streaming error: {traceback.format_exc()}")
+            yield sse_event("error", {"detail": f"Response generation failed: {str(e)}"})
+            return
+        
+        # Store assistant message once the whole answer is known
+        ai_response = "".join(parts).strip()
+        turn["llm_calls"] = finish_llm_call_count(calls)
+        await asyncio.to_thread(
+            add_message, turn["session_id"], "assistant", ai_response, turn["intent"], turn["data_source"]
+        )
+        
+        yield sse_event("done", {
+            "success": True,
+            "query": turn["query"],
+            "intent": turn["intent"],
+            "data_source": turn["data_source"],
+            "response": ai_response,
+            "metadata": build_chat_metadata(turn)
+        })
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop proxies (nginx) from buffering the stream into one response
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def write_messages(queue: asyncio.Queue):
+    """Save a connection's messages to SQL in order, off the chat path; None ends the writer."""
+    from database.sql_db import add_message
+    
+    while True:
+        message = await queue.get()
+        if message is None:
+            return
+        try:
+            await asyncio.to_thread(add_message, *message)
+            WEBSOCKET_STATS["messages_written"] += 1
+        except Exception as e:
+            print(f"⚠️ Failed to save message for {message[0]}: {e}")
+
+
+@router.websocket("/ws/chat/{session_id}")
+async def chat_websocket(websocket: WebSocket, session_id: str, user_email: str = "john@example.com"):
+    """
+    Chat over one long-lived connection. The recent conversation is read
+    from SQL once, when the socket opens, and kept in memory; messages are
+    written through to SQL in the background.
+    
+    Send `{"query": ...}`; each answer arrives as `meta`, `token` and `done`
+    messages (`{"type": ...}`, same payloads as /chat/stream) or `error`.
+    """
+    from database.sql_db import create_conversation, get_conversation_history
+    
+    await websocket.accept()
+    WEBSOCKET_STATS["connections"] += 1
+    
+    await asyncio.to_thread(create_conversation, session_id, user_email)
+    history = deque(
+        await asyncio.to_thread(get_conversation_history, session_id, WS_HISTORY_SIZE),
+        maxlen=WS_HISTORY_SIZE
+    )
+    WEBSOCKET_STATS["history_reads"] += 1
+    
+    writes = asyncio.Queue()
+    writer = asyncio.create_task(write_messages(writes))
+    WEBSOCKET_STATS["active"] += 1
+    
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            # Binary frames carry no "text"; like malformed JSON they get an error frame
+            try:
+                message = json.loads(frame["text"])
+            except (ValueError, KeyError, TypeError):
+                message = None
+            if not isinstance(message, dict):
+                await websocket.send_json({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            
+            query = str(message.get("query") or "").strip()
+            if not query:
+                await websocket.send_json({"type": "error", "detail": "Query cannot be empty"})
+                continue
+            
+            WEBSOCKET_STATS["turns"] += 1
+            turn_email = message.get("user_email") or user_email
+            # Like /chat, the history passed to the LLM excludes the current question
+            turn = {"query": query, "session_id": session_id, "user_email": turn_email,
+                    "conversation_history": list(history)}
+            history.append({"role": "user", "content": query})
+            writes.put_nowait((session_id, "user", query))
+            
+            calls = start_llm_call_count()
+            try:
+                turn.update(await classify_and_retrieve(query, turn_email, turn["conversation_history"]))
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "detail": e.detail})
+                continue
+            
+            await websocket.send_json({
+                "type": "meta",
+                "session_id": session_id,
+                "intent": turn["intent"],
+                "data_source": turn["data_source"]
+            })
+            
+            parts = []
+            try:
+                async for text in stream_turn_answer(turn):
+                    parts.append(text)
+                    await websocket.send_json({"type": "token", "text": text})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                print(f"❌ Streaming error: {traceback.format_exc()}")
+                await websocket.send_json({"type": "error", "detail": f"Response generation failed: {str(e)}"})
+                continue
+            
+            ai_response = "".join(parts).strip()
+            turn["llm_calls"] = finish_llm_call_count(calls)
+            history.append({"role": "assistant", "content": ai_response})
+            writes.put_nowait((session_id, "assistant", ai_response, turn["intent"], turn["data_source"]))
+            
+            await websocket.send_json({
+                "type": "done",
+                "success": True,
+                "query": query,
+                "intent": turn["intent"],
+                "data_source": turn["data_source"],
+                "response": ai_response,
+                "metadata": build_chat_metadata(turn)
+            })
+    
+    except WebSocketDisconnect:
+        pass
+    
+    finally:
+        # Let queued writes finish so the conversation is complete in SQL
+        writes.put_nowait(None)
+        await writer
+        WEBSOCKET_STATS["active"] -= 1
+
+
 @router.get(
     "/conversation/{session_id}",
     summary="Get Conversation History",
@@ -145,7 +465,7 @@ async def get_conversation(session_id: str):
     """Get conversation history by session ID"""
     from database.sql_db import get_conversation_history
     
-    messages = get_conversation_history(session_id, limit=50)
+    messages = await asyncio.to_thread(get_conversation_history, session_id, 50)
     
     if not messages:
         raise HTTPException(
@@ -169,7 +489,7 @@ async def delete_conversation_endpoint(session_id: str):
     """Delete conversation by session ID"""
     from database.sql_db import delete_conversation
     
-    success = delete_conversation(session_id)
+    success = await asyncio.to_thread(delete_conversation, session_id)
     
     return {
         "success": success,
@@ -177,6 +497,38 @@ async def delete_conversation_endpoint(session_id: str):
     }
 
 
+@router.get(
+    "/metrics",
+    summary="Pipeline Metrics",
+    description="Counters for the chat pipeline (intent classification paths, caches)"
+)
+async def metrics():
+    """Expose in-process pipeline counters"""
+    from services.intent_classifier import get_intent_stats
+    from services.response_cache import get_response_cache_stats
+    from services.product_resolver import get_resolver_stats
+    from services.retriever import get_product_context_stats
+    from services.llm_clients import get_connection_stats, get_llm_call_stats
+    from services.speculative import get_speculation_stats
+    from services.single_call import get_single_call_stats
+    from database.vector_db import VECTOR_DB, get_embedding_cache_stats, get_search_stats
+    
+    return {
+        "intent_classification": get_intent_stats(),
+        "response_cache": get_response_cache_stats(),
+        "embedding_cache": get_embedding_cache_stats(),
+        "product_resolver": get_resolver_stats(),
+        "vector_search": get_search_stats(),
+        "product_context": get_product_context_stats(),
+        "vector_index": VECTOR_DB.memory_stats(),
+        "websocket": dict(WEBSOCKET_STATS),
+        "llm_connections": get_connection_stats(),
+        "speculation": get_speculation_stats(),
+        "single_call": get_single_call_stats(),
+        "llm_calls": get_llm_call_stats()
+    }
+
+
 @router.get(
     "/health",
     summary="Health Check",
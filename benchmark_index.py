@@ -0,0 +1,167 @@
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from database.ann_index import create_index, base_index, search_params, IVF_POINTS_PER_LIST, QUANTIZATIONS
+import database.ann_index as ann_index
+from database.projection import Projection
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.35 * rng.normal(size=(n, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def catalog_vectors() -> np.ndarray:
+    from database.vector_db import VECTOR_DB
+
+    if VECTOR_DB.index is None:
+        raise SystemExit("No vector index found. Run regenerate_vectors.py or use --synthetic N")
+    if VECTOR_DB._vectors is not None:
+        # A quantized index only reconstructs approximations; use the re-rank floats
+        return VECTOR_DB._vectors.get(range(len(VECTOR_DB._vectors)))
+    base = base_index(VECTOR_DB.index)
+    if isinstance(base, faiss.IndexIVF):
+        base.make_direct_map()
+    return base.reconstruct_n(0, base.ntotal)
+
+
+def timed_search(index, queries: np.ndarray, k: int, params=None):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[0])
+    return np.array(results), np.array(latencies)
+
+
+def reranked_search(index, vectors: np.ndarray, queries: np.ndarray, k: int, factor: int, params=None):
+    """Shortlist k * factor candidates from the codes, then re-rank them on the float vectors."""
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k * factor, params=params)
+        ids = ids[0][ids[0] >= 0]
+        diff = vectors[ids] - query
+        order = np.argsort(np.einsum("ij,ij->i", diff, diff), kind="stable")[:k]
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[order])
+    return results, np.array(latencies)
+
+
+def bytes_per_vector(index) -> float:
+    return faiss.serialize_index(index).size / index.ntotal
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def print_row(name: str, recall: float, latencies: np.ndarray, build_seconds: float = None,
+              index_bytes: float = None):
+    build = f"{build_seconds:8.2f}s" if build_seconds is not None else " " * 9
+    size = f"{index_bytes:9.0f}" if index_bytes is not None else " " * 9
+    print(f"{name:<28} {recall:>9.3f} {np.percentile(latencies, 50):>9.3f} "
+          f"{np.percentile(latencies, 95):>9.3f} {build} {size}")
+
+
+def build(kind: str, vectors: np.ndarray, quantization: str = "none"):
+    start = time.perf_counter()
+    train = vectors if kind == "ivf" or quantization != "none" else None
+    index = create_index(kind, vectors.shape[1], train, quantization)
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+    return index, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k vs latency of ANN index types against exact search")
+    parser.add_argument("--synthetic", type=int, default=0, help="Benchmark N synthetic vectors instead of the catalog")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists (default: IVF_NLIST)")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="IVF nprobe values to sweep")
+    parser.add_argument("--ef-search", default="16,32,64,128", help="HNSW efSearch values to sweep")
+    parser.add_argument("--quantization", default="sq8,pq", help="Quantized flat indexes to compare (sq8, pq)")
+    parser.add_argument("--rerank-factor", type=int, default=4, help="Candidates per result re-ranked on floats")
+    parser.add_argument("--dims", default="", help="Reduced dimensions to compare, e.g. 512,256,128")
+    parser.add_argument("--reduction", default="pca", choices=("pca", "matryoshka"),
+                        help="How --dims are reached (matryoshka only suits models trained for truncation)")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+        queries = synthetic_vectors(args.queries, args.dim, seed=1)
+    else:
+        vectors = catalog_vectors()
+        # Perturbed catalog rows stand in for real queries
+        rng = np.random.default_rng(1)
+        queries = vectors[rng.integers(0, len(vectors), args.queries)]
+        queries = queries + 0.05 * rng.normal(size=queries.shape).astype("float32")
+
+    if args.nlist:
+        ann_index.IVF_NLIST = args.nlist
+    k = min(args.k, len(vectors))
+
+    print("="*80)
+    print(f"ANN BENCHMARK: {len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={k}")
+    print("="*80)
+    print(f"{'index':<28} {'recall@k':>9} {'p50 ms':>9} {'p95 ms':>9} {'build':>9} {'bytes/vec':>9}")
+
+    exact, build_seconds = build("flat", vectors)
+    truth, latencies = timed_search(exact, queries, k)
+    float_bytes = bytes_per_vector(exact)
+    print_row("flat (exact)", 1.0, latencies, build_seconds, float_bytes)
+
+    for quantization in filter(None, args.quantization.split(",")):
+        if quantization not in QUANTIZATIONS or quantization == "none":
+            raise SystemExit(f"Unknown quantization {quantization!r} (expected sq8 or pq)")
+        quantized, build_seconds = build("flat", vectors, quantization)
+        index_bytes = bytes_per_vector(quantized)
+        params = search_params(quantized, nprobe=1)
+        found, latencies = timed_search(quantized, queries, k, params)
+        print_row(f"flat {quantization}", recall_at_k(found, truth), latencies, build_seconds, index_bytes)
+        found, latencies = reranked_search(quantized, vectors, queries, k, args.rerank_factor, params)
+        print_row(f"flat {quantization} + rerank x{args.rerank_factor}", recall_at_k(found, truth), latencies)
+        print(f"   {quantization}: {float_bytes / index_bytes:.1f}x smaller than float32 in RAM "
+              f"(re-rank floats stay on disk, memory-mapped)")
+
+    for dim in (int(x) for x in args.dims.split(",") if x):
+        # Recall is still measured against exact search on the full-dimension vectors
+        start = time.perf_counter()
+        projection = Projection.fit(args.reduction, vectors, dim, matryoshka=True)
+        if projection.method == "none":
+            continue
+        reduced, _ = build("flat", projection.apply(vectors))
+        build_seconds = time.perf_counter() - start
+        found, latencies = timed_search(reduced, projection.apply(queries), k)
+        print_row(f"flat {args.reduction} {dim}d", recall_at_k(found, truth), latencies,
+                  build_seconds, bytes_per_vector(reduced))
+
+    if len(vectors) >= IVF_POINTS_PER_LIST:
+        ivf, build_seconds = build("ivf", vectors)
+        print(f"   ivf nlist={ivf.nlist}")
+        for i, nprobe in enumerate(int(x) for x in args.nprobe.split(",")):
+            found, latencies = timed_search(ivf, queries, k, search_params(ivf, nprobe=nprobe))
+            print_row(f"ivf nprobe={nprobe}", recall_at_k(found, truth), latencies, build_seconds if i == 0 else None)
+
+    hnsw, build_seconds = build("hnsw", vectors)
+    for i, ef in enumerate(int(x) for x in args.ef_search.split(",")):
+        found, latencies = timed_search(hnsw, queries, k, search_params(hnsw, ef_search=ef))
+        print_row(f"hnsw efSearch={ef}", recall_at_k(found, truth), latencies, build_seconds if i == 0 else None)
+
+    print("="*80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat").lower()
+IVF_NLIST = int(os.getenv("IVF_NLIST", "1024"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+VECTOR_INDEX_MMAP = os.getenv("VECTOR_INDEX_MMAP", "true").lower() == "true"
+# Compressed vector codes: none (float32) | sq8 (int8, 4x smaller) | pq (product quantization)
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+PQ_M = int(os.getenv("PQ_M", "0"))  # sub-quantizers; 0 = one per 8 dimensions
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+QUANTIZATIONS = ("none", "sq8", "pq")
+
+# FAISS wants ~39 training points per IVF list (and per PQ centroid)
+IVF_POINTS_PER_LIST = 39
+SQ_TRAIN_SIZE = 1024
+
+
+def requires_training(kind: str, quantization: str = "none") -> bool:
+    return kind == "ivf" or quantization != "none"
+
+
+def training_size(kind: str, quantization: str = "none") -> int:
+    """How many vectors to buffer before the index can be trained."""
+    size = IVF_NLIST * IVF_POINTS_PER_LIST if kind == "ivf" else 0
+    if quantization == "pq":
+        size = max(size, (1 << PQ_NBITS) * IVF_POINTS_PER_LIST)
+    elif quantization == "sq8":
+        size = max(size, SQ_TRAIN_SIZE)
+    return size
+
+
+def pq_subquantizers(dim: int) -> int:
+    """PQ_M if it divides dim, else the most sub-quantizers of at least 8 dimensions each."""
+    if PQ_M and dim % PQ_M == 0:
+        return PQ_M
+    for m in range(max(1, dim // 8), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def _pq_nbits(train_vectors: np.ndarray) -> int:
+    # Small catalogs can't train 2^PQ_NBITS centroids per sub-quantizer
+    return max(1, min(PQ_NBITS, int(np.log2(max(2, len(train_vectors))))))
+
+
+def create_index(kind: str, dim: int, train_vectors: Optional[np.ndarray] = None,
+                 quantization: str = "none"):
+    """
+    Build an empty index of the given kind that takes the caller's row
+    ids via add_with_ids. IVF stores ids natively; flat and HNSW are
+    wrapped in IndexIDMap2 (wrapping IVF would break remove_ids, since
+    IDMap assumes the inner index compacts on removal).
+
+    flat - exact brute force, cost grows linearly with the catalog
+    ivf  - inverted lists over k-means centroids; trained on train_vectors
+    hnsw - graph index, no training, no physical deletes
+
+    quantization stores int8 (sq8) or PQ codes instead of float32; both
+    are trained on train_vectors. Flat PQ is a single-list IVFPQ, since
+    IndexPQ takes no IDSelector.
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown VECTOR_INDEX_TYPE: {kind} (expected one of {INDEX_TYPES})")
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown VECTOR_QUANTIZATION: {quantization} (expected one of {QUANTIZATIONS})")
+    if requires_training(kind, quantization) and (train_vectors is None or len(train_vectors) == 0):
+        raise ValueError(f"{kind}/{quantization} index needs training vectors")
+
+    sq8 = faiss.ScalarQuantizer.QT_8bit
+
+    if kind == "ivf" or (kind == "flat" and quantization == "pq"):
+        # Small catalogs can't fill IVF_NLIST lists
+        nlist = 1 if kind == "flat" else max(1, min(IVF_NLIST, len(train_vectors) // IVF_POINTS_PER_LIST))
+        quantizer = faiss.IndexFlatL2(dim)
+        if quantization == "sq8":
+            base = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, sq8)
+        elif quantization == "pq":
+            base = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_subquantizers(dim), _pq_nbits(train_vectors))
+        else:
+            base = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        base.train(train_vectors)
+        base.nprobe = min(IVF_NPROBE, nlist)
+        return base
+
+    if kind == "flat":
+        base = faiss.IndexScalarQuantizer(dim, sq8) if quantization == "sq8" else faiss.IndexFlatL2(dim)
+
+    else:
+        if quantization == "sq8":
+            base = faiss.IndexHNSWSQ(dim, sq8, HNSW_M)
+        elif quantization == "pq":
+            base = faiss.IndexHNSWPQ(dim, pq_subquantizers(dim), HNSW_M, _pq_nbits(train_vectors))
+        else:
+            base = faiss.IndexHNSWFlat(dim, HNSW_M)
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        base.hnsw.efSearch = HNSW_EF_SEARCH
+
+    if quantization != "none":
+        base.train(train_vectors)
+    return faiss.IndexIDMap2(base)
+
+
+def _mmap_flags() -> list:
+    flags = []
+    # Flat codes (flat, HNSW storage, IVF lists) mapped in place; FAISS >= 1.10
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        flags.append(faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    # Inverted lists only
+    flags.append(faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    return flags
+
+
+def read_index(path: str, mmap: bool = VECTOR_INDEX_MMAP) -> Tuple[object, bool]:
+    """
+    Returns (index, mapped). A mapped index reads its vectors straight from
+    the page cache, so every worker on the host shares one copy. It is
+    read-only: FAISS aborts the process on writes, so callers must load a
+    private copy (mmap=False) before adding or removing vectors.
+    """
+    if mmap:
+        for flags in _mmap_flags():
+            try:
+                return faiss.read_index(path, flags), True
+            except RuntimeError:
+                continue
+    return faiss.read_index(path), False
+
+
+def base_index(index):
+    """The ANN index inside an IndexIDMap2 wrapper, if any."""
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_kind(index) -> str:
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def index_quantization(index) -> str:
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    if isinstance(base, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "sq8"
+    return "none"
+
+
+def supports_remove(index) -> bool:
+    return index_kind(index) != "hnsw"
+
+
+# Below this many selected rows a sorted id batch is cheaper than a bitmap
+SELECTOR_BATCH_MAX = 4096
+
+
+def id_selector(mask: np.ndarray):
+    """
+    IDSelector for the rows (FAISS ids) set in a boolean mask: an id batch
+    for selective filters, otherwise a bitmap with one bit per row.
+    """
+    ids = np.flatnonzero(mask)
+    if len(ids) <= SELECTOR_BATCH_MAX:
+        return faiss.IDSelectorBatch(ids.astype("int64"))
+
+    bitmap = np.packbits(mask, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+    selector.referenced_objects = [bitmap]  # FAISS only keeps a pointer
+    return selector
+
+
+def search_params(index, nprobe: int = None, ef_search: int = None, selector=None):
+    """
+    Per-query recall/latency knobs. Returns None when nothing overrides
+    the index defaults.
+    """
+    kind = index_kind(index)
+
+    if kind == "ivf" and (nprobe or selector is not None):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or base_index(index).nprobe
+    elif kind == "hnsw" and (ef_search or selector is not None):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or base_index(index).hnsw.efSearch
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+
+    if selector is not None:
+        params.sel = selector
+    return params
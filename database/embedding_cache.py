@@ -0,0 +1,273 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+
+import numpy as np
+
+from utils.cache import LRUCache
+from utils.helpers import normalize_query
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process locking only
+    fcntl = None
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "4096"))
+# Oldest vectors of the disk tier are evicted past this many live bytes
+EMBEDDING_CACHE_DISK_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Evicted rows stay in the vectors file until it is rewritten; that happens once they
+# outweigh the live ones (and the file is past this size), so rewrites are amortized
+COMPACT_MIN_BYTES = 1024 * 1024
+
+
+def embedding_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_query(text)}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed query-embedding cache.
+
+    Tier 1 is an in-process LRU. Tier 2 is an append-only file of float32
+    rows, memory-mapped for reads, with a SQLite table mapping
+    key -> (row offset, dim). Both files live on local disk, so every
+    worker on the host shares the same entries and they survive restarts.
+
+    Tier 2 holds at most disk_max_bytes of live vectors, evicting the
+    oldest first. Compaction copies the live rows to a new generation of
+    the vectors file and repoints the key table in the same transaction,
+    so a crash leaves either the old file or the new one in use.
+    """
+
+    def __init__(self, directory: str = EMBEDDING_CACHE_DIR, memory_size: int = EMBEDDING_CACHE_MEMORY_SIZE,
+                 disk_max_bytes: int = EMBEDDING_CACHE_DISK_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.lock_path = os.path.join(directory, "vectors.lock")
+        self.disk_max_bytes = disk_max_bytes
+        self.memory = LRUCache(max_size=memory_size, ttl=None)
+
+        self._db = sqlite3.connect(os.path.join(directory, "keys.db"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, offset INTEGER, dim INTEGER)"
+        )
+        # file / generation: current vectors file; live_bytes: bytes of rows still in the key table
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)")
+        self._db.execute("INSERT OR IGNORE INTO meta VALUES ('file', 'vectors.f32')")
+        self._db.execute("INSERT OR IGNORE INTO meta VALUES ('generation', 0)")
+        self._db.execute(
+            "INSERT OR IGNORE INTO meta VALUES ('live_bytes', (SELECT COALESCE(SUM(dim), 0) * 4 FROM embeddings))"
+        )
+        self._db.commit()
+
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._mmap_file = None
+        self._dim = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+        self.compactions = 0
+
+        with self._lock, self._file_lock(exclusive=True):
+            path = self._vectors_path()
+            if not os.path.exists(path):
+                open(path, "ab").close()
+            self._remove_stale_files(os.path.basename(path))
+
+    # =============================
+    # Disk tier
+    # =============================
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Cross-process lock: shared for reads, exclusive for appends, eviction and compaction."""
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _meta(self, name: str):
+        return self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()[0]
+
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, self._meta("file"))
+
+    def _remove_stale_files(self, current: str):
+        """Vectors files left by a compaction that crashed before (or after) switching over."""
+        for name in os.listdir(self.directory):
+            if name.startswith("vectors.") and name.endswith(".f32") and name != current:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _rows(self, path: str, end: int) -> Optional[np.ndarray]:
+        """Memory-mapped view of the vectors file covering at least `end` floats."""
+        if self._mmap is None or self._mmap_file != path or len(self._mmap) < end:
+            size = os.path.getsize(path) // 4
+            if size < end:
+                return None
+            self._mmap = np.memmap(path, dtype="float32", mode="r", shape=(size,))
+            self._mmap_file = path
+        return self._mmap
+
+    def _read_disk(self, key: str) -> Optional[np.ndarray]:
+        with self._lock, self._file_lock(exclusive=False):
+            row = self._db.execute("SELECT offset, dim FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            offset, dim = row
+            rows = self._rows(self._vectors_path(), offset + dim)
+            if rows is None:
+                return None
+            return np.array(rows[offset:offset + dim])
+
+    def _write_disk(self, key: str, vector: np.ndarray):
+        data = np.ascontiguousarray(vector, dtype="float32").tobytes()
+
+        with self._lock, self._file_lock(exclusive=True):
+            if self._db.execute("SELECT 1 FROM embeddings WHERE key = ?", (key,)).fetchone():
+                return
+            path = self._vectors_path()
+            with open(path, "ab") as f:
+                offset = f.tell() // 4
+                f.write(data)
+            self._db.execute(
+                "INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?)", (key, offset, len(vector))
+            )
+            self._db.execute("UPDATE meta SET value = value + ? WHERE name = 'live_bytes'", (len(data),))
+            live_bytes = self._evict_locked()
+            self._db.commit()
+
+            if os.path.getsize(path) - live_bytes > max(live_bytes, COMPACT_MIN_BYTES):
+                self._compact_locked(path)
+
+    def _evict_locked(self) -> int:
+        """Delete the oldest keys (insertion order) until the live vectors fit disk_max_bytes."""
+        live_bytes = self._meta("live_bytes")
+        while live_bytes > self.disk_max_bytes:
+            rows = self._db.execute("SELECT rowid, dim FROM embeddings ORDER BY rowid LIMIT 256").fetchall()
+            if not rows:
+                live_bytes = 0
+                break
+            evicted = []
+            for rowid, dim in rows:
+                if live_bytes <= self.disk_max_bytes:
+                    break
+                evicted.append((rowid,))
+                live_bytes -= dim * 4
+            self._db.executemany("DELETE FROM embeddings WHERE rowid = ?", evicted)
+            self.disk_evictions += len(evicted)
+        self._db.execute("UPDATE meta SET value = ? WHERE name = 'live_bytes'", (live_bytes,))
+        return live_bytes
+
+    def _compact_locked(self, path: str):
+        """Copy the live rows to the next vectors file and switch the key table over to it."""
+        generation = self._meta("generation") + 1
+        name = f"vectors.{generation}.f32"
+        rows = self._db.execute("SELECT rowid, offset, dim FROM embeddings ORDER BY offset").fetchall()
+        source = np.memmap(path, dtype="float32", mode="r") if os.path.getsize(path) else np.zeros(0, "float32")
+
+        updates, position = [], 0
+        with open(os.path.join(self.directory, name), "wb") as f:
+            for rowid, offset, dim in rows:
+                f.write(np.ascontiguousarray(source[offset:offset + dim]).tobytes())
+                updates.append((position, rowid))
+                position += dim
+            f.flush()
+            os.fsync(f.fileno())
+        del source
+
+        self._db.executemany("UPDATE embeddings SET offset = ? WHERE rowid = ?", updates)
+        self._db.execute("UPDATE meta SET value = ? WHERE name = 'file'", (name,))
+        self._db.execute("UPDATE meta SET value = ? WHERE name = 'generation'", (generation,))
+        self._db.execute("UPDATE meta SET value = ? WHERE name = 'live_bytes'", (position * 4,))
+        self._db.commit()
+
+        self._mmap, self._mmap_file = None, None
+        self.compactions += 1
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # =============================
+    # Public API
+    # =============================
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = embedding_key(model, text)
+
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+
+        vector = self._read_disk(key)
+        if vector is not None:
+            self.disk_hits += 1
+            self._dim = len(vector)
+            self.memory.set(key, vector)
+            return vector
+
+        self.misses += 1
+        return None
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        return [self.get(model, text) for text in texts]
+
+    def put(self, model: str, text: str, vector: np.ndarray):
+        key = embedding_key(model, text)
+        vector = np.asarray(vector, dtype="float32")
+        self._dim = len(vector)
+        self.memory.set(key, vector)
+        try:
+            self._write_disk(key, vector)
+        except Exception as e:
+            print(f"⚠️ Embedding cache write failed: {e}")
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        lookups = memory["hits"] + self.disk_hits + self.misses
+        with self._lock:
+            disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            disk_live_bytes = self._meta("live_bytes")
+            disk_bytes = os.path.getsize(self._vectors_path())
+        return {
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (memory["hits"] + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": memory["size"],
+            "memory_bytes": memory["size"] * self._dim * 4,
+            "disk_entries": disk_entries,
+            "disk_bytes": disk_bytes,
+            "disk_live_bytes": disk_live_bytes,
+            "disk_max_bytes": self.disk_max_bytes,
+            "disk_evictions": self.disk_evictions,
+            "compactions": self.compactions
+        }
+
+
+# =============================
+# GLOBAL INSTANCE (lazy)
+# =============================
+_embedding_cache = None
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    global _embedding_cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
@@ -0,0 +1,271 @@
+import asyncio
+import os
+import random
+import re
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple
+
+import httpx
+import numpy as np
+from dotenv import load_dotenv
+from google import genai
+from google.genai import errors as genai_errors
+
+load_dotenv()
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini").lower()
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_RETRY_BASE_DELAY = float(os.getenv("EMBED_RETRY_BASE_DELAY", "0.5"))
+EMBED_CPU_WORKERS = int(os.getenv("EMBED_CPU_WORKERS", str(os.cpu_count() or 1)))
+
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class EmbeddingProvider:
+    """
+    Turns texts into float32 vectors. `name` identifies the model and is
+    recorded with the index, so vectors from different models never mix.
+    """
+
+    name = None
+    dim = None
+    # Cosine similarity below which a search hit is unrelated to the query
+    min_similarity = 0.0
+    # Trained so that the leading dims are an embedding on their own (Matryoshka)
+    matryoshka = False
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    async def embed_async(self, texts: List[str]) -> np.ndarray:
+        return await asyncio.to_thread(self.embed, texts)
+
+    def iter_batches(self, items: Iterable, batch_size: int = None,
+                     text_of=lambda item: item) -> Iterator[Tuple[list, np.ndarray]]:
+        """Yield (items, embeddings) per batch, in input order."""
+        for batch in _batched(items, batch_size or EMBED_BATCH_SIZE):
+            yield batch, self.embed([text_of(item) for item in batch])
+
+
+# =============================
+# Gemini (remote)
+# =============================
+_gemini_client = None
+
+
+def get_gemini_client():
+    global _gemini_client
+    if _gemini_client is None:
+        _gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    return _gemini_client
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, genai_errors.APIError):
+        return error.code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def _retry_delay(attempt: int) -> float:
+    # Exponential backoff with full jitter
+    return random.uniform(0, EMBED_RETRY_BASE_DELAY * (2 ** attempt))
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    min_similarity = 0.45
+    # text-embedding-004 supports elastic output sizes below 768
+    matryoshka = True
+
+    def __init__(self, model: str = "text-embedding-004"):
+        self.model = model
+        self.name = f"gemini:{model}"
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        client = get_gemini_client()
+
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            try:
+                res = client.models.embed_content(model=self.model, contents=texts)
+                return np.array([e.values for e in res.embeddings], dtype="float32")
+            except Exception as e:
+                if attempt == EMBED_MAX_RETRIES or not _is_transient(e):
+                    raise
+                time.sleep(_retry_delay(attempt))
+
+    async def _embed_batch_async(self, texts: List[str]) -> np.ndarray:
+        client = get_gemini_client()
+
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            try:
+                res = await client.aio.models.embed_content(model=self.model, contents=texts)
+                return np.array([e.values for e in res.embeddings], dtype="float32")
+            except Exception as e:
+                if attempt == EMBED_MAX_RETRIES or not _is_transient(e):
+                    raise
+                await asyncio.sleep(_retry_delay(attempt))
+
+    def iter_batches(self, items: Iterable, batch_size: int = None, text_of=lambda item: item,
+                     concurrency: int = None) -> Iterator[Tuple[list, np.ndarray]]:
+        """
+        Up to `concurrency` batch requests in flight; callers never hold
+        more than batch_size * concurrency vectors at once.
+        """
+        batch_size = batch_size or EMBED_BATCH_SIZE
+        concurrency = concurrency or EMBED_CONCURRENCY
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            in_flight = deque()
+            for batch in _batched(items, batch_size):
+                in_flight.append((batch, pool.submit(self._embed_batch, [text_of(item) for item in batch])))
+                if len(in_flight) >= concurrency:
+                    done_batch, future = in_flight.popleft()
+                    yield done_batch, future.result()
+
+            while in_flight:
+                done_batch, future = in_flight.popleft()
+                yield done_batch, future.result()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        batches = [embeddings for _, embeddings in self.iter_batches(texts)]
+        return np.vstack(batches) if batches else np.zeros((0, 0), dtype="float32")
+
+    async def embed_async(self, texts: List[str], batch_size: int = None, concurrency: int = None) -> np.ndarray:
+        semaphore = asyncio.Semaphore(concurrency or EMBED_CONCURRENCY)
+
+        async def run(batch):
+            async with semaphore:
+                return await self._embed_batch_async(batch)
+
+        batches = await asyncio.gather(*[run(b) for b in _batched(texts, batch_size or EMBED_BATCH_SIZE)])
+        return np.vstack(batches) if batches else np.zeros((0, 0), dtype="float32")
+
+
+# =============================
+# Hashing projector (local, no dependencies)
+# =============================
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _hash_embed_chunk(texts: List[str], dim: int) -> np.ndarray:
+    """Module-level so it can run in worker processes."""
+    out = np.zeros((len(texts), dim), dtype="float32")
+
+    for row, text in enumerate(texts):
+        words = _TOKEN.findall(text.lower())
+        features = [(w, 1.0) for w in words]
+        features += [(f"{a}_{b}", 0.7) for a, b in zip(words, words[1:])]
+        features += [(f"#{w[i:i + 3]}", 0.3) for w in words if len(w) > 3 for i in range(len(w) - 2)]
+
+        for feature, weight in features:
+            h = zlib.crc32(feature.encode())
+            out[row, h % dim] += weight if h & 0x80000000 else -weight
+
+        # Sublinear term frequency, then unit length
+        np.copyto(out[row], np.sign(out[row]) * np.log1p(np.abs(out[row])))
+        norm = np.linalg.norm(out[row])
+        if norm > 0:
+            out[row] /= norm
+
+    return out
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Signed feature hashing over words, bigrams and character trigrams.
+    Lexical rather than semantic, but runs in microseconds, offline,
+    and large batches fan out across all CPU cores.
+    """
+
+    PARALLEL_THRESHOLD = 512
+    # Only shared words and trigrams score, so related texts sit far lower than with a model
+    min_similarity = 0.08
+
+    def __init__(self, dim: int = 512, workers: int = EMBED_CPU_WORKERS):
+        self.dim = dim
+        self.workers = workers
+        self.name = f"hashing:{dim}"
+        self._pool = None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if len(texts) < self.PARALLEL_THRESHOLD or self.workers <= 1:
+            return _hash_embed_chunk(texts, self.dim)
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        chunk = -(-len(texts) // self.workers)
+        chunks = [texts[i:i + chunk] for i in range(0, len(texts), chunk)]
+        return np.vstack(list(self._pool.map(_hash_embed_chunk, chunks, [self.dim] * len(chunks))))
+
+    async def embed_async(self, texts: List[str]) -> np.ndarray:
+        if len(texts) < self.PARALLEL_THRESHOLD:
+            return self.embed(texts)
+        return await asyncio.to_thread(self.embed, texts)
+
+
+# =============================
+# sentence-transformers (local, optional dependency)
+# =============================
+class SentenceTransformerProvider(EmbeddingProvider):
+    min_similarity = 0.25
+
+    def __init__(self, model: str = "all-MiniLM-L6-v2", batch_size: int = 64):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError(
+                "EMBEDDING_PROVIDER=local requires sentence-transformers (pip install sentence-transformers)"
+            )
+
+        torch.set_num_threads(EMBED_CPU_WORKERS)
+        self.model = SentenceTransformer(model, device="cpu")
+        self.batch_size = batch_size
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"sentence-transformers:{model}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        ).astype("float32")
+
+
+# =============================
+# Provider selection
+# =============================
+_provider = None
+
+
+def create_embedding_provider(kind: str = EMBEDDING_PROVIDER) -> EmbeddingProvider:
+    if kind == "gemini":
+        return GeminiEmbeddingProvider(os.getenv("GEMINI_EMBEDDING_MODEL", "text-embedding-004"))
+    if kind == "hashing":
+        return HashingEmbeddingProvider(int(os.getenv("HASHING_EMBEDDING_DIM", "512")))
+    if kind == "local":
+        return SentenceTransformerProvider(os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER: {kind}")
+
+
+def get_embedding_provider() -> EmbeddingProvider:
+    global _provider
+    if _provider is None:
+        _provider = create_embedding_provider()
+    return _provider
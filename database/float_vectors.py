@@ -0,0 +1,84 @@
+import copy
+import os
+from typing import List
+
+import numpy as np
+
+# Rows copied per step when writing, so a snapshot never holds the whole file in memory
+WRITE_CHUNK_ROWS = 65536
+
+
+class FloatVectorStore:
+    """
+    Full-precision float32 vectors by row, kept beside a quantized index
+    for exact re-ranking. The file is a .npy array memory-mapped read-only,
+    so only the pages of re-ranked candidates are ever read; rows added
+    since it was written live in in-memory chunks until the next snapshot.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._base = None
+        self._chunks = []  # (start row, float32 array) added since the file was written
+        self._length = 0
+
+        if path and os.path.exists(path):
+            self._base = np.load(path, mmap_mode="r")
+            self._length = len(self._base)
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def dim(self) -> int:
+        if self._base is not None:
+            return self._base.shape[1]
+        return self._chunks[0][1].shape[1] if self._chunks else 0
+
+    def add(self, start: int, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        self._chunks.append((start, vectors))
+        self._length = max(self._length, start + len(vectors))
+
+    def get(self, rows: List[int]) -> np.ndarray:
+        rows = np.asarray(rows, dtype="int64")
+        out = np.zeros((len(rows), self.dim), dtype="float32")
+        found = np.zeros(len(rows), dtype=bool)
+
+        # Newest chunk wins: a replayed batch may rewrite rows already in the file
+        for start, vectors in reversed(self._chunks):
+            inside = ~found & (rows >= start) & (rows < start + len(vectors))
+            out[inside] = vectors[rows[inside] - start]
+            found |= inside
+        if self._base is not None:
+            inside = ~found & (rows < len(self._base))
+            out[inside] = self._base[rows[inside]]
+        return out
+
+    # =============================
+    # Snapshots
+    # =============================
+    def snapshot(self) -> "FloatVectorStore":
+        """Frozen view sharing the mapped file, safe to write without holding a lock."""
+        frozen = copy.copy(self)
+        frozen._chunks = list(self._chunks)
+        return frozen
+
+    def save(self, path: str):
+        out = np.lib.format.open_memmap(path, mode="w+", dtype="float32", shape=(self._length, self.dim))
+        if self._base is not None:
+            for start in range(0, len(self._base), WRITE_CHUNK_ROWS):
+                end = min(start + WRITE_CHUNK_ROWS, len(self._base))
+                out[start:end] = self._base[start:end]
+        for start, vectors in self._chunks:
+            out[start:start + len(vectors)] = vectors
+        out.flush()
+        del out
+
+    def stats(self) -> dict:
+        return {
+            "rows": self._length,
+            "mapped_rows": len(self._base) if self._base is not None else 0,
+            "overlay_rows": sum(len(vectors) for _, vectors in self._chunks),
+            "dim": self.dim
+        }
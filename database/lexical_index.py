@@ -0,0 +1,165 @@
+import heapq
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Lexical-only answer when the top hit beats the runner-up by this factor
+LEXICAL_EXACT_MARGIN = float(os.getenv("LEXICAL_EXACT_MARGIN", "1.5"))
+
+# Matches in the name count more than in the description
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "specs": 1.0, "features": 1.0, "description": 1.0}
+
+STOPWORDS = {
+    "a", "an", "and", "are", "about", "any", "do", "does", "for", "have", "how", "i", "in", "is",
+    "it", "me", "my", "of", "on", "or", "tell", "the", "this", "to", "what", "which", "with", "you",
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+_SEPARATOR = re.compile(r"[-.]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased words without stopwords. Model numbers keep a joined form
+    next to their parts: "WH-1000XM5" -> wh, 1000xm5, wh1000xm5.
+    """
+    tokens = []
+    for token in _TOKEN.findall(str(text).lower()):
+        parts = _SEPARATOR.split(token)
+        tokens.extend(p for p in parts if p not in STOPWORDS)
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+    return tokens
+
+
+def product_fields(doc: dict) -> Dict[str, str]:
+    specs = doc.get("specs") or {}
+    return {
+        "name": doc.get("name") or "",
+        "category": doc.get("category") or "",
+        "description": doc.get("description") or "",
+        "specs": " ".join(f"{k} {v}" for k, v in specs.items()) if isinstance(specs, dict) else str(specs),
+        "features": " ".join(doc.get("features") or []),
+    }
+
+
+def rrf_fuse(rankings: Iterable[List[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Reciprocal rank fusion: score(row) = sum over rankings of 1 / (k + rank)."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, 1):
+            scores[row] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """
+    In-process inverted index with BM25 scoring over product name,
+    category, description, specs and features (field-weighted term
+    frequencies). Rows are the VectorDB rows, so results fuse directly
+    with FAISS ids and share the same filter masks.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)  # term -> {row: weighted tf}
+        self._name_rows = defaultdict(set)  # term -> rows with the term in their name
+        self._doc_terms = {}  # row -> (weighted tf by term, name terms)
+        self._doc_length = {}  # row -> weighted length
+        self._total_length = 0.0
+
+    @classmethod
+    def from_metadata(cls, metadata) -> "LexicalIndex":
+        """Build from a MetadataStore, decoding only the text columns it indexes."""
+        index = cls()
+        for row, doc in metadata.iter_columns(FIELD_WEIGHTS):
+            index.set_row(row, doc)
+        return index
+
+    # =============================
+    # Updates
+    # =============================
+    def set_row(self, row: int, doc: Optional[dict]):
+        self._remove(row)
+        if doc is None:
+            return
+
+        weighted = Counter()
+        for field, text in product_fields(doc).items():
+            for token in tokenize(text):
+                weighted[token] += FIELD_WEIGHTS[field]
+        name_terms = set(tokenize(doc.get("name") or ""))
+
+        for term, tf in weighted.items():
+            self._postings[term][row] = tf
+        for term in name_terms:
+            self._name_rows[term].add(row)
+        self._doc_terms[row] = (weighted, name_terms)
+        self._doc_length[row] = sum(weighted.values())
+        self._total_length += self._doc_length[row]
+
+    def _remove(self, row: int):
+        if row not in self._doc_terms:
+            return
+        weighted, name_terms = self._doc_terms.pop(row)
+        for term in weighted:
+            del self._postings[term][row]
+            if not self._postings[term]:
+                del self._postings[term]
+        for term in name_terms:
+            self._name_rows[term].discard(row)
+            if not self._name_rows[term]:
+                del self._name_rows[term]
+        self._total_length -= self._doc_length.pop(row)
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    # =============================
+    # Queries
+    # =============================
+    def search(self, query: str, top_k: int = 5, mask: np.ndarray = None) -> List[Tuple[int, float]]:
+        """(row, BM25 score) best first; rows outside mask are skipped."""
+        n = len(self._doc_terms)
+        if n == 0:
+            return []
+        average_length = self._total_length / n
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row, tf in postings.items():
+                if mask is not None and (row >= len(mask) or not mask[row]):
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_length[row] / average_length)
+                scores[row] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def is_exact_match(self, query: str, ranked: List[Tuple[int, float]]) -> bool:
+        """
+        True when the query names one product: a query term occurs in the
+        name of the top hit and of no other product ("XPS", "1000xm5"),
+        no term names another single product (comparisons), and the top
+        hit clearly outscores the runner-up.
+        """
+        if not ranked:
+            return False
+        top_row, top_score = ranked[0]
+        named = {
+            next(iter(self._name_rows[term])) for term in set(tokenize(query))
+            if len(self._name_rows.get(term, ())) == 1
+        }
+        if named != {top_row}:
+            return False
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        return top_score >= LEXICAL_EXACT_MARGIN * runner_up
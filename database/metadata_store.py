@@ -0,0 +1,234 @@
+import copy
+import json
+import os
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+# =============================
+# File layout
+# =============================
+# MAGIC | header length (u8) | header JSON | 8-byte aligned sections
+#
+# The header lists every column with its kind and section offsets (relative
+# to the first section). Each column has a validity byte per row (the key is
+# missing from that row when 0) plus either
+#   i8 / f8   - fixed-width little-endian values, one per row
+#   str / json - n+1 u8 offsets into a blob of UTF-8 bytes (json values are
+#               nested specs, feature lists, booleans, ...)
+# and a shared `live` byte per row marks deleted rows (tombstones).
+MAGIC = b"VMETA001"
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _kind(values: list) -> str:
+    if all(isinstance(v, int) and not isinstance(v, bool) and -2 ** 63 <= v < 2 ** 63 for v in values):
+        return "i8"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return "f8"
+    if all(isinstance(v, str) for v in values):
+        return "str"
+    return "json"
+
+
+def encode_metadata(rows: Iterable[Optional[dict]]) -> bytes:
+    """Serialize rows (dicts, or None for deleted rows) into the columnar format."""
+    rows = list(rows)
+    n = len(rows)
+    names = list(dict.fromkeys(key for row in rows if row for key in row))
+
+    sections = []
+    position = 0
+
+    def add(data: bytes) -> int:
+        nonlocal position
+        start = position
+        sections.append(data + b"\0" * (_align(len(data)) - len(data)))
+        position += _align(len(data))
+        return start
+
+    live = add(np.array([row is not None for row in rows], dtype="uint8").tobytes())
+
+    columns = []
+    for name in names:
+        valid = np.array([row is not None and name in row for row in rows], dtype="uint8")
+        values = [row[name] for row in rows if row is not None and name in row]
+        kind = _kind(values)
+        column = {"name": name, "kind": kind, "valid": add(valid.tobytes())}
+
+        if kind in ("i8", "f8"):
+            dense = np.zeros(n, dtype="<" + kind)
+            dense[valid.astype(bool)] = values
+            column["values"] = add(dense.tobytes())
+        else:
+            encoded = [
+                (v if kind == "str" else json.dumps(v)).encode() for v in values
+            ]
+            lengths = np.zeros(n, dtype="<u8")
+            lengths[valid.astype(bool)] = [len(e) for e in encoded]
+            offsets = np.concatenate([[0], np.cumsum(lengths)]).astype("<u8")
+            column["offsets"] = add(offsets.tobytes())
+            column["blob"] = add(b"".join(encoded))
+
+        columns.append(column)
+
+    header = json.dumps({"rows": n, "live": live, "columns": columns}).encode()
+    prefix = MAGIC + np.array([len(header)], dtype="<u8").tobytes() + header
+    prefix += b"\0" * (_align(len(prefix)) - len(prefix))
+    return prefix + b"".join(sections)
+
+
+# =============================
+# Store
+# =============================
+class MetadataStore:
+    """
+    List-like product metadata: store[row] -> dict, or None for a deleted row.
+
+    Rows written to disk are memory-mapped and decoded only when accessed,
+    so a worker holds the column arrays in shared page cache rather than a
+    dict per product. Rows changed or appended since the file was written
+    live in a small in-memory overlay until the next snapshot.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._base_rows = 0
+        self._live = None
+        self._columns = {}
+        self._mapped_bytes = 0
+        self._overlay = {}  # row -> dict | None
+        self._length = 0
+
+        if path and os.path.exists(path):
+            self._open(path)
+
+    def _open(self, path: str):
+        buf = np.memmap(path, dtype="uint8", mode="r")
+        if bytes(buf[:8]) != MAGIC:
+            raise ValueError(f"{path} is not a metadata store")
+
+        header_length = int(buf[8:16].view("<u8")[0])
+        header = json.loads(bytes(buf[16:16 + header_length]))
+        data = _align(16 + header_length)
+        n = header["rows"]
+
+        def section(offset: int, count: int, dtype: str) -> np.ndarray:
+            start = data + offset
+            return buf[start:start + count * np.dtype(dtype).itemsize].view(dtype)
+
+        self._base_rows = self._length = n
+        self._live = section(header["live"], n, "uint8")
+        for column in header["columns"]:
+            entry = {"kind": column["kind"], "valid": section(column["valid"], n, "uint8")}
+            if column["kind"] in ("i8", "f8"):
+                entry["values"] = section(column["values"], n, "<" + column["kind"])
+            else:
+                entry["offsets"] = section(column["offsets"], n + 1, "<u8")
+                entry["blob"] = section(column["blob"], int(entry["offsets"][-1]), "uint8")
+            self._columns[column["name"]] = entry
+        self._mapped_bytes = len(buf)
+
+    # =============================
+    # List protocol
+    # =============================
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, row: int) -> Optional[dict]:
+        if not 0 <= row < self._length:
+            raise IndexError(row)
+        if row in self._overlay:
+            return self._overlay[row]
+        if row < self._base_rows:
+            return self._decode(row)
+        return None
+
+    def __setitem__(self, row: int, doc: Optional[dict]):
+        self._overlay[row] = doc
+        self._length = max(self._length, row + 1)
+
+    def __iter__(self) -> Iterator[Optional[dict]]:
+        for row in range(self._length):
+            yield self[row]
+
+    def append(self, doc: Optional[dict]):
+        self[self._length] = doc
+
+    def extend(self, docs: Iterable[Optional[dict]]):
+        for doc in docs:
+            self.append(doc)
+
+    # =============================
+    # Decoding
+    # =============================
+    def _value(self, column: dict, row: int):
+        if column["kind"] == "i8":
+            return int(column["values"][row])
+        if column["kind"] == "f8":
+            return float(column["values"][row])
+
+        start, end = column["offsets"][row], column["offsets"][row + 1]
+        text = column["blob"][start:end].tobytes().decode()
+        return text if column["kind"] == "str" else json.loads(text)
+
+    def _decode(self, row: int) -> Optional[dict]:
+        if not self._live[row]:
+            return None
+        return {
+            name: self._value(column, row)
+            for name, column in self._columns.items() if column["valid"][row]
+        }
+
+    def iter_column(self, name: str) -> Iterator[Tuple[int, object]]:
+        """(row, value) for every live row that has `name`, without decoding whole rows."""
+        column = self._columns.get(name)
+        if column is not None:
+            present = np.flatnonzero(self._live.astype(bool) & column["valid"].astype(bool))
+            for row in present:
+                if row not in self._overlay:
+                    yield int(row), self._value(column, row)
+
+        for row in sorted(self._overlay):
+            doc = self._overlay[row]
+            if doc is not None and name in doc:
+                yield row, doc[name]
+
+    def iter_columns(self, names: Iterable[str]) -> Iterator[Tuple[int, dict]]:
+        """(row, {name: value}) for every live row, decoding only the named columns."""
+        names = list(names)
+        columns = [(name, self._columns[name]) for name in names if name in self._columns]
+        if self._live is not None:
+            for row in np.flatnonzero(self._live.astype(bool)):
+                if row not in self._overlay:
+                    yield int(row), {
+                        name: self._value(column, row) for name, column in columns if column["valid"][row]
+                    }
+
+        for row in sorted(self._overlay):
+            doc = self._overlay[row]
+            if doc is not None:
+                yield row, {name: doc[name] for name in names if name in doc}
+
+    # =============================
+    # Snapshots
+    # =============================
+    def snapshot(self) -> "MetadataStore":
+        """Frozen view sharing the mapped columns, safe to encode without holding a lock."""
+        frozen = copy.copy(self)
+        frozen._overlay = dict(self._overlay)
+        return frozen
+
+    def to_bytes(self) -> bytes:
+        return encode_metadata(self)
+
+    def stats(self) -> dict:
+        return {
+            "rows": self._length,
+            "mapped_rows": self._base_rows,
+            "overlay_rows": len(self._overlay),
+            "mapped_bytes": self._mapped_bytes
+        }
@@ -0,0 +1,130 @@
+from typing import Optional
+
+import numpy as np
+
+FILTER_KEYS = ("category", "min_price", "max_price", "in_stock")
+
+
+def normalize_filters(filters: Optional[dict]) -> dict:
+    """
+    Structured product filters:
+        category  - name or list of names (any of), case-insensitive
+        min_price / max_price - inclusive bounds
+        in_stock  - True for stock > 0
+    Keys that are None are dropped; unknown keys raise ValueError.
+    """
+    filters = {k: v for k, v in (filters or {}).items() if v is not None}
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown product filters: {sorted(unknown)} (expected {FILTER_KEYS})")
+
+    if "category" in filters:
+        categories = filters["category"]
+        if isinstance(categories, str):
+            categories = [categories]
+        filters["category"] = sorted({c.strip().lower() for c in categories})
+    for key in ("min_price", "max_price"):
+        if key in filters:
+            filters[key] = float(filters[key])
+    if "in_stock" in filters:
+        filters["in_stock"] = bool(filters["in_stock"])
+    return filters
+
+
+class ProductFilterIndex:
+    """
+    Row-aligned price and stock arrays plus one bitmap per category, kept
+    in step with the VectorDB rows. A filter becomes a boolean row mask,
+    which the ANN search takes as an IDSelector, so non-matching products
+    are skipped inside FAISS instead of crowding out the top-k.
+    """
+
+    def __init__(self):
+        self._size = 0
+        self._live = np.zeros(0, dtype=bool)
+        self._price = np.zeros(0, dtype="float64")
+        self._stock = np.zeros(0, dtype="float64")
+        self._categories = {}  # lowercased category -> row bitmap
+
+    def _reserve(self, size: int):
+        if size <= len(self._live):
+            return
+        capacity = max(size, 2 * len(self._live), 1024)
+
+        def grow(array: np.ndarray, fill) -> np.ndarray:
+            grown = np.full(capacity, fill, dtype=array.dtype)
+            grown[:len(array)] = array
+            return grown
+
+        self._live = grow(self._live, False)
+        self._price = grow(self._price, np.nan)
+        self._stock = grow(self._stock, np.nan)
+        self._categories = {name: grow(bitmap, False) for name, bitmap in self._categories.items()}
+
+    def _bitmap(self, category: str) -> np.ndarray:
+        if category not in self._categories:
+            self._categories[category] = np.zeros(len(self._live), dtype=bool)
+        return self._categories[category]
+
+    # =============================
+    # Updates
+    # =============================
+    def set_row(self, row: int, doc: Optional[dict]):
+        self._reserve(row + 1)
+        self._size = max(self._size, row + 1)
+
+        for bitmap in self._categories.values():
+            bitmap[row] = False
+        if doc is None:
+            self._live[row] = False
+            self._price[row] = self._stock[row] = np.nan
+            return
+
+        self._live[row] = True
+        self._price[row] = doc.get("price") if doc.get("price") is not None else np.nan
+        self._stock[row] = doc.get("stock") if doc.get("stock") is not None else np.nan
+        if doc.get("category"):
+            self._bitmap(str(doc["category"]).strip().lower())[row] = True
+
+    @classmethod
+    def from_metadata(cls, metadata) -> "ProductFilterIndex":
+        """Build from a MetadataStore column by column, without decoding whole rows."""
+        index = cls()
+        index._reserve(len(metadata))
+        index._size = len(metadata)
+
+        for row, _ in metadata.iter_column("product_id"):
+            index._live[row] = True
+        for row, price in metadata.iter_column("price"):
+            index._price[row] = price
+        for row, stock in metadata.iter_column("stock"):
+            index._stock[row] = stock
+        for row, category in metadata.iter_column("category"):
+            index._bitmap(str(category).strip().lower())[row] = True
+        return index
+
+    # =============================
+    # Queries
+    # =============================
+    def mask(self, filters: dict) -> np.ndarray:
+        """Rows matching every filter; filters must be normalized."""
+        mask = self._live[:self._size].copy()
+
+        if "category" in filters:
+            matching = np.zeros(self._size, dtype=bool)
+            for category in filters["category"]:
+                if category in self._categories:
+                    matching |= self._categories[category][:self._size]
+            mask &= matching
+        # NaN compares False, so rows without a price/stock never match a bound
+        if "min_price" in filters:
+            mask &= self._price[:self._size] >= filters["min_price"]
+        if "max_price" in filters:
+            mask &= self._price[:self._size] <= filters["max_price"]
+        if filters.get("in_stock"):
+            mask &= self._stock[:self._size] > 0
+
+        return mask
+
+    def categories(self) -> dict:
+        return {name: int(bitmap[:self._size].sum()) for name, bitmap in self._categories.items()}
@@ -0,0 +1,123 @@
+import os
+import zlib
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# none | pca (fitted at build time) | matryoshka (keep the leading dims; models trained for it)
+VECTOR_DIM_REDUCTION = os.getenv("VECTOR_DIM_REDUCTION", "none").lower()
+VECTOR_REDUCED_DIM = int(os.getenv("VECTOR_REDUCED_DIM", "256"))
+
+DIM_REDUCTIONS = ("none", "pca", "matryoshka")
+# Bumped when the saved layout or the meaning of a projection changes
+PROJECTION_FORMAT = 1
+# PCA is fitted on this many vectors per output dimension (or on all of a smaller catalog)
+PCA_TRAIN_FACTOR = 4
+
+
+def projection_training_size(method: str = VECTOR_DIM_REDUCTION, dim: int = VECTOR_REDUCED_DIM) -> int:
+    """Vectors to buffer before the index is built, so PCA has a sample to fit on."""
+    return PCA_TRAIN_FACTOR * dim if method == "pca" else 0
+
+
+class Projection:
+    """
+    Linear map from embedding space to the dims stored in the index,
+    applied to documents and queries alike. Outputs are re-normalized to
+    unit length, so L2 distances still convert to cosine similarity.
+
+    PCA is uncentered (SVD of the raw embeddings): it keeps the directions
+    that carry the most dot-product mass, which is what cosine ranking uses.
+    """
+
+    def __init__(self, method: str = "none", input_dim: int = 0, components: np.ndarray = None, dim: int = None):
+        self.method = method
+        self.input_dim = input_dim
+        self.components = components  # input_dim x dim, PCA only
+        self.dim = dim if dim is not None else (components.shape[1] if components is not None else input_dim)
+
+    @classmethod
+    def fit(cls, method: str, vectors: np.ndarray, dim: int = VECTOR_REDUCED_DIM,
+            matryoshka: bool = False) -> "Projection":
+        if method not in DIM_REDUCTIONS:
+            raise ValueError(f"Unknown VECTOR_DIM_REDUCTION: {method} (expected one of {DIM_REDUCTIONS})")
+        input_dim = vectors.shape[1]
+        if method == "none" or dim >= input_dim:
+            return cls("none", input_dim)
+
+        if method == "matryoshka":
+            if not matryoshka:
+                raise ValueError(
+                    "VECTOR_DIM_REDUCTION=matryoshka needs an embedding model trained for truncation; use pca"
+                )
+            return cls("matryoshka", input_dim, dim=dim)
+
+        if len(vectors) < dim:
+            print(f"⚠️ PCA to {dim} dims needs at least {dim} vectors, got {len(vectors)}; "
+                  f"keeping {input_dim} dims")
+            return cls("none", input_dim)
+        _, _, vt = np.linalg.svd(np.asarray(vectors, dtype="float64"), full_matrices=False)
+        return cls("pca", input_dim, np.ascontiguousarray(vt[:dim].T, dtype="float32"))
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies this exact projection; recorded in the index info."""
+        data = self.components.tobytes() if self.components is not None else b""
+        return f"{self.method}-{self.input_dim}x{self.dim}-{zlib.crc32(data):08x}"
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        if self.method == "none":
+            return vectors
+        vectors = np.asarray(vectors, dtype="float32")
+        if vectors.shape[1] != self.input_dim:
+            raise ValueError(f"Projection expects {self.input_dim}-dim embeddings, got {vectors.shape[1]}")
+
+        if self.method == "pca":
+            out = vectors @ self.components
+        else:
+            out = np.array(vectors[:, :self.dim])
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+    # =============================
+    # Persistence
+    # =============================
+    def info(self) -> dict:
+        return {
+            "method": self.method,
+            "input_dim": self.input_dim,
+            "dim": self.dim,
+            "format": PROJECTION_FORMAT,
+            "fingerprint": self.fingerprint
+        }
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                format=PROJECTION_FORMAT,
+                method=self.method,
+                input_dim=self.input_dim,
+                dim=self.dim,
+                components=self.components if self.components is not None else np.zeros((0, 0), dtype="float32")
+            )
+
+    @classmethod
+    def load(cls, path: str, info: dict) -> "Projection":
+        """Load the projection an index was built with; info is what the index recorded."""
+        if info.get("method", "none") == "none":
+            return cls("none", info.get("input_dim", 0))
+        if info.get("format", PROJECTION_FORMAT) > PROJECTION_FORMAT:
+            raise ValueError(f"{path} has projection format {info['format']}; "
+                             f"this version reads {PROJECTION_FORMAT}")
+        if not os.path.exists(path):
+            raise ValueError(f"{path} not found; the index was built with {info['method']} to {info['dim']} dims")
+
+        with np.load(path) as data:
+            components = data["components"] if data["components"].size else None
+            projection = cls(str(data["method"]), int(data["input_dim"]), components, int(data["dim"]))
+        if projection.fingerprint != info.get("fingerprint"):
+            raise ValueError(f"{path} does not match the index (fingerprint {projection.fingerprint})")
+        return projection
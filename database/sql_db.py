@@ -1,6 +1,6 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, event, select
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, object_session
 from datetime import datetime
 
 # Create SQLite database
@@ -85,6 +85,76 @@ class Message(Base):
     conversation = relationship("Conversation", back_populates="messages")
 
 
+# ===== CHANGE NOTIFICATIONS =====
+
+_order_change_listeners = []
+_new_order_listeners = []
+
+
+def subscribe_order_changes(callback):
+    """Register callback(order_ids) to run after order rows are inserted, updated or deleted"""
+    _order_change_listeners.append(callback)
+
+
+def subscribe_new_orders(callback):
+    """Register callback(user_emails) to run after orders are placed for those users"""
+    _new_order_listeners.append(callback)
+
+
+def _pending_changes(target):
+    """
+    Changes seen during a flush, held on the session until it commits:
+    listeners fired mid-flush would let a concurrent request re-cache the
+    pre-commit state.
+    """
+    session = object_session(target)
+    return session.info.setdefault("pending_order_changes", {"orders": set(), "users": set()})
+
+
+def _notify(listeners, values, label):
+    for callback in listeners:
+        try:
+            callback(sorted(values))
+        except Exception as e:
+            print(f"⚠️ {label} listener failed: {e}")
+
+
+@event.listens_for(Order, "after_insert")
+def _order_placed(mapper, connection, target):
+    email = connection.execute(select(User.email).where(User.id == target.user_id)).scalar()
+    if email:
+        _pending_changes(target)["users"].add(email)
+
+
+@event.listens_for(Order, "after_update")
+@event.listens_for(Order, "after_delete")
+def _order_changed(mapper, connection, target):
+    _pending_changes(target)["orders"].add(target.id)
+
+
+@event.listens_for(OrderItem, "after_insert")
+@event.listens_for(OrderItem, "after_update")
+@event.listens_for(OrderItem, "after_delete")
+def _order_item_changed(mapper, connection, target):
+    _pending_changes(target)["orders"].add(target.order_id)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _notify_committed_changes(session):
+    changes = session.info.pop("pending_order_changes", None)
+    if not changes:
+        return
+    if changes["orders"]:
+        _notify(_order_change_listeners, changes["orders"], "Order change")
+    if changes["users"]:
+        _notify(_new_order_listeners, changes["users"], "New order")
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_rolled_back_changes(session):
+    session.info.pop("pending_order_changes", None)
+
+
 # ===== DATABASE FUNCTIONS =====
 
 def init_db():
@@ -1,128 +1,1023 @@
+import base64
 import faiss
+import json
 import numpy as np
 import os
-import pickle
-from typing import List, Optional
+import threading
+from collections import Counter
+from typing import Iterable, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
-from google import genai
+from database.embedding_cache import get_embedding_cache
+from database.embeddings import get_embedding_provider
+from database.metadata_store import MetadataStore
+from database.float_vectors import FloatVectorStore
+from database.projection import VECTOR_DIM_REDUCTION, VECTOR_REDUCED_DIM, Projection, projection_training_size
+from database.product_filters import ProductFilterIndex, normalize_filters
+from database.lexical_index import LexicalIndex, rrf_fuse
+from database.ann_index import (
+    VECTOR_INDEX_TYPE, VECTOR_QUANTIZATION, base_index, create_index, id_selector, index_kind,
+    index_quantization, read_index, requires_training, search_params, supports_remove, training_size
+)
+from utils.helpers import mapped_file_usage
 
 load_dotenv()
 
+# Compact the change log into the base files once it grows past this
+VECTOR_LOG_COMPACT_BYTES = int(os.getenv("VECTOR_LOG_COMPACT_BYTES", str(8 * 1024 * 1024)))
+VECTOR_LOG_FSYNC = os.getenv("VECTOR_LOG_FSYNC", "true").lower() == "true"
+
+# Quantized indexes fetch this many candidates per result and re-rank them on float32 vectors
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))
+
+# hybrid (BM25 + vector, fused) | vector | lexical
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid").lower()
+# Which ranking answered each search: lexical (exact match, no embedding), hybrid, vector
+SEARCH_PATH_COUNTS = Counter()
+
+# Adaptive top_k: drop results below this cosine similarity (default: per embedding model)...
+SEARCH_MIN_SCORE = float(os.getenv("SEARCH_MIN_SCORE")) if os.getenv("SEARCH_MIN_SCORE") else None
+# ...or below this fraction of the best result's score
+SEARCH_RELATIVE_CUTOFF = float(os.getenv("SEARCH_RELATIVE_CUTOFF", "0.8"))
+
 # =============================
-# Gemini Embedding Client
+# Embeddings (provider selected by EMBEDDING_PROVIDER)
 # =============================
-_gemini_client = None
+def iter_embedding_batches(items: Iterable, batch_size: int = None,
+                           text_of=lambda item: item) -> Iterator[Tuple[list, np.ndarray]]:
+    return get_embedding_provider().iter_batches(items, batch_size, text_of=text_of)
 
 
-def get_gemini_client():
-    global _gemini_client
-    if _gemini_client is None:
-        _gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    return _gemini_client
+def generate_embeddings(texts: List[str]) -> np.ndarray:
+    return get_embedding_provider().embed(texts)
 
 
-def generate_embeddings(texts: List[str]) -> np.ndarray:
-    client = get_gemini_client()
-    vectors = []
+async def generate_embeddings_async(texts: List[str]) -> np.ndarray:
+    return await get_embedding_provider().embed_async(texts)
+
+
+# =============================
+# Cached query embeddings
+# =============================
+def _split_cached(texts: List[str]):
+    cache = get_embedding_cache()
+    model = get_embedding_provider().name
+    cached = cache.get_many(model, texts) if cache else [None] * len(texts)
+    missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+    return cache, cached, missing
+
+
+def _merge_cached(cache, texts: List[str], cached: list, missing: List[str], fresh: np.ndarray) -> np.ndarray:
+    computed = dict(zip(missing, fresh))
+    if cache is not None:
+        model = get_embedding_provider().name
+        for text, vector in computed.items():
+            cache.put(model, text, vector)
+    return np.array([v if v is not None else computed[t] for t, v in zip(texts, cached)], dtype="float32")
+
+
+def embed_queries(texts: List[str]) -> np.ndarray:
+    """Query embeddings through the persistent embedding cache."""
+    cache, cached, missing = _split_cached(texts)
+    fresh = generate_embeddings(missing) if missing else []
+    return _merge_cached(cache, texts, cached, missing, fresh)
+
+
+async def embed_queries_async(texts: List[str]) -> np.ndarray:
+    cache, cached, missing = _split_cached(texts)
+    fresh = await generate_embeddings_async(missing) if missing else []
+    return _merge_cached(cache, texts, cached, missing, fresh)
+
+
+def get_embedding_cache_stats() -> dict:
+    cache = get_embedding_cache()
+    return cache.stats() if cache else {"enabled": False}
 
-    for text in texts:
-        res = client.models.embed_content(
-            model="text-embedding-004",
-            contents=text
-        )
-        vectors.append(res.embedding)
 
-    return np.array(vectors).astype("float32")
+def l2_to_similarity(distance: float) -> float:
+    """Cosine similarity from a squared L2 distance; embeddings are unit length."""
+    return 1.0 - float(distance) / 2.0
+
+
+def select_relevant(results: List[dict], min_score: float = None,
+                    relative_cutoff: float = SEARCH_RELATIVE_CUTOFF, filtered: bool = False,
+                    min_results: int = 1) -> List[dict]:
+    """
+    Adaptive top_k: keep results whose similarity clears the absolute floor
+    and stays within relative_cutoff of the best one. Results from a
+    lexical-only search have no similarity and are cut on BM25 relative to
+    the top hit. Ranking order is preserved. The floor applies first, so an
+    unrelated question can come back empty; of the results that clear it,
+    the best min_results are always kept.
+
+    filtered results already match structured filters (category, price,
+    stock), so only the relative cutoff applies to them.
+    """
+    if not results:
+        return results
+    if filtered:
+        min_score = float("-inf")
+    elif min_score is None:
+        min_score = SEARCH_MIN_SCORE if SEARCH_MIN_SCORE is not None else get_embedding_provider().min_similarity
+
+    if any(r["similarity_score"] is not None for r in results):
+        candidates = [r for r in results if r["similarity_score"] is not None and r["similarity_score"] >= min_score]
+        best = max((r["similarity_score"] for r in candidates), default=0.0)
+        kept = [r for r in candidates if r["similarity_score"] >= relative_cutoff * best]
+    else:
+        candidates = results
+        best = max(r["lexical_score"] or 0.0 for r in results)
+        kept = [r for r in results if (r["lexical_score"] or 0.0) >= relative_cutoff * best]
+
+    return kept if len(kept) >= min_results else candidates[:min_results]
+
+
+def get_search_stats() -> dict:
+    total = sum(SEARCH_PATH_COUNTS.values())
+    return {
+        "total": total,
+        "by_path": dict(SEARCH_PATH_COUNTS),
+        "lexical_only_rate": SEARCH_PATH_COUNTS["lexical"] / total if total else 0.0,
+        "mode": SEARCH_MODE
+    }
 
 
 # =============================
 # VectorDB (SAFE CLOUD VERSION)
 # =============================
+# Indexes saved before the model was recorded were built with Gemini
+LEGACY_EMBEDDING_MODEL = "gemini:text-embedding-004"
+
+
+class EmbeddingModelMismatch(ValueError):
+    pass
+
+
+def normalize_product_id(product_id) -> str:
+    """Product ids are strings ("PROD001") everywhere, including the SQL order items."""
+    return str(product_id).strip().upper()
+
+
 class VectorDB:
-    def __init__(self, index_path: str, metadata_path: str):
+    """
+    FAISS index + product metadata.
+
+    Vectors live in an IndexIDMap2 whose FAISS id is the row of the
+    document in `metadata`, a memory-mapped columnar MetadataStore. Deleted rows are left as None tombstones so
+    ids stay stable, and `_row_by_product_id` gives O(1) lookups by
+    product id. The ANN structure (flat / ivf / hnsw) is chosen by
+    VECTOR_INDEX_TYPE when the index is first built.
+
+    On disk the index is a base snapshot (index + metadata + info) plus an
+    append-only change log. Upserts, deletes and metadata edits only append
+    to the log; it is replayed on load and folded into a new snapshot by a
+    background compaction once it reaches VECTOR_LOG_COMPACT_BYTES.
+
+    The snapshot index is memory-mapped read-only where FAISS supports it,
+    so workers on a host share its pages; the first write swaps in a
+    private in-memory copy.
+
+    With VECTOR_QUANTIZATION (sq8 / pq) the index holds compressed codes
+    and the float32 vectors go to a memory-mapped file beside it; searches
+    fetch RERANK_FACTOR x more candidates and re-rank them exactly.
+
+    With VECTOR_DIM_REDUCTION (pca / matryoshka) embeddings are projected
+    to VECTOR_REDUCED_DIM dims before indexing and search; the projection
+    is fitted at build time and saved beside the index.
+    """
+
+    def __init__(self, index_path: str, metadata_path: str, index_type: str = VECTOR_INDEX_TYPE,
+                 quantization: str = VECTOR_QUANTIZATION, dim_reduction: str = VECTOR_DIM_REDUCTION,
+                 reduced_dim: int = VECTOR_REDUCED_DIM):
         self.index_path = index_path
         self.metadata_path = metadata_path
+        self.info_path = os.path.splitext(index_path)[0] + ".info.json"
+        self.log_path = os.path.splitext(index_path)[0] + ".log"
+        self.vectors_path = os.path.splitext(index_path)[0] + ".f32.npy"
+        self.projection_path = os.path.splitext(index_path)[0] + ".proj.npz"
+        # Configured values; a loaded index keeps its own until reset() rebuilds it
+        self._configured = (index_type, quantization, dim_reduction, reduced_dim)
+        self.index_type = index_type
+        self.quantization = quantization
+        self.dim_reduction = dim_reduction
+        self.reduced_dim = reduced_dim
+        self.projection = Projection()
         self.index = None
-        self.metadata = []
+        self._mapped = False  # index reads from a read-only mmap of index_path
+        self._vectors = None  # FloatVectorStore for re-ranking a quantized index
+        self.metadata = MetadataStore()
+        self.embedding_model = None
+        self._row_by_product_id = {}
+        self._filters = ProductFilterIndex()
+        self._lexical = LexicalIndex()
+        self._dead_vectors = 0  # deleted rows still in an index that can't remove (HNSW)
+        self._listeners = []
+        self._seq = 0  # sequence number of the last change applied
+        self._snapshot_seq = -1  # log_seq of the snapshot on disk
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._compacting = False
 
         # DO NOT load files at startup
         self._safe_load()
 
     def _safe_load(self):
-        if os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
+        if os.path.exists(self.index_path):
             try:
-                with open(self.metadata_path, "rb") as f:
-                    self.metadata = pickle.load(f)
-                self.index = faiss.read_index(self.index_path)
-                print("✅ FAISS index loaded")
+                self.metadata = self._load_metadata()
+                self._map_index()
+                info = self._load_info()
+                # Flat PQ is stored as a single-list IVF, so the recorded type wins
+                self.index_type = info.get("index_type") or index_kind(self.index)
+                self.quantization = index_quantization(self.index)
+                self.projection = Projection.load(self.projection_path, info.get("projection", {}))
+                self._load_vectors()
+                self.embedding_model = info.get("embedding_model", LEGACY_EMBEDDING_MODEL)
+                self._seq = self._snapshot_seq = info.get("log_seq", 0)
+                self._rebuild_id_index()
+                replayed = self._replay_log()
+                reduced = self.projection.method != "none"
+                print(f"✅ FAISS index loaded ({self.index_type}, {self.embedding_model}"
+                      f"{f', {self.quantization}' if self.quantization != 'none' else ''}"
+                      f"{f', {self.projection.method} {self.projection.dim}d' if reduced else ''}"
+                      f"{', mmap' if self._mapped else ''}"
+                      f"{f', {replayed} logged changes' if replayed else ''})")
             except Exception as e:
                 print(f"⚠️ Failed to load FAISS index: {e}")
-                self.index = None
-                self.metadata = []
+                self.reset()
         else:
             print("⚠️ FAISS files not found. Starting with empty index.")
-            self.index = None
-            self.metadata = []
+            self.reset()
+
+    def _load_metadata(self) -> MetadataStore:
+        if os.path.exists(self.metadata_path):
+            return MetadataStore(self.metadata_path)
+
+        legacy_path = os.path.splitext(self.metadata_path)[0] + ".pkl"
+        if os.path.exists(legacy_path):
+            raise FileNotFoundError(f"{self.metadata_path} not found; {legacy_path} is from an older version, "
+                                    f"convert it with `python migrate_metadata.py`")
+        raise FileNotFoundError(f"{self.metadata_path} not found")
+
+    def _map_index(self):
+        index, self._mapped = read_index(self.index_path)
+        self.index = self._ensure_id_map(index)
+        if self.index is not index:
+            self._mapped = False
+
+    def _load_vectors(self):
+        self._vectors = None
+        if self.quantization == "none":
+            return
+        if os.path.exists(self.vectors_path):
+            self._vectors = FloatVectorStore(self.vectors_path)
+        else:
+            print(f"⚠️ {self.vectors_path} not found; searching {self.quantization} codes without re-ranking")
+
+    def _ensure_writable(self):
+        """Swap a mapped (read-only) index for a private copy before modifying it."""
+        if self._mapped:
+            self.index = faiss.read_index(self.index_path)
+            self._mapped = False
+
+    @staticmethod
+    def _ensure_id_map(index):
+        """Older indexes are a bare IndexFlatL2 where FAISS id == row; wrap them."""
+        if isinstance(index, (faiss.IndexIDMap2, faiss.IndexIVF)):
+            return index
+        vectors = index.reconstruct_n(0, index.ntotal)
+        wrapped = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+        wrapped.add_with_ids(vectors, np.arange(index.ntotal, dtype="int64"))
+        return wrapped
 
+    def _load_info(self) -> dict:
+        if not os.path.exists(self.info_path):
+            return {}
+        with open(self.info_path) as f:
+            return json.load(f)
+
+    def _check_embedding_model(self):
+        """Vectors from different embedding models are not comparable."""
+        provider = get_embedding_provider().name
+        if self.index is not None and self.embedding_model != provider:
+            raise EmbeddingModelMismatch(
+                f"Index was built with '{self.embedding_model}' but EMBEDDING_PROVIDER is '{provider}'. "
+                f"Rebuild it with: python regenerate_vectors.py"
+            )
+
+    # =============================
+    # Snapshot
+    # =============================
     def _save_index(self):
-        if self.index is None:
+        """Write a full snapshot covering every change so far and empty the log."""
+        with self._lock:
+            if self.index is None:
+                return
+            # A rebuild changes state without a log record; give it its own seq
+            self._seq += 1
+            self._write_snapshot(*self._capture_snapshot())
+            self._truncate_log(self._seq)
+            # Drop the in-memory copies of the rebuild in favour of the mapped files
+            self.metadata = MetadataStore(self.metadata_path)
+            self._map_index()
+            self._load_vectors()
+
+    def _capture_snapshot(self) -> tuple:
+        """In-memory copy of the current state; the caller holds the lock."""
+        info = {
+            "embedding_model": self.embedding_model,
+            "dim": self.index.d,
+            "index_type": self.index_type,
+            "quantization": self.quantization,
+            "projection": self.projection.info(),
+            "log_seq": self._seq
+        }
+        vectors = self._vectors.snapshot() if self._vectors is not None else None
+        return faiss.serialize_index(self.index), self.metadata.snapshot(), vectors, self.projection, info
+
+    def _write_snapshot(self, index_bytes: np.ndarray, metadata: MetadataStore,
+                        vectors: Optional[FloatVectorStore], projection: Projection, info: dict):
+        with self._write_lock:
+            # A slow compaction must not overwrite a newer snapshot
+            if info["log_seq"] <= self._snapshot_seq:
+                return
+            self._replace_files(index_bytes, metadata.to_bytes(), vectors, projection, info)
+            self._snapshot_seq = info["log_seq"]
+
+    def _replace_files(self, index_bytes: np.ndarray, metadata_bytes: bytes,
+                       vectors: Optional[FloatVectorStore], projection: Projection, info: dict):
+        # Each file is replaced atomically and info (holding log_seq) goes last.
+        # A crash in between leaves a newer index with an older log_seq; the
+        # replay then re-applies changes by product id, which is idempotent.
+        index_bytes.tofile(self.index_path + ".tmp")
+        os.replace(self.index_path + ".tmp", self.index_path)
+        with open(self.metadata_path + ".tmp", "wb") as f:
+            f.write(metadata_bytes)
+        os.replace(self.metadata_path + ".tmp", self.metadata_path)
+        if vectors is not None:
+            vectors.save(self.vectors_path + ".tmp")
+            os.replace(self.vectors_path + ".tmp", self.vectors_path)
+        elif os.path.exists(self.vectors_path):
+            os.remove(self.vectors_path)
+        if projection.method != "none":
+            projection.save(self.projection_path + ".tmp")
+            os.replace(self.projection_path + ".tmp", self.projection_path)
+        elif os.path.exists(self.projection_path):
+            os.remove(self.projection_path)
+        with open(self.info_path + ".tmp", "w") as f:
+            json.dump(info, f)
+        os.replace(self.info_path + ".tmp", self.info_path)
+
+    # =============================
+    # Change log
+    # =============================
+    def _append_log(self, record: dict):
+        """Append one change; the caller holds the lock and has already applied it."""
+        self._seq += 1
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps({"seq": self._seq, **record}) + "\n")
+            f.flush()
+            if VECTOR_LOG_FSYNC:
+                os.fsync(f.fileno())
+
+        if os.path.getsize(self.log_path) >= VECTOR_LOG_COMPACT_BYTES:
+            self.compact_async()
+
+    def _read_log(self) -> List[Tuple[dict, bytes]]:
+        """
+        (record, line) for each complete log record. A line without its
+        newline or that does not parse is the torn tail of an append cut
+        short by a crash: the file is cut back to the last complete record,
+        so the next append starts on a line of its own.
+        """
+        if not os.path.exists(self.log_path):
+            return []
+
+        records, intact = [], 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    record = None
+                if not isinstance(record, dict) or "seq" not in record:
+                    break
+                records.append((record, line))
+                intact += len(line)
+
+        size = os.path.getsize(self.log_path)
+        if intact < size:
+            print(f"⚠️ Dropping {size - intact} bytes of torn vector log record(s) after seq "
+                  f"{records[-1][0]['seq'] if records else 0}")
+            with open(self.log_path, "r+b") as f:
+                f.truncate(intact)
+        return records
+
+    def _replay_log(self) -> int:
+        replayed = 0
+        for record, _ in self._read_log():
+            if record["seq"] <= self._seq:
+                continue
+
+            if record["op"] == "upsert":
+                vectors = np.frombuffer(base64.b64decode(record["vectors"]), dtype="float32")
+                self._add_batch(record["docs"], vectors.reshape(len(record["docs"]), -1), record["start"])
+            elif record["op"] == "delete":
+                self._remove_rows([pid for pid in record["product_ids"] if pid in self._row_by_product_id])
+            elif record["op"] == "update":
+                row = self._row_by_product_id.get(record["product_id"])
+                if row is not None:
+                    self._set_row(row, {**self.metadata[row], **record["fields"]})
+
+            self._seq = record["seq"]
+            replayed += 1
+        return replayed
+
+    def _truncate_log(self, seq: int):
+        """Drop log records up to seq (now in the snapshot), keeping any newer ones."""
+        if not os.path.exists(self.log_path):
             return
-        faiss.write_index(self.index, self.index_path)
-        with open(self.metadata_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+        newer = [line for record, line in self._read_log() if record["seq"] > seq]
+        with open(self.log_path + ".tmp", "wb") as f:
+            f.writelines(newer)
+        os.replace(self.log_path + ".tmp", self.log_path)
+
+    def compact(self):
+        """
+        Fold the change log into a new base snapshot. The state is copied
+        under the lock; writing the files happens outside it, so upserts
+        keep flowing (to the log) while a large snapshot is written.
+        """
+        with self._lock:
+            if self.index is None or not os.path.exists(self.log_path):
+                return
+            snapshot = self._capture_snapshot()
+            seq = self._seq
+
+        self._write_snapshot(*snapshot)
+
+        with self._lock:
+            self._truncate_log(seq)
+            if self._seq == seq:
+                # Nothing changed while writing: map the new files, drop the overlay
+                self.metadata = MetadataStore(self.metadata_path)
+                self._map_index()
+                self._load_vectors()
+
+    def compact_async(self):
+        """Run compact() on a background thread unless one is already running."""
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"⚠️ Vector log compaction failed: {e}")
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name="vector-log-compaction", daemon=True).start()
+
+    def memory_stats(self) -> dict:
+        """Resident vs mapped bytes of the index and metadata files in this process."""
+        index_file = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        vectors = self.index.ntotal if self.index is not None else 0
+        stats = {
+            "index_mode": "mmap" if self._mapped else "memory",
+            "index_file_bytes": index_file,
+            "quantization": self.quantization,
+            "projection": self.projection.info(),
+            "index_bytes_per_vector": index_file / vectors if vectors else 0.0,
+            "index": mapped_file_usage(self.index_path),
+            "metadata": mapped_file_usage(self.metadata_path),
+            "metadata_overlay_rows": self.metadata.stats()["overlay_rows"]
+        }
+        if self._vectors is not None:
+            # Only re-ranked candidates are paged in, so resident stays far below the file size
+            stats["rerank_vectors"] = mapped_file_usage(self.vectors_path)
+        return stats
+
+    def log_stats(self) -> dict:
+        return {
+            "log_bytes": os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0,
+            "seq": self._seq,
+            "compacting": self._compacting
+        }
+
+    # =============================
+    # Product-id, filter and BM25 indexes
+    # =============================
+    def _rebuild_id_index(self):
+        self._row_by_product_id = {}
+        for row, product_id in self.metadata.iter_column("product_id"):
+            if product_id:
+                self._row_by_product_id[normalize_product_id(product_id)] = row
+        self._filters = ProductFilterIndex.from_metadata(self.metadata)
+        self._lexical = LexicalIndex.from_metadata(self.metadata)
+        self._dead_vectors = self.index.ntotal - len(self._row_by_product_id) if self.index is not None else 0
+
+    def _set_row(self, row: int, doc: Optional[dict]):
+        self.metadata[row] = doc
+        self._filters.set_row(row, doc)
+        self._lexical.set_row(row, doc)
 
-    def add_documents(self, documents: List[dict]):
-        texts = [doc["text"] for doc in documents]
-        embeddings = generate_embeddings(texts)
+    def get(self, product_id) -> Optional[dict]:
+        row = self._row_by_product_id.get(normalize_product_id(product_id))
+        return self.metadata[row] if row is not None else None
 
+    def get_many(self, product_ids, filters: dict = None) -> List[dict]:
+        """Products by id in the given order; filters work as in search()."""
+        filters = normalize_filters(filters)
+        results = []
+        with self._lock:
+            mask = self._filters.mask(filters) if filters else None
+            for product_id in dict.fromkeys(normalize_product_id(pid) for pid in product_ids):
+                row = self._row_by_product_id.get(product_id)
+                if row is not None and (mask is None or mask[row]):
+                    results.append(self.metadata[row])
+        return results
+
+    def get_by_faiss_id(self, faiss_id: int) -> Optional[dict]:
+        if 0 <= faiss_id < len(self.metadata):
+            return self.metadata[faiss_id]
+        return None
+
+    def count(self) -> int:
+        return self.index.ntotal - self._dead_vectors if self.index is not None else 0
+
+    # =============================
+    # Change notifications
+    # =============================
+    def subscribe(self, callback):
+        """Register callback(product_ids) to run whenever catalog entries change."""
+        self._listeners.append(callback)
+
+    def _notify(self, product_ids: List[str]):
+        for callback in self._listeners:
+            try:
+                callback(product_ids)
+            except Exception as e:
+                print(f"⚠️ Catalog change listener failed: {e}")
+
+    # =============================
+    # Writes
+    # =============================
+    def upsert_documents(self, documents: Iterable[dict], batch_size: int = None):
+        """
+        Embed and index documents batch by batch, keyed by product_id: a
+        document whose product_id is already indexed replaces the old row.
+        documents may be a generator, so large catalogs are never fully
+        materialized as vectors.
+
+        Against an existing index each batch is appended to the change log,
+        so editing one product writes kilobytes. The first build (or a build
+        after reset) writes a full snapshot instead.
+        """
+        self._check_embedding_model()
+        product_ids = []
+        pending = []  # batches buffered until an index that needs training can be built
+        built = False
+
+        for batch, embeddings in iter_embedding_batches(documents, batch_size, text_of=lambda doc: doc["text"]):
+            with self._lock:
+                if self.index is None:
+                    pending.append((batch, embeddings))
+                    needed = max(training_size(self.index_type, self.quantization),
+                                 projection_training_size(self.dim_reduction, self.reduced_dim))
+                    if sum(len(b) for b, _ in pending) < needed:
+                        continue
+                    product_ids.extend(self._build_from_pending(pending))
+                    pending = []
+                    built = True
+                    continue
+
+                start = len(self.metadata)
+                # The log holds projected vectors, so replay adds them as they are
+                embeddings = self.projection.apply(embeddings)
+                product_ids.extend(self._add_batch(batch, embeddings))
+                if not built:
+                    self._append_log({
+                        "op": "upsert",
+                        "start": start,
+                        "docs": batch,
+                        "vectors": base64.b64encode(np.ascontiguousarray(embeddings, dtype="float32")).decode()
+                    })
+
+        if pending:
+            with self._lock:
+                product_ids.extend(self._build_from_pending(pending))
+                built = True
+
+        if built:
+            self._save_index()
+        self._notify(product_ids)
+
+    # Indexing used to mean a full rewrite; it is now an upsert
+    add_documents = upsert_documents
+
+    def _build_from_pending(self, pending: list) -> List[str]:
+        vectors = np.vstack([embeddings for _, embeddings in pending])
+        self.projection = Projection.fit(self.dim_reduction, vectors, self.reduced_dim,
+                                         get_embedding_provider().matryoshka)
+        vectors = self.projection.apply(vectors)
+        train_vectors = vectors if requires_training(self.index_type, self.quantization) else None
+        self.index = create_index(self.index_type, vectors.shape[1], train_vectors, self.quantization)
+        self._mapped = False
+        self._vectors = FloatVectorStore() if self.quantization != "none" else None
+        self.embedding_model = get_embedding_provider().name
+
+        product_ids = []
+        start = 0
+        for batch, _ in pending:
+            product_ids.extend(self._add_batch(batch, vectors[start:start + len(batch)]))
+            start += len(batch)
+        return product_ids
+
+    def _add_batch(self, batch: List[dict], embeddings: np.ndarray, start: int = None) -> List[str]:
+        self._ensure_writable()
+        batch_ids = [normalize_product_id(doc["product_id"]) for doc in batch if doc.get("product_id")]
+        self._remove_rows([pid for pid in batch_ids if pid in self._row_by_product_id])
+
+        if start is None:
+            start = len(self.metadata)
+        # Replayed batches carry their original rows
+        self.index.add_with_ids(embeddings, np.arange(start, start + len(batch), dtype="int64"))
+        if self._vectors is not None:
+            self._vectors.add(start, embeddings)
+        for row, doc in enumerate(batch, start):
+            self._set_row(row, doc)
+            if doc.get("product_id"):
+                self._row_by_product_id[normalize_product_id(doc["product_id"])] = row
+        return batch_ids
+
+    def update_metadata(self, product_id, fields: dict) -> bool:
+        """Change non-embedded fields (price, stock, ...) in place; the vector is untouched."""
+        product_id = normalize_product_id(product_id)
+        with self._lock:
+            row = self._row_by_product_id.get(product_id)
+            if row is None:
+                return False
+
+            self._set_row(row, {**self.metadata[row], **fields})
+            self._append_log({"op": "update", "product_id": product_id, "fields": fields})
+
+        self._notify([product_id])
+        return True
+
+    def delete_documents(self, product_ids) -> int:
+        product_ids = [normalize_product_id(pid) for pid in product_ids]
+        with self._lock:
+            existing = [pid for pid in product_ids if pid in self._row_by_product_id]
+            removed = self._remove_rows(existing)
+            if removed:
+                self._append_log({"op": "delete", "product_ids": existing})
+
+        if removed:
+            self._notify(product_ids)
+        return removed
+
+    def _remove_rows(self, product_ids: List[str]) -> int:
+        rows = [self._row_by_product_id.pop(pid) for pid in product_ids]
+        if rows:
+            if supports_remove(self.index):
+                self._ensure_writable()
+                self.index.remove_ids(np.array(rows, dtype="int64"))
+            else:
+                # HNSW can't drop graph nodes; the tombstone hides the vector until a rebuild
+                self._dead_vectors += len(rows)
+            for row in rows:
+                self._set_row(row, None)
+        return len(rows)
+
+    def reset(self):
+        with self._lock:
+            removed = list(self._row_by_product_id)
+            self.index = None
+            self._mapped = False
+            self._vectors = None
+            self.index_type, self.quantization, self.dim_reduction, self.reduced_dim = self._configured
+            self.projection = Projection()
+            self.metadata = MetadataStore()
+            self.embedding_model = None
+            self._row_by_product_id = {}
+            self._filters = ProductFilterIndex()
+            self._lexical = LexicalIndex()
+            self._dead_vectors = 0
+
+        if removed:
+            self._notify(removed)
+
+    # =============================
+    # Search
+    # =============================
+    def search(self, query: str, top_k: int = 5, nprobe: int = None, ef_search: int = None,
+               filters: dict = None, mode: str = SEARCH_MODE, adaptive: bool = False) -> List[dict]:
+        """
+        Returns up to top_k {"product", "similarity_score", "lexical_score"}
+        dicts, best first. similarity_score is the cosine similarity to the
+        query (None when the query was not embedded), lexical_score the BM25
+        score (None when the product matched on meaning only).
+
+        nprobe (IVF) and ef_search (HNSW) trade recall for latency per
+        query; None uses the index defaults (IVF_NPROBE / HNSW_EF_SEARCH).
+
+        filters ({"category", "min_price", "max_price", "in_stock"}) are
+        applied inside the ANN search, so top_k is filled with matching
+        products only.
+
+        mode "hybrid" fuses BM25 and vector rankings (RRF) and answers
+        queries that name one product from BM25 alone, without embedding
+        the query; "vector" and "lexical" use a single ranking.
+
+        adaptive drops weak matches (select_relevant), so fewer than top_k
+        products may come back.
+        """
+        return self.search_many([query], top_k, nprobe, ef_search, filters, mode, adaptive)[0]
+
+    async def search_async(self, query: str, top_k: int = 5, nprobe: int = None, ef_search: int = None,
+                           filters: dict = None, mode: str = SEARCH_MODE, adaptive: bool = False) -> List[dict]:
+        results = await self.search_many_async([query], top_k, nprobe, ef_search, filters, mode, adaptive)
+        return results[0]
+
+    def search_many(self, queries: List[str], top_k: int = 5, nprobe: int = None, ef_search: int = None,
+                    filters: dict = None, mode: str = SEARCH_MODE, adaptive: bool = False) -> List[List[dict]]:
+        """
+        One result list per query, as search() would return. Queries that
+        need a vector lookup are embedded in one batch and searched with a
+        single multi-row FAISS search.
+        """
         if self.index is None:
-            dim = embeddings.shape[1]
-            self.index = faiss.IndexFlatL2(dim)
+            return [[] for _ in queries]
 
-        self.index.add(embeddings)
-        self.metadata.extend(documents)
-        self._save_index()
+        self._check_embedding_model()
+        filters = normalize_filters(filters)
+        results, lexical_ranked = self._lexical_stages(queries, top_k, filters, mode)
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            query_embeddings = self.projection.apply(embed_queries([queries[i] for i in pending]))
+            self._fill_vector_results(results, pending, query_embeddings, top_k, nprobe, ef_search,
+                                      filters, lexical_ranked)
+        return [select_relevant(result, filtered=bool(filters)) if adaptive else result for result in results]
 
-    def search(self, query: str, top_k: int = 5) -> List[dict]:
+    async def search_many_async(self, queries: List[str], top_k: int = 5, nprobe: int = None,
+                                ef_search: int = None, filters: dict = None, mode: str = SEARCH_MODE,
+                                adaptive: bool = False) -> List[List[dict]]:
         if self.index is None:
-            return []
+            return [[] for _ in queries]
 
-        query_embedding = generate_embeddings([query])
-        distances, indices = self.index.search(query_embedding, top_k)
+        self._check_embedding_model()
+        filters = normalize_filters(filters)
+        results, lexical_ranked = self._lexical_stages(queries, top_k, filters, mode)
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            query_embeddings = self.projection.apply(await embed_queries_async([queries[i] for i in pending]))
+            self._fill_vector_results(results, pending, query_embeddings, top_k, nprobe, ef_search,
+                                      filters, lexical_ranked)
+        return [select_relevant(result, filtered=bool(filters)) if adaptive else result for result in results]
 
+    def _scored_results(self, rows: List[int], similarity: dict, lexical: dict) -> List[dict]:
         results = []
-        for idx in indices[0]:
-            if idx < len(self.metadata):
-                results.append(self.metadata[idx])
-
+        for row in rows:
+            doc = self.get_by_faiss_id(row)
+            if doc is not None:
+                results.append({
+                    "product": doc,
+                    "similarity_score": similarity.get(row),
+                    "lexical_score": lexical.get(row)
+                })
         return results
 
+    def _lexical_stages(self, queries: List[str], top_k: int, filters: dict, mode: str):
+        """
+        BM25 ranking per query. Returns (results, ranked): results[i] is set
+        when query i is finished without a vector lookup.
+        """
+        results = [None] * len(queries)
+        ranked = [[] for _ in queries]
+        if mode == "vector":
+            return results, ranked
+
+        with self._lock:
+            mask = self._filters.mask(filters) if filters else None
+            for i, query in enumerate(queries):
+                ranked[i] = self._lexical.search(query, 2 * top_k, mask)
+
+                if mode == "lexical" or self._lexical.is_exact_match(query, ranked[i]):
+                    SEARCH_PATH_COUNTS["lexical"] += 1
+                    hits = ranked[i][:top_k]
+                    results[i] = self._scored_results([row for row, _ in hits], {}, dict(hits))
+                    ranked[i] = []
+
+        return results, ranked
+
+    def _fill_vector_results(self, results: list, pending: List[int], query_embeddings: np.ndarray, top_k: int,
+                             nprobe: int, ef_search: int, filters: dict, lexical_ranked: List[list]):
+        """Vector (or fused) results for results[pending[j]], embedded as query_embeddings[j]."""
+        # Fusion needs a deeper vector ranking than the final top_k
+        fused = any(lexical_ranked[i] for i in pending)
+        vector_ranked = self._vector_rows(query_embeddings, 2 * top_k if fused else top_k,
+                                          nprobe, ef_search, filters)
+
+        rows, similarity, missing = [], [], []
+        for i, ranked in zip(pending, vector_ranked):
+            similarity.append(dict(ranked))
+            if not lexical_ranked[i]:
+                SEARCH_PATH_COUNTS["vector"] += 1
+                rows.append([row for row, _ in ranked][:top_k])
+            else:
+                SEARCH_PATH_COUNTS["hybrid"] += 1
+                rows.append([row for row, _ in rrf_fuse([[row for row, _ in ranked],
+                                                          [row for row, _ in lexical_ranked[i]]])])
+            missing.append([row for row in rows[-1] if row not in similarity[-1]])
+
+        # Keyword-only hits still get a similarity, so every result can be scored alike
+        for scores, extra in zip(similarity, self._similarities(query_embeddings, missing)):
+            scores.update(extra)
+
+        with self._lock:
+            for j, i in enumerate(pending):
+                results[i] = self._scored_results(rows[j], similarity[j], dict(lexical_ranked[i]))[:top_k]
+
+    def _vector_rows(self, query_embeddings: np.ndarray, top_k: int, nprobe: int = None,
+                     ef_search: int = None, filters: dict = None) -> List[List[Tuple[int, float]]]:
+        """(row, cosine similarity) best first, per query row."""
+        # FAISS indexes are not safe to search while another thread adds to them
+        with self._lock:
+            selector = None
+            if filters:
+                mask = self._filters.mask(filters)
+                if not mask.any():
+                    return [[] for _ in query_embeddings]
+                # Tombstoned rows are never selected, so no over-fetch is needed
+                selector = id_selector(mask)
+                limit = int(mask.sum())
+                fetch_k = min(top_k, limit)
+            else:
+                # Over-fetch past tombstoned vectors that are still in the graph
+                limit = None
+                fetch_k = top_k + min(self._dead_vectors, top_k)
+
+            if self._vectors is not None:
+                # Compressed distances only shortlist; re-ranking picks the final top_k
+                fetch_k *= RERANK_FACTOR
+                if limit is not None:
+                    fetch_k = min(fetch_k, limit)
+
+            params = search_params(self.index, nprobe, ef_search, selector)
+            distances, indices = self.index.search(query_embeddings, fetch_k, params=params)
+
+            ranked = []
+            for query, row_distances, row_indices in zip(query_embeddings, distances, indices):
+                rows = [
+                    int(faiss_id) for faiss_id in row_indices
+                    if self.get_by_faiss_id(int(faiss_id)) is not None
+                ]
+                if self._vectors is not None:
+                    row_distances = self._float_distances(query, rows)
+                    order = np.argsort(row_distances, kind="stable")
+                    rows = [rows[i] for i in order]
+                    row_distances = row_distances[order]
+                else:
+                    row_distances = [
+                        distance for distance, faiss_id in zip(row_distances, row_indices)
+                        if self.get_by_faiss_id(int(faiss_id)) is not None
+                    ]
+                ranked.append([
+                    (row, l2_to_similarity(distance)) for row, distance in zip(rows, row_distances)
+                ][:top_k])
+
+        return ranked
+
+    def _float_distances(self, query: np.ndarray, rows: List[int]) -> np.ndarray:
+        """Exact squared L2 distances from the float32 copies of the rows."""
+        if not rows:
+            return np.zeros(0, dtype="float32")
+        diff = self._vectors.get(rows) - query
+        return np.einsum("ij,ij->i", diff, diff)
+
+    def _similarities(self, query_embeddings: np.ndarray, rows: List[List[int]]) -> List[dict]:
+        """
+        Exact similarity of each query to its own rows, via one search
+        restricted to the union of those rows.
+        """
+        wanted = sorted({row for query_rows in rows for row in query_rows})
+        if not wanted:
+            return [{} for _ in rows]
+
+        with self._lock:
+            if self._vectors is not None:
+                return [
+                    dict(zip(query_rows, map(l2_to_similarity, self._float_distances(query, query_rows))))
+                    for query, query_rows in zip(query_embeddings, rows)
+                ]
+
+            mask = np.zeros(len(self.metadata), dtype=bool)
+            mask[wanted] = True
+            kind = index_kind(self.index)
+            params = search_params(
+                self.index,
+                nprobe=base_index(self.index).nlist if kind == "ivf" else None,
+                ef_search=max(base_index(self.index).hnsw.efSearch, 2 * len(wanted)) if kind == "hnsw" else None,
+                selector=id_selector(mask)
+            )
+            distances, indices = self.index.search(query_embeddings, len(wanted), params=params)
+
+        similarities = []
+        for query_rows, row_distances, row_indices in zip(rows, distances, indices):
+            keep = set(query_rows)
+            similarities.append({
+                int(faiss_id): l2_to_similarity(distance)
+                for distance, faiss_id in zip(row_distances, row_indices) if int(faiss_id) in keep
+            })
+        return similarities
+
 
 # =============================
 # GLOBAL INSTANCE (SAFE)
 # =============================
 VECTOR_DB = VectorDB(
     index_path="database/vector.index",
-    metadata_path="database/metadata.pkl"
+    metadata_path="database/metadata.bin"
 )
 
 
+# =============================
+# PREFORK LOAD
+# =============================
+def preload_vector_db():
+    """
+    Call in the parent process before workers fork (gunicorn.conf.py).
+    VECTOR_DB is loaded on import; this also reads the mapped files once
+    so their pages are in the page cache and every worker shares them.
+    No search runs here: FAISS's OpenMP threads do not survive a fork.
+    """
+    for path in (VECTOR_DB.index_path, VECTOR_DB.metadata_path):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                while f.read(16 * 1024 * 1024):
+                    pass
+
+    stats = VECTOR_DB.memory_stats()
+    print(f"✅ Vector DB preloaded ({VECTOR_DB.count()} products, index {stats['index_mode']}, "
+          f"{stats['index_file_bytes'] / 1e6:.1f}MB)")
+
+
+# =============================
+# CATALOG INDEXING
+# =============================
+PRODUCTS_PATH = "data/products.json"
+
+
+def build_product_text(product: dict) -> str:
+    specs = ", ".join(f"{k}: {v}" for k, v in (product.get("specs") or {}).items())
+    features = ", ".join(product.get("features") or [])
+    return (
+        f"{product['name']}. Category: {product.get('category')}. "
+        f"{product.get('description', '')} Specs: {specs}. Features: {features}"
+    )
+
+
+def iter_product_documents(path: str = PRODUCTS_PATH) -> Iterator[dict]:
+    with open(path) as f:
+        products = json.load(f)
+    for product in products:
+        yield {**product, "text": build_product_text(product)}
+
+
+def init_vector_db(path: str = PRODUCTS_PATH):
+    """Rebuild the vector index from the product catalog."""
+    VECTOR_DB.reset()
+    VECTOR_DB.add_documents(iter_product_documents(path))
+    print(f"✅ Indexed {VECTOR_DB.count()} products")
+
+
 # =============================
 # API COMPATIBILITY
 # =============================
-def search_products(query: str, top_k: int = 5) -> List[dict]:
-    return VECTOR_DB.search(query, top_k)
+def search_products(query: str, top_k: int = 5, filters: dict = None, adaptive: bool = False) -> List[dict]:
+    return VECTOR_DB.search(query, top_k, filters=filters, adaptive=adaptive)
+
+
+async def search_products_async(query: str, top_k: int = 5, filters: dict = None,
+                                adaptive: bool = False) -> List[dict]:
+    return await VECTOR_DB.search_async(query, top_k, filters=filters, adaptive=adaptive)
+
+
+def search_products_many(queries: List[str], top_k: int = 5, filters: dict = None,
+                         adaptive: bool = False) -> List[List[dict]]:
+    return VECTOR_DB.search_many(queries, top_k, filters=filters, adaptive=adaptive)
+
+
+async def search_products_many_async(queries: List[str], top_k: int = 5, filters: dict = None,
+                                     adaptive: bool = False) -> List[List[dict]]:
+    return await VECTOR_DB.search_many_async(queries, top_k, filters=filters, adaptive=adaptive)
 
 
-def search_products_by_ids(product_ids: List[int], query: str = "") -> List[dict]:
-    return [
-        item for item in VECTOR_DB.metadata
-        if item.get("product_id") in product_ids
-    ]
+def search_products_by_ids(product_ids: List[str], query: str = "", filters: dict = None) -> List[dict]:
+    return VECTOR_DB.get_many(product_ids, filters=filters)
 
 
-def get_product_by_id(product_id: int) -> Optional[dict]:
-    for item in VECTOR_DB.metadata:
-        if item.get("product_id") == product_id:
-            return item
-    return None
+def get_product_by_id(product_id: str) -> Optional[dict]:
+    return VECTOR_DB.get(product_id)
@@ -40,6 +40,75 @@ const API = {
         }
     },
 
+    /**
+     * Send a chat message and receive the answer as it is generated (SSE)
+     * @param {string} query - User's message
+     * @param {string} sessionId - Current session ID
+     * @param {string} userEmail - User's email
+     * @param {Object} handlers - onMeta(meta), onToken(text), onDone(data)
+     * @returns {Promise<Object>} Final response (same shape as sendMessage)
+     */
+    async streamMessage(query, sessionId, userEmail = 'john@example.com', handlers = {}) {
+        const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+            body: JSON.stringify({
+                query: query,
+                session_id: sessionId,
+                user_email: userEmail
+            })
+        });
+
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.detail || 'Failed to send message');
+        }
+
+        // EventSource only supports GET, so the stream is parsed by hand
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                const payload = data ? JSON.parse(data) : {};
+
+                if (event === 'meta' && handlers.onMeta) handlers.onMeta(payload);
+                else if (event === 'token' && handlers.onToken) handlers.onToken(payload.text);
+                else if (event === 'done') {
+                    result = payload;
+                    if (handlers.onDone) handlers.onDone(payload);
+                } else if (event === 'error') {
+                    throw new Error(payload.detail || 'Streaming failed');
+                }
+            }
+        }
+
+        if (!result) {
+            throw new Error('Stream ended before the response was complete');
+        }
+        return result;
+    },
+
     /**
      * Get conversation history
      * @param {string} sessionId - Session ID
@@ -118,25 +118,41 @@ class ChatApp {
         UI.disableInput();
         UI.showTyping();
 
+        let stream = null;
+
         try {
-            console.log('⏳ Waiting for API response...');
-            
-            // Send message to backend
-            const response = await API.sendMessage(query, this.sessionId, this.userEmail);
+            console.log('⏳ Streaming API response...');
+            const sentAt = performance.now();
+
+            // Render tokens as they arrive; the typing indicator stays until the first one
+            const response = await API.streamMessage(query, this.sessionId, this.userEmail, {
+                onToken: (text) => {
+                    if (!stream) {
+                        stream = UI.startStreamingMessage();
+                        console.log(`⚡ First token after ${Math.round(performance.now() - sentAt)} ms`);
+                    }
+                    UI.appendToStreamingMessage(stream, text);
+                }
+            });
 
             console.log('✅ Got API response');
 
-            // Remove typing indicator
-            UI.hideTyping();
-
-            // Add assistant response
-            UI.addMessage('assistant', response.response);
+            if (stream) {
+                UI.finishStreamingMessage(stream, response.response);
+            } else {
+                UI.hideTyping();
+                UI.addMessage('assistant', response.response);
+            }
 
             console.log('Response metadata:', response.metadata);
 
         } catch (error) {
             console.error('❌ API Error:', error);
             UI.hideTyping();
+            if (stream) {
+                // Keep what was already shown
+                UI.finishStreamingMessage(stream);
+            }
             UI.showToast('Failed to send message. Please try again.', 'error');
 
             // Add error message to chat
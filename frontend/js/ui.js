@@ -71,6 +71,38 @@ showWelcome() {
 
         this.elements.messages.appendChild(messageEl)
         this.scrollToBottom()
+        return messageEl
+    },
+
+    startStreamingMessage() {
+        // Replaces the typing indicator once the first token arrives
+        this.hideTyping()
+        const messageEl = this.addMessage('assistant', '')
+        messageEl.classList.add('streaming')
+        return { el: messageEl, text: '', frame: null }
+    },
+
+    appendToStreamingMessage(stream, text) {
+        stream.text += text
+
+        // Re-render the markdown at most once per frame, however fast tokens arrive
+        if (stream.frame) return
+        stream.frame = requestAnimationFrame(() => {
+            stream.frame = null
+            stream.el.querySelector('.message-bubble').innerHTML = marked.parse(stream.text)
+            this.scrollToBottom()
+        })
+    },
+
+    finishStreamingMessage(stream, finalText = null) {
+        if (stream.frame) {
+            cancelAnimationFrame(stream.frame)
+            stream.frame = null
+        }
+        if (finalText !== null) stream.text = finalText
+        stream.el.querySelector('.message-bubble').innerHTML = marked.parse(stream.text)
+        stream.el.classList.remove('streaming')
+        this.scrollToBottom()
     },
 
     showTyping() {
@@ -0,0 +1,16 @@
+# Multi-worker deployment:
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# The app (and the vector index) is loaded once in the parent, then workers
+# fork and share the memory-mapped index pages instead of each loading a copy.
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+
+def on_starting(server):
+    from database.vector_db import preload_vector_db
+    preload_vector_db()
@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from api.routes import router
+from services.llm_clients import close_llm_clients
 import os
 
 app = FastAPI(
@@ -20,6 +21,11 @@ app.add_middleware(
 app.include_router(router, prefix="/api/v1")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    await close_llm_clients()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
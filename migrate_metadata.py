@@ -0,0 +1,40 @@
+import argparse
+import os
+import pickle
+
+from database.metadata_store import MetadataStore
+
+
+def migrate(legacy_path: str, metadata_path: str) -> int:
+    """Convert a pickled metadata list (indexes saved before metadata.bin) to the columnar store."""
+    # Unpickling runs code from the file: only migrate files this deployment wrote itself
+    with open(legacy_path, "rb") as f:
+        rows = pickle.load(f)
+
+    store = MetadataStore()
+    store.extend(rows)
+    with open(metadata_path + ".tmp", "wb") as f:
+        f.write(store.to_bytes())
+    os.replace(metadata_path + ".tmp", metadata_path)
+    return len(store)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="One-off conversion of metadata.pkl to metadata.bin")
+    parser.add_argument("--legacy", default="database/metadata.pkl", help="Pickled metadata to convert")
+    parser.add_argument("--output", default="database/metadata.bin", help="Columnar metadata file to write")
+    parser.add_argument("--force", action="store_true", help="Overwrite an existing output file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.legacy):
+        raise SystemExit(f"{args.legacy} not found; nothing to migrate")
+    if os.path.exists(args.output) and not args.force:
+        raise SystemExit(f"{args.output} already exists; pass --force to overwrite it")
+
+    print("=" * 70)
+    print("MIGRATING VECTOR METADATA")
+    print("=" * 70)
+
+    rows = migrate(args.legacy, args.output)
+    print(f"\n📦 Migrated {rows} rows from {args.legacy} to {args.output}")
+    print(f"   {args.legacy} is no longer read and can be deleted")
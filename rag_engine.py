@@ -63,14 +63,14 @@ def call_ollama(system_prompt: str, user_message: str) -> str:
 
 def call_gemini(system_prompt: str, user_message: str) -> str:
     """Google Gemini fallback"""
-    from google import genai
     from google.genai import types
+    from services.llm_clients import get_gemini_client
 
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         return "Gemini API key not configured."
 
-    client = genai.Client(api_key=api_key)
+    client = get_gemini_client()
 
     full_prompt = f"{system_prompt}\n\n{user_message}"
 
@@ -1,19 +1,298 @@
+import asyncio
 import os
-import google.generativeai as genai
+import re
+from collections import Counter
 from dotenv import load_dotenv
+from google.genai import types
+from services.intent_model import get_intent_model
+from services.llm_clients import count_llm_call, get_gemini_client
+from utils.cache import create_cache
+from utils.helpers import normalize_query
 
 load_dotenv()
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Overrides the confidence threshold calibrated into the model artifact when set
+INTENT_MODEL_THRESHOLD = float(os.getenv("INTENT_MODEL_THRESHOLD")) if os.getenv("INTENT_MODEL_THRESHOLD") else None
 
+# Caches LLM decisions only; rules and the model are cheaper than a lookup miss
+INTENT_CACHE = create_cache(
+    namespace="intent",
+    max_size=int(os.getenv("INTENT_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("INTENT_CACHE_TTL", "3600"))
+)
 
-def classify_intent(query: str) -> dict:
+# In-flight LLM calls by cache key, so concurrent identical queries share one call
+_pending_llm_calls = {}
+
+GENERATION_CONFIG = types.GenerateContentConfig(
+    temperature=0,
+    max_output_tokens=200
+)
+
+
+# =============================
+# Rule-based fast path
+# =============================
+TRACKING_NUMBER_PATTERNS = [
+    re.compile(r"\b(TRACK\d{6,})\b", re.IGNORECASE),
+    re.compile(r"\b(TRK\d{4,})\b", re.IGNORECASE),
+    re.compile(r"\b(1Z[0-9A-Z]{16})\b", re.IGNORECASE),
+    # "track order INVALID999", "tracking number #AB12" - an id-like token (4+ chars, letters and
+    # digits) after "track"; "track my 2 orders" is a count, not an id
+    re.compile(
+        r"\btrack(?:ing)?(?:\s+(?:my|the|order|package|shipment|number|no\.?))*\s*[:#]?\s*"
+        r"((?=[A-Z0-9-]{4,}\b)(?=[A-Z0-9-]*[A-Z])[A-Z0-9-]*\d[A-Z0-9-]*)\b",
+        re.IGNORECASE
+    ),
+    # All-digit ids need an explicit cue: "tracking number 12345678", "track #12345678"
+    re.compile(r"\btrack(?:ing)?\s*(?:number|no\.?|#)\s*[:#]?\s*(\d{4,})\b", re.IGNORECASE),
+]
+
+ORDER_KEYWORDS = {
+    "order", "orders", "package", "packages", "parcel", "delivery", "deliveries",
+    "deliver", "delivered", "shipment", "shipping", "shipped", "ship", "track",
+    "tracking", "arrive", "arriving", "dispatch", "dispatched", "status", "refund",
+}
+
+PRODUCT_KEYWORDS = {
+    "product", "products", "item", "price", "prices", "cost", "costs", "feature",
+    "features", "spec", "specs", "specifications", "battery",
+    "camera", "display", "screen", "storage", "charging", "available", "availability",
+    "stock", "compare", "warranty", "phone", "phones", "smartphone", "smartphones",
+    "laptop", "laptops", "tablet", "tablets", "ipad", "headphones", "headphone",
+    "earbuds", "speaker", "speakers", "watch", "smartwatch", "tv",
+    "monitor", "console", "keyboard", "mouse",
+}
+
+PRODUCT_PHRASES = re.compile(
+    r"\b(tell me about|do you (have|sell)|show me|compare|recommend|looking for|how much)\b",
+    re.IGNORECASE
+)
+
+PURCHASE_PHRASES = re.compile(
+    r"\b(i|i've|i have|we|we've)\s+(just\s+|recently\s+)?(bought|purchased|ordered|got)\b"
+    r"|\bmy\s+(recent\s+|last\s+|latest\s+)?(purchase|purchases)\b",
+    re.IGNORECASE
+)
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+INTENT_SOURCE_COUNTS = Counter()
+
+
+def extract_tracking_number(query: str):
+    for pattern in TRACKING_NUMBER_PATTERNS:
+        match = pattern.search(query)
+        if match:
+            return match.group(1).upper()
+    return None
+
+
+def classify_intent_rules(query: str):
+    """
+    Deterministic pre-classifier. Returns a result dict when the query
+    matches an unambiguous pattern, otherwise None so the caller can
+    fall back to the LLM.
+    """
+    tracking_number = extract_tracking_number(query)
+    if tracking_number:
+        return {
+            "intent": "ORDER_DETAILS",
+            "entities": {"tracking_number": tracking_number},
+            "reasoning": "Query contains a tracking number",
+            "source": "rules"
+        }
+
+    words = set(WORD_PATTERN.findall(query.lower()))
+    has_order_terms = bool(words & ORDER_KEYWORDS)
+    has_product_terms = bool(words & PRODUCT_KEYWORDS) or bool(PRODUCT_PHRASES.search(query))
+    has_purchase_phrase = bool(PURCHASE_PHRASES.search(query))
+
+    if has_purchase_phrase and has_product_terms:
+        return {
+            "intent": "ORDER_PRODUCT_DETAILS",
+            "entities": {},
+            "reasoning": "Question about a product the customer purchased",
+            "source": "rules"
+        }
+
+    if has_order_terms and not has_product_terms and not has_purchase_phrase:
+        return {
+            "intent": "ORDER_DETAILS",
+            "entities": {},
+            "reasoning": "Order or delivery keywords without product terms",
+            "source": "rules"
+        }
+
+    if has_product_terms and not has_order_terms and not has_purchase_phrase:
+        return {
+            "intent": "PRODUCT_DETAILS",
+            "entities": {},
+            "reasoning": "Product keywords without order terms",
+            "source": "rules"
+        }
+
+    return None
+
+
+# =============================
+# Product filter extraction
+# =============================
+# Query nouns -> catalog categories (data/products.json); gaming mice and
+# headsets are filed under Gaming, so those nouns cover both categories
+CATEGORY_PATTERNS = [
+    (re.compile(r"\b(smart)?phones?\b|\biphones?\b|\bgalaxy s\d+", re.IGNORECASE), ["Smartphone"]),
+    (re.compile(r"\b(laptops?|notebooks?|macbooks?|ultrabooks?)\b", re.IGNORECASE), ["Laptop"]),
+    (re.compile(r"\b(tablets?|ipads?)\b", re.IGNORECASE), ["Tablet"]),
+    (re.compile(r"\bmonitors?\b", re.IGNORECASE), ["Monitor"]),
+    (re.compile(r"\b(head(phone|set)s?|earbuds?|earphones?|airpods)\b", re.IGNORECASE), ["Audio", "Gaming"]),
+    (re.compile(r"\b(microphones?|mics?|speakers?)\b", re.IGNORECASE), ["Audio"]),
+    (re.compile(r"\b(mouse|mice)\b", re.IGNORECASE), ["Accessories", "Gaming"]),
+    (re.compile(r"\b(keyboards?|webcams?|power ?banks?|chargers?)\b", re.IGNORECASE), ["Accessories"]),
+    (re.compile(r"\b(ssds?|hdds?|hard ?drives?|external drives?)\b", re.IGNORECASE), ["Storage"]),
+]
+GAMING_PATTERN = re.compile(r"\bgaming\b", re.IGNORECASE)
+
+# "$300", "300 dollars", "1,200", "1.5k"; not "8TB" or "120Hz"
+_AMOUNT = r"\$?\s?(\d[\d,]*(?:\.\d+)?)(k)?(?:\s?(?:dollars|usd|bucks))?(?![\w$])"
+
+PRICE_BETWEEN = re.compile(rf"\bbetween\s+{_AMOUNT}\s+(?:and|to)\s+{_AMOUNT}", re.IGNORECASE)
+PRICE_RANGE = re.compile(rf"\$(\d[\d,]*(?:\.\d+)?)(k)?\s?(?:-|to)\s?{_AMOUNT}", re.IGNORECASE)
+PRICE_MAX = re.compile(
+    rf"(?:\b(?:under|below|less than|cheaper than|up to|at most|no more than|max(?:imum)?|budget(?: of)?)\s+|<\s?){_AMOUNT}",
+    re.IGNORECASE
+)
+PRICE_MIN = re.compile(
+    rf"(?:\b(?:over|above|more than|at least|min(?:imum)?|starting at)\s+|>\s?){_AMOUNT}",
+    re.IGNORECASE
+)
+IN_STOCK_PATTERN = re.compile(
+    r"\b(in[ -]stock|available (now|today)|currently available|ready to ship|not sold out)\b",
+    re.IGNORECASE
+)
+
+
+def _amount(number: str, thousands: str) -> float:
+    value = float(number.replace(",", ""))
+    return value * 1000 if thousands else value
+
+
+def extract_product_filters(query: str) -> dict:
     """
-    Classify user intent using Gemini (lightweight).
-    Returns intent + extracted entities.
+    Category, price and stock constraints stated in a product query
+    ("headphones under $300 that are in stock"), in the shape accepted by
+    VectorDB.search(filters=...). Empty when the query states none.
     """
+    filters = {}
+
+    categories = []
+    for pattern, names in CATEGORY_PATTERNS:
+        if pattern.search(query):
+            categories.extend(n for n in names if n not in categories)
+    if not categories and GAMING_PATTERN.search(query):
+        categories = ["Gaming"]
+    if categories:
+        filters["category"] = categories
+
+    between = PRICE_BETWEEN.search(query) or PRICE_RANGE.search(query)
+    if between:
+        low, low_k, high, high_k = between.groups()
+        filters["min_price"] = _amount(low, low_k)
+        filters["max_price"] = _amount(high, high_k)
+    else:
+        upper = PRICE_MAX.search(query)
+        if upper:
+            filters["max_price"] = _amount(*upper.groups())
+        lower = PRICE_MIN.search(query)
+        if lower:
+            filters["min_price"] = _amount(*lower.groups())
+
+    if IN_STOCK_PATTERN.search(query):
+        filters["in_stock"] = True
+
+    return filters
 
-    prompt = f"""
+
+def with_product_filters(query: str, result: dict) -> dict:
+    """Add extracted filters to the entities of a PRODUCT_DETAILS result."""
+    if result.get("intent") != "PRODUCT_DETAILS":
+        return result
+    filters = extract_product_filters(query)
+    if not filters:
+        return result
+    return {**result, "entities": {**(result.get("entities") or {}), "filters": filters}}
+
+
+# =============================
+# Embedded statistical model
+# =============================
+def classify_intent_model(query: str):
+    """
+    TF-IDF nearest-centroid model trained by train_intent_model.py.
+    Returns None when no model is available or its prediction fails the
+    calibrated gates (confidence, top similarity, margin over the runner-up).
+    """
+    model = get_intent_model()
+    if model is None:
+        return None
+
+    scored = model.score(query)
+    if not model.accepts(scored, INTENT_MODEL_THRESHOLD):
+        return None
+
+    return {
+        "intent": scored["intent"],
+        "entities": {},
+        "reasoning": f"Intent model v{model.version} confidence {scored['confidence']:.2f}, "
+                     f"similarity {scored['similarity']:.2f}",
+        "confidence": scored["confidence"],
+        "source": "model"
+    }
+
+
+def model_threshold():
+    """The confidence threshold in effect: the override, else the loaded model's calibrated one."""
+    model = get_intent_model()
+    if INTENT_MODEL_THRESHOLD is not None or model is None:
+        return INTENT_MODEL_THRESHOLD
+    return model.threshold
+
+
+def classify_intent_local(query: str):
+    """Rules first, then the embedded model. None means ask the LLM."""
+    return classify_intent_rules(query) or classify_intent_model(query)
+
+
+def get_intent_stats() -> dict:
+    total = sum(INTENT_SOURCE_COUNTS.values())
+    return {
+        "total": total,
+        "by_source": dict(INTENT_SOURCE_COUNTS),
+        "rules_hit_rate": INTENT_SOURCE_COUNTS["rules"] / total if total else 0.0,
+        "model_hit_rate": INTENT_SOURCE_COUNTS["model"] / total if total else 0.0,
+        "cache_hit_rate": INTENT_SOURCE_COUNTS["cache"] / total if total else 0.0,
+        "model_threshold": model_threshold(),
+        "cache": INTENT_CACHE.stats()
+    }
+
+
+def _cached_intent(key: str):
+    cached = INTENT_CACHE.get(key)
+    if cached is None:
+        return None
+    return {**cached, "source": "cache"}
+
+
+def _store_intent(key: str, result: dict):
+    if result.get("intent") in ("ORDER_DETAILS", "PRODUCT_DETAILS", "ORDER_PRODUCT_DETAILS"):
+        INTENT_CACHE.set(key, result)
+
+
+# =============================
+# LLM classifier
+# =============================
+def build_intent_prompt(query: str) -> str:
+    return f"""
 You are an intent classification system for an e-commerce support chatbot.
 
 Classify the user query into ONE of the following intents:
@@ -35,20 +314,105 @@ User query:
 {query}
 """
 
-    model = genai.GenerativeModel("gemini-1.5-flash")
-
-    response = model.generate_content(
-        prompt,
-        generation_config={
-            "temperature": 0,
-            "max_output_tokens": 200
-        }
-    )
 
+def parse_intent_response(text: str) -> dict:
     try:
-        return eval(response.text)
+        result = eval(text)
     except Exception:
-        return {
+        result = None
+    if not isinstance(result, dict):
+        result = {
             "intent": "UNKNOWN",
             "entities": {}
         }
+    result["source"] = "llm"
+    return result
+
+
+def classify_intent(query: str) -> dict:
+    """
+    Classify user intent, trying the rule-based fast path and the embedded
+    model before Gemini.
+    Returns intent + extracted entities + the path that decided ("source").
+    Product queries get entities["filters"] (category / price / stock).
+    """
+    result = classify_intent_local(query)
+    if result is None:
+        key = normalize_query(query)
+        result = _cached_intent(key)
+        if result is None:
+            result = classify_intent_llm(query)
+            _store_intent(key, result)
+    INTENT_SOURCE_COUNTS[result["source"]] += 1
+    return with_product_filters(query, result)
+
+
+async def classify_intent_async(query: str) -> dict:
+    """
+    Non-blocking variant of classify_intent for the API event loop.
+    """
+    result = classify_intent_local(query)
+    if result is None:
+        key = normalize_query(query)
+        result = _cached_intent(key)
+        if result is None:
+            result = await _classify_intent_llm_shared(key, query)
+    INTENT_SOURCE_COUNTS[result["source"]] += 1
+    return with_product_filters(query, result)
+
+
+def classify_intent_without_llm(query: str):
+    """classify_intent short of the LLM: rules, the model, then the intent cache. None means ask the LLM."""
+    result = classify_intent_local(query) or _cached_intent(normalize_query(query))
+    if result is None:
+        return None
+    INTENT_SOURCE_COUNTS[result["source"]] += 1
+    return with_product_filters(query, result)
+
+
+def record_llm_intent(query: str, result: dict) -> dict:
+    """An intent the LLM decided outside the classifier (single-call mode), cached and counted alike."""
+    _store_intent(normalize_query(query), result)
+    INTENT_SOURCE_COUNTS[result["source"]] += 1
+    return with_product_filters(query, result)
+
+
+async def _classify_intent_llm_shared(key: str, query: str) -> dict:
+    pending = _pending_llm_calls.get(key)
+    if pending is not None:
+        return {**await asyncio.shield(pending), "source": "cache"}
+
+    task = asyncio.ensure_future(classify_intent_llm_async(query))
+    _pending_llm_calls[key] = task
+    try:
+        result = await task
+        _store_intent(key, result)
+        return result
+    finally:
+        _pending_llm_calls.pop(key, None)
+
+
+def classify_intent_llm(query: str) -> dict:
+    client = get_gemini_client()
+    count_llm_call("classify")
+
+    response = client.models.generate_content(
+        model="gemini-1.5-flash",
+        contents=build_intent_prompt(query),
+        config=GENERATION_CONFIG
+    )
+
+    return parse_intent_response(response.text)
+
+
+async def classify_intent_llm_async(query: str) -> dict:
+    client = get_gemini_client()
+    count_llm_call("classify")
+
+    response = await client.aio.models.generate_content(
+        model="gemini-1.5-flash",
+        contents=build_intent_prompt(query),
+        config=GENERATION_CONFIG
+    )
+
+    return parse_intent_response(response.text)
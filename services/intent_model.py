@@ -0,0 +1,210 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "data/intent_model.json")
+INTENT_CORPUS_PATH = "data/intent_corpus.json"
+# Held-out queries the model must leave to the LLM (small talk, off-topic), used for calibration
+INTENT_OUT_OF_DOMAIN_PATH = "data/intent_out_of_domain.json"
+
+# A single known word ("my") is too little evidence, whatever its similarity
+MIN_QUERY_TERMS = 2
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Unigrams plus adjacent bigrams ("i bought", "my order")."""
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    if norm == 0:
+        return vector
+    return {term: w / norm for term, w in vector.items()}
+
+
+class IntentModel:
+    """
+    TF-IDF + nearest-centroid intent classifier.
+
+    Small enough to live in-process: a prediction is a sparse dot product
+    against one centroid per intent, well under a millisecond.
+
+    The softmax turns small similarity gaps into near-certain confidences,
+    so a prediction is only trusted when the top cosine similarity and its
+    margin over the runner-up also clear their floors. train_intent_model.py
+    calibrates all three on held-out queries.
+    """
+
+    def __init__(self, idf: Dict[str, float], centroids: Dict[str, Dict[str, float]],
+                 temperature: float = 0.05, version: int = 1, trained_at: str = None,
+                 num_examples: int = 0, threshold: float = 0.9, min_similarity: float = 0.0,
+                 min_margin: float = 0.0):
+        self.idf = idf
+        self.centroids = centroids
+        self.temperature = temperature
+        self.version = version
+        self.trained_at = trained_at
+        self.num_examples = num_examples
+        self.threshold = threshold
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+
+    # =============================
+    # Training
+    # =============================
+    @classmethod
+    def train(cls, examples: List[dict], temperature: float = 0.05, version: int = 1) -> "IntentModel":
+        documents = [(Counter(tokenize(ex["text"])), ex["intent"]) for ex in examples]
+
+        doc_freq = Counter()
+        for counts, _ in documents:
+            doc_freq.update(counts.keys())
+
+        n = len(documents)
+        idf = {term: math.log((1 + n) / (1 + df)) + 1 for term, df in doc_freq.items()}
+
+        sums: Dict[str, Counter] = {}
+        for counts, intent in documents:
+            vector = _normalize({t: (1 + math.log(c)) * idf[t] for t, c in counts.items()})
+            sums.setdefault(intent, Counter()).update(vector)
+
+        centroids = {intent: _normalize(dict(total)) for intent, total in sums.items()}
+
+        return cls(
+            idf=idf,
+            centroids=centroids,
+            temperature=temperature,
+            version=version,
+            trained_at=datetime.utcnow().isoformat(timespec="seconds"),
+            num_examples=n
+        )
+
+    # =============================
+    # Inference
+    # =============================
+    def vectorize(self, text: str) -> Dict[str, float]:
+        counts = Counter(t for t in tokenize(text) if t in self.idf)
+        return _normalize({t: (1 + math.log(c)) * self.idf[t] for t, c in counts.items()})
+
+    def similarities(self, vector: Dict[str, float]) -> Dict[str, float]:
+        return {
+            intent: sum(w * centroid.get(t, 0.0) for t, w in vector.items())
+            for intent, centroid in self.centroids.items()
+        }
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        return self._softmax(self.similarities(self.vectorize(text)))
+
+    def _softmax(self, scores: Dict[str, float]) -> Dict[str, float]:
+        # Softmax over cosine similarities; an all-unknown query comes out uniform
+        top = max(scores.values())
+        exps = {i: math.exp((s - top) / self.temperature) for i, s in scores.items()}
+        total = sum(exps.values())
+        return {i: e / total for i, e in exps.items()}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        proba = self.predict_proba(text)
+        intent = max(proba, key=proba.get)
+        return intent, proba[intent]
+
+    def score(self, text: str) -> dict:
+        """Prediction plus the evidence behind it: top similarity, margin and known words."""
+        vector = self.vectorize(text)
+        scores = self.similarities(vector)
+        proba = self._softmax(scores)
+        ranked = sorted(scores.values(), reverse=True)
+        intent = max(proba, key=proba.get)
+        return {
+            "intent": intent,
+            "confidence": proba[intent],
+            "similarity": ranked[0],
+            "margin": ranked[0] - ranked[1] if len(ranked) > 1 else ranked[0],
+            "terms": sum(1 for t in vector if " " not in t)
+        }
+
+    def accepts(self, scored: dict, threshold: float = None) -> bool:
+        """Whether a score() result is trustworthy enough to skip the LLM."""
+        return (
+            scored["terms"] >= MIN_QUERY_TERMS
+            and scored["similarity"] >= self.min_similarity
+            and scored["margin"] >= self.min_margin
+            and scored["confidence"] >= (self.threshold if threshold is None else threshold)
+        )
+
+    # =============================
+    # Persistence
+    # =============================
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "trained_at": self.trained_at,
+            "num_examples": self.num_examples,
+            "temperature": self.temperature,
+            "threshold": self.threshold,
+            "min_similarity": self.min_similarity,
+            "min_margin": self.min_margin,
+            "idf": self.idf,
+            "centroids": self.centroids
+        }
+
+    def save(self, path: str = INTENT_MODEL_PATH):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str = INTENT_MODEL_PATH) -> "IntentModel":
+        with open(path) as f:
+            data = json.load(f)
+        return cls(
+            idf=data["idf"],
+            centroids=data["centroids"],
+            temperature=data.get("temperature", 0.05),
+            version=data.get("version", 1),
+            trained_at=data.get("trained_at"),
+            num_examples=data.get("num_examples", 0),
+            threshold=data.get("threshold", 0.9),
+            min_similarity=data.get("min_similarity", 0.0),
+            min_margin=data.get("min_margin", 0.0)
+        )
+
+
+def load_corpus(path: str = INTENT_CORPUS_PATH) -> List[dict]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_out_of_domain(path: str = INTENT_OUT_OF_DOMAIN_PATH) -> List[str]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+# =============================
+# GLOBAL INSTANCE (lazy)
+# =============================
+_intent_model = None
+_intent_model_loaded = False
+
+
+def get_intent_model() -> Optional[IntentModel]:
+    global _intent_model, _intent_model_loaded
+    if not _intent_model_loaded:
+        _intent_model_loaded = True
+        if os.path.exists(INTENT_MODEL_PATH):
+            try:
+                _intent_model = IntentModel.load(INTENT_MODEL_PATH)
+                print(f"✅ Intent model v{_intent_model.version} loaded")
+            except Exception as e:
+                print(f"⚠️ Failed to load intent model: {e}")
+        else:
+            print("⚠️ Intent model not found. Falling back to LLM classification.")
+    return _intent_model
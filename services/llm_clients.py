@@ -0,0 +1,210 @@
+import contextvars
+import os
+import threading
+from collections import Counter
+
+import httpx
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types
+
+load_dotenv()
+
+# =============================
+# Pool configuration
+# =============================
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+# Idle connections are closed after this many seconds
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+LOCAL_LLM_TIMEOUT = float(os.getenv("LOCAL_LLM_TIMEOUT", "60"))
+
+# Per provider: requests, and the TCP connections they opened or reused
+CONNECTION_STATS = {"gemini": Counter(), "local": Counter()}
+
+# LLM round trips: by kind (classify / answer / single_call) and requests by how many they needed
+LLM_CALL_KINDS = Counter()
+LLM_CALLS_PER_REQUEST = Counter()
+# Counter of the chat turn being handled; tasks and threads it starts share the same object
+_request_calls = contextvars.ContextVar("llm_request_calls", default=None)
+
+_clients = {}
+# Re-entrant: the Gemini client is created together with its HTTP clients
+_lock = threading.RLock()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    )
+
+
+# =============================
+# Connection reuse tracing
+# =============================
+def _tracer(stats: Counter):
+    """
+    httpcore trace callback for one request. Request headers sent after
+    this request opened a TCP connection count as a new connection, headers
+    sent without one as a reused connection; requests that never got a
+    connection (failed connect, pool timeout) count as neither.
+    """
+    connected = False
+
+    def on_event(event: str):
+        nonlocal connected
+        if event == "connection.connect_tcp.complete":
+            connected = True
+            stats["new_connections"] += 1
+        elif event.endswith(".send_request_headers.started") and not connected:
+            stats["reused_connections"] += 1
+
+    return on_event
+
+
+def _event_hooks(provider: str) -> dict:
+    """Counts requests and, through httpcore's trace extension, new and reused connections."""
+    stats = CONNECTION_STATS[provider]
+
+    def on_request(request: httpx.Request):
+        stats["requests"] += 1
+        on_event = _tracer(stats)
+        request.extensions["trace"] = lambda event, info: on_event(event)
+
+    return {"request": [on_request]}
+
+
+def _async_event_hooks(provider: str) -> dict:
+    stats = CONNECTION_STATS[provider]
+
+    async def on_request(request: httpx.Request):
+        stats["requests"] += 1
+        on_event = _tracer(stats)
+
+        async def trace(event: str, info: dict):
+            on_event(event)
+
+        request.extensions["trace"] = trace
+
+    return {"request": [on_request]}
+
+
+def _get(name: str, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+# =============================
+# Provider clients (one per process)
+# =============================
+def get_gemini_client() -> genai.Client:
+    """Shared Gemini client; its sync and async calls each keep a pool of HTTPS connections."""
+    def create():
+        # genai does not close HTTP clients it was given; close_llm_clients() does
+        http_client = _get("gemini_http", lambda: httpx.Client(
+            timeout=GEMINI_TIMEOUT, limits=_limits(), event_hooks=_event_hooks("gemini")
+        ))
+        async_http_client = _get("gemini_http_async", lambda: httpx.AsyncClient(
+            timeout=GEMINI_TIMEOUT, limits=_limits(), event_hooks=_async_event_hooks("gemini")
+        ))
+        return genai.Client(
+            api_key=os.getenv("GEMINI_API_KEY"),
+            http_options=types.HttpOptions(
+                timeout=int(GEMINI_TIMEOUT * 1000),  # milliseconds
+                httpx_client=http_client,
+                httpx_async_client=async_http_client
+            )
+        )
+
+    return _get("gemini", create)
+
+
+def get_local_llm_client() -> httpx.Client:
+    """Pooled sync client for Ollama."""
+    return _get("local", lambda: httpx.Client(
+        timeout=LOCAL_LLM_TIMEOUT, limits=_limits(), event_hooks=_event_hooks("local")
+    ))
+
+
+def get_local_llm_async_client() -> httpx.AsyncClient:
+    """Pooled async client for Ollama."""
+    return _get("local_async", lambda: httpx.AsyncClient(
+        timeout=LOCAL_LLM_TIMEOUT, limits=_limits(), event_hooks=_async_event_hooks("local")
+    ))
+
+
+async def close_llm_clients():
+    """Close every pooled connection (app shutdown)."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+
+    for client in clients:
+        if isinstance(client, httpx.AsyncClient):
+            await client.aclose()
+        elif isinstance(client, httpx.Client):
+            client.close()
+
+
+def get_connection_stats() -> dict:
+    stats = {}
+    for provider, counts in CONNECTION_STATS.items():
+        opened, reused = counts["new_connections"], counts["reused_connections"]
+        stats[provider] = {
+            "requests": counts["requests"],
+            "new_connections": opened,
+            "reused_connections": reused,
+            # Of the requests that were sent on a connection
+            "reuse_rate": reused / (opened + reused) if opened + reused else 0.0
+        }
+    stats["pool"] = {
+        "max_connections": LLM_POOL_MAX_CONNECTIONS,
+        "max_keepalive_connections": LLM_POOL_MAX_KEEPALIVE,
+        "keepalive_expiry": LLM_KEEPALIVE_EXPIRY
+    }
+    return stats
+
+
+# =============================
+# LLM calls per request
+# =============================
+def start_llm_call_count() -> Counter:
+    """Start counting the LLM round trips of one chat turn."""
+    calls = Counter()
+    _request_calls.set(calls)
+    return calls
+
+
+def count_llm_call(kind: str):
+    """Called by every provider call (kind: classify, answer or single_call)."""
+    LLM_CALL_KINDS[kind] += 1
+    calls = _request_calls.get()
+    if calls is not None:
+        calls[kind] += 1
+
+
+def finish_llm_call_count(calls: Counter) -> int:
+    """Record a finished turn; returns the number of LLM calls it made."""
+    total = sum(calls.values())
+    LLM_CALLS_PER_REQUEST[total] += 1
+    return total
+
+
+def get_llm_call_stats() -> dict:
+    requests = sum(LLM_CALLS_PER_REQUEST.values())
+    calls = sum(count * n for count, n in LLM_CALLS_PER_REQUEST.items())
+    return {
+        "requests": requests,
+        "avg_calls_per_request": calls / requests if requests else 0.0,
+        "requests_by_calls": {str(count): n for count, n in sorted(LLM_CALLS_PER_REQUEST.items())},
+        "calls_by_kind": dict(LLM_CALL_KINDS)
+    }
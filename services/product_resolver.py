@@ -0,0 +1,265 @@
+import re
+import threading
+from collections import deque
+from typing import List, Optional, Set
+
+_WORD = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_HYPHENATED = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)+")
+_PARENTHETICAL = re.compile(r"\([^)]*\)")
+# Sizes, capacities and ordinals look like model numbers but name no product on their own
+_UNIT = re.compile(r"^\d+(?:\.\d+)?(?:mah|tb|gb|mb|mp|hz|w|k|inch|in|mm|st|nd|rd|th)$")
+# Words that continue a product line rather than follow a brand ("MacBook Pro")
+_LINE_WORDS = {"pro", "max", "mini", "plus", "ultra", "air", "lite"}
+
+
+def name_words(text: str) -> List[str]:
+    """Lowercased words; "WH-1000XM5" -> wh, 1000xm5, "12.9-inch" -> 12.9, inch."""
+    return _WORD.findall(str(text).lower())
+
+
+def _is_model_number(word: str) -> bool:
+    has_letter = any(c.isalpha() for c in word)
+    has_digit = any(c.isdigit() for c in word)
+    return has_letter and has_digit and len(word) >= 3 and not _UNIT.match(word)
+
+
+def product_aliases(doc: dict) -> Set[tuple]:
+    """
+    Word sequences that name a product:
+        full name, and name without parenthetical ("Apple AirPods Pro")
+        without the brand ("Galaxy S23 Ultra", "XPS 15")
+        up to the first number ("iPhone 15", "Galaxy Tab S9")
+        the product line before it ("MacBook Pro", "MX Master")
+        model numbers ("1000xm5", "wh1000xm5", "c920")
+        anything listed under the product's "aliases"
+    """
+    name = doc.get("name") or ""
+    names = [name_words(name), name_words(_PARENTHETICAL.sub(" ", name))]
+
+    brandless = names[-1][1:]
+    if len(brandless) >= 2 and any(c.isalpha() for c in brandless[0]) and brandless[0] not in _LINE_WORDS:
+        names.append(brandless)
+
+    aliases = set()
+    for words in names:
+        aliases.add(tuple(words))
+        for i, word in enumerate(words):
+            if any(c.isdigit() for c in word):
+                if i >= 1:
+                    aliases.add(tuple(words[:i + 1]))
+                if i >= 2:
+                    aliases.add(tuple(words[:i]))
+                break
+
+    for word in names[0]:
+        if _is_model_number(word):
+            aliases.add((word,))
+    for token in _HYPHENATED.findall(name.lower()):
+        joined = token.replace("-", "")
+        if _is_model_number(joined):
+            aliases.add((joined,))
+
+    for alias in doc.get("aliases") or []:
+        aliases.add(tuple(name_words(alias)))
+
+    aliases.discard(())
+    return aliases
+
+
+class _Node:
+    __slots__ = ("children", "depth", "fail", "owners", "output", "product")
+
+    def __init__(self, depth: int = 0):
+        self.children = {}
+        self.depth = depth  # alias length in words
+        self.fail = None
+        self.owners = {}    # product_id -> alias count ending here
+        self.output = None  # nearest node (self or via fail links) that ends an alias
+        self.product = None  # the only product with an alias through here, else None
+
+
+class ProductResolver:
+    """
+    Aho-Corasick automaton over product-name word sequences. A query is
+    resolved to product_ids in one pass over its words, so a query that
+    names a product can skip vector search and use a direct lookup.
+
+    Products are added and removed one at a time as the catalog changes;
+    only the failure links are recomputed (one BFS over the trie) before
+    the next lookup. An alias shared by two products, or the start of
+    another product's alias ("Samsung Galaxy"), is ambiguous and never
+    resolves.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._aliases = {}  # product_id -> set of alias tuples
+        self._dirty = True
+        self._lock = threading.Lock()
+        self.stats_counts = {"queries": 0, "resolved": 0, "updates": 0}
+
+    # =============================
+    # Updates
+    # =============================
+    def set_product(self, product_id: str, doc: Optional[dict]):
+        with self._lock:
+            self._remove(product_id)
+            if doc is not None:
+                self._add(product_id, product_aliases(doc))
+            self._dirty = True
+            self.stats_counts["updates"] += 1
+
+    def _add(self, product_id: str, aliases: Set[tuple]):
+        for alias in aliases:
+            node = self._root
+            for word in alias:
+                if word not in node.children:
+                    node.children[word] = _Node(node.depth + 1)
+                node = node.children[word]
+            node.owners[product_id] = node.owners.get(product_id, 0) + 1
+        self._aliases[product_id] = aliases
+
+    def _remove(self, product_id: str):
+        for alias in self._aliases.pop(product_id, ()):
+            path = [self._root]
+            for word in alias:
+                path.append(path[-1].children[word])
+            node = path[-1]
+            node.owners[product_id] -= 1
+            if not node.owners[product_id]:
+                del node.owners[product_id]
+            # Prune branches no other alias uses
+            for parent, word in zip(reversed(path[:-1]), reversed(alias)):
+                child = parent.children[word]
+                if child.children or child.owners:
+                    break
+                del parent.children[word]
+
+    def _link(self):
+        """Recompute failure, output and product links breadth-first."""
+        root = self._root
+        root.fail, root.output = None, None
+        order = []
+        queue = deque()
+        for child in root.children.values():
+            child.fail = root
+            child.output = child if child.owners else None
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for word, child in node.children.items():
+                fail = node.fail
+                while fail is not None and word not in fail.children:
+                    fail = fail.fail
+                child.fail = fail.children[word] if fail is not None else root
+                child.output = child if child.owners else child.fail.output
+                queue.append(child)
+
+        for node in reversed(order):
+            products = set(node.owners)
+            for child in node.children.values():
+                products.add(child.product)
+            node.product = products.pop() if len(products) == 1 else None
+        self._dirty = False
+
+    # =============================
+    # Queries
+    # =============================
+    def resolve(self, query: str) -> List[str]:
+        """
+        product_ids named in the query, in order of appearance. Overlapping
+        mentions keep the longest ("galaxy tab s9" over "galaxy").
+        """
+        words = name_words(query)
+        with self._lock:
+            if self._dirty:
+                self._link()
+
+            matches = []  # (start, end, product_id)
+            node = self._root
+            for end, word in enumerate(words, 1):
+                while node is not self._root and word not in node.children:
+                    node = node.fail
+                node = node.children.get(word, self._root)
+
+                hit = node.output
+                while hit is not None:
+                    if hit.product is not None:
+                        matches.append((end - hit.depth, end, hit.product))
+                    hit = hit.fail.output
+
+            self.stats_counts["queries"] += 1
+
+        product_ids = []
+        last_end = 0
+        for start, end, product_id in sorted(matches, key=lambda m: (m[0], -m[1])):
+            if start >= last_end:
+                product_ids.append(product_id)
+                last_end = end
+        if product_ids:
+            self.stats_counts["resolved"] += 1
+        return list(dict.fromkeys(product_ids))
+
+    def stats(self) -> dict:
+        return {
+            "products": len(self._aliases),
+            "aliases": sum(len(aliases) for aliases in self._aliases.values()),
+            **self.stats_counts
+        }
+
+
+# =============================
+# Catalog binding
+# =============================
+PRODUCT_RESOLVER = ProductResolver()
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def _load_catalog():
+    """Build the automaton from the indexed catalog on first use."""
+    global _loaded
+    from database.vector_db import VECTOR_DB, normalize_product_id
+
+    with _load_lock:
+        if _loaded:
+            return
+        # Only the columns aliases come from; the rest of each row stays encoded
+        for _, doc in VECTOR_DB.metadata.iter_columns(("product_id", "name", "aliases")):
+            if doc.get("product_id"):
+                PRODUCT_RESOLVER.set_product(normalize_product_id(doc["product_id"]), doc)
+        _loaded = True
+
+
+def _on_products_changed(product_ids):
+    from database.vector_db import VECTOR_DB, normalize_product_id
+
+    with _load_lock:
+        # Not built yet: the first lookup reads the current catalog anyway
+        if not _loaded:
+            return
+        for product_id in product_ids:
+            product_id = normalize_product_id(product_id)
+            PRODUCT_RESOLVER.set_product(product_id, VECTOR_DB.get(product_id))
+
+
+def resolve_product_ids(query: str) -> List[str]:
+    """product_ids of catalog products named in the query (may be empty)."""
+    if not _loaded:
+        _load_catalog()
+    return PRODUCT_RESOLVER.resolve(query)
+
+
+def get_resolver_stats() -> dict:
+    return PRODUCT_RESOLVER.stats()
+
+
+def register_catalog_hooks():
+    from database.vector_db import VECTOR_DB
+
+    VECTOR_DB.subscribe(_on_products_changed)
+
+
+register_catalog_hooks()
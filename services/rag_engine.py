@@ -1,17 +1,23 @@
 import os
+import json
+from typing import AsyncIterator, Optional
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
-import requests
+from services.llm_clients import (
+    count_llm_call, get_gemini_client, get_local_llm_async_client, get_local_llm_client
+)
+from services.response_cache import RESPONSE_CACHE_ENABLED, lookup_response, store_response
 
 load_dotenv()
 
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
 
+LOCAL_LLM_ERROR = "Local LLM unavailable."
+GEMINI_ERROR = "Gemini API error. Try again."
+PROVIDER_ERROR = "Error: Invalid LLM provider"
 
-def generate_response(query: str, context: str, intent: str, conversation_history: list = None) -> str:
-    system_prompt = build_system_prompt(intent)
 
+def build_user_message(query: str, context: str, conversation_history: list = None) -> str:
     conversation_context = ""
     if conversation_history:
         conversation_context = "\n\nPrevious Conversation:\n"
@@ -19,7 +25,7 @@ def generate_response(query: str, context: str, intent: str, conversation_histor
             role = "Customer" if msg["role"] == "user" else "Assistant"
             conversation_context += f"{role}: {msg['content']}\n"
 
-    user_message = f"""
+    return f"""
 {conversation_context}
 
 Retrieved Info:
@@ -28,13 +34,85 @@ Retrieved Info:
 User Question: {query}
 """
 
+
+def generate_response(query: str, context: str, intent: str, conversation_history: list = None) -> str:
+    system_prompt = build_system_prompt(intent)
+    user_message = build_user_message(query, context, conversation_history)
+
     if LLM_PROVIDER == "gemini":
         return call_gemini_rag(system_prompt, user_message)
 
     elif LLM_PROVIDER == "local":
         return call_local_llm_rag(system_prompt, user_message)
 
-    return "Error: Invalid LLM provider"
+    return PROVIDER_ERROR
+
+
+async def generate_response_async(query: str, context: str, intent: str, conversation_history: list = None,
+                                  cache_tags: list = None) -> str:
+    """
+    Answers from the semantic response cache when an equivalent question was
+    already answered against the same context; cache_tags (order/product ids)
+    let catalog and order updates invalidate the stored answer.
+    """
+    probe = None
+    if RESPONSE_CACHE_ENABLED:
+        cached, probe = await lookup_response(query, intent, context, conversation_history)
+        if cached is not None:
+            return cached
+
+    system_prompt = build_system_prompt(intent)
+    user_message = build_user_message(query, context, conversation_history)
+
+    if LLM_PROVIDER == "gemini":
+        answer = await call_gemini_rag_async(system_prompt, user_message)
+
+    elif LLM_PROVIDER == "local":
+        answer = await call_local_llm_rag_async(system_prompt, user_message)
+
+    else:
+        return PROVIDER_ERROR
+
+    if answer not in (LOCAL_LLM_ERROR, GEMINI_ERROR):
+        store_response(probe, answer, cache_tags or [])
+
+    return answer
+
+
+async def stream_response_async(query: str, context: str, intent: str, conversation_history: list = None,
+                                cache_tags: list = None) -> AsyncIterator[str]:
+    """
+    Same as generate_response_async, but yields the answer in pieces as the
+    LLM produces them. A cached answer is yielded whole.
+    """
+    probe = None
+    if RESPONSE_CACHE_ENABLED:
+        cached, probe = await lookup_response(query, intent, context, conversation_history)
+        if cached is not None:
+            yield cached
+            return
+
+    system_prompt = build_system_prompt(intent)
+    user_message = build_user_message(query, context, conversation_history)
+
+    if LLM_PROVIDER == "gemini":
+        stream = stream_gemini_rag(system_prompt, user_message)
+
+    elif LLM_PROVIDER == "local":
+        stream = stream_local_llm_rag(system_prompt, user_message)
+
+    else:
+        yield PROVIDER_ERROR
+        return
+
+    parts = []
+    async for text in stream:
+        parts.append(text)
+        yield text
+
+    answer = "".join(parts).strip()
+    if answer and answer not in (LOCAL_LLM_ERROR, GEMINI_ERROR):
+        store_response(probe, answer, cache_tags or [])
 
 
 def build_system_prompt(intent: str) -> str:
@@ -52,25 +130,72 @@ def build_system_prompt(intent: str) -> str:
     return base
 
 
-def call_local_llm_rag(system_prompt: str, user_message: str) -> str:
-    url = os.getenv("LOCAL_LLM_URL", "http://localhost:11434") + "/api/generate"
-
-    payload = {
+def build_local_payload(system_prompt: str, user_message: str, stream: bool = False) -> dict:
+    return {
         "model": "llama3.2",
         "prompt": f"{system_prompt}\n\n{user_message}",
-        "stream": False,
+        "stream": stream,
         "options": {"temperature": 0.3, "num_predict": 500}
     }
 
+
+def call_local_llm_rag(system_prompt: str, user_message: str) -> str:
+    url = os.getenv("LOCAL_LLM_URL", "http://localhost:11434") + "/api/generate"
+    count_llm_call("answer")
+
     try:
-        r = requests.post(url, json=payload, timeout=60)
+        r = get_local_llm_client().post(url, json=build_local_payload(system_prompt, user_message))
         return r.json()["response"].strip()
     except:
-        return "Local LLM unavailable."
+        return LOCAL_LLM_ERROR
+
+
+async def call_local_llm_rag_async(system_prompt: str, user_message: str) -> str:
+    url = os.getenv("LOCAL_LLM_URL", "http://localhost:11434") + "/api/generate"
+    count_llm_call("answer")
+
+    try:
+        r = await get_local_llm_async_client().post(url, json=build_local_payload(system_prompt, user_message))
+        return r.json()["response"].strip()
+    except Exception:
+        return LOCAL_LLM_ERROR
+
+
+async def stream_local_llm_rag(system_prompt: str, user_message: str) -> AsyncIterator[str]:
+    """Ollama streams one JSON object per line, each with the next piece of "response"."""
+    url = os.getenv("LOCAL_LLM_URL", "http://localhost:11434") + "/api/generate"
+    payload = build_local_payload(system_prompt, user_message, stream=True)
+    started = False
+    count_llm_call("answer")
+
+    try:
+        async with get_local_llm_async_client().stream("POST", url, json=payload) as r:
+            async for line in r.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("response"):
+                    started = True
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    return
+    except Exception as e:
+        # Once text has been sent, keep the partial answer rather than append an error
+        if not started:
+            yield LOCAL_LLM_ERROR
+        else:
+            print(f"⚠️ Local LLM stream interrupted: {e}")
+
+
+GEMINI_CONFIG = types.GenerateContentConfig(
+    temperature=0.3,
+    max_output_tokens=500
+)
 
 
 def call_gemini_rag(system_prompt: str, user_message: str) -> str:
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    client = get_gemini_client()
+    count_llm_call("answer")
 
     prompt = f"{system_prompt}\n\n{user_message}"
 
@@ -78,11 +203,100 @@ def call_gemini_rag(system_prompt: str, user_message: str) -> str:
         res = client.models.generate_content(
             model="gemini-1.5-flash",
             contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.3,
-                max_output_tokens=500
-            )
+            config=GEMINI_CONFIG
         )
         return res.text.strip()
     except:
-        return "Gemini API error. Try again."
+        return GEMINI_ERROR
+
+
+async def call_gemini_rag_async(system_prompt: str, user_message: str) -> str:
+    client = get_gemini_client()
+    count_llm_call("answer")
+
+    prompt = f"{system_prompt}\n\n{user_message}"
+
+    try:
+        res = await client.aio.models.generate_content(
+            model="gemini-1.5-flash",
+            contents=prompt,
+            config=GEMINI_CONFIG
+        )
+        return res.text.strip()
+    except Exception:
+        return GEMINI_ERROR
+
+
+async def stream_gemini_rag(system_prompt: str, user_message: str) -> AsyncIterator[str]:
+    client = get_gemini_client()
+    count_llm_call("answer")
+
+    prompt = f"{system_prompt}\n\n{user_message}"
+    started = False
+
+    try:
+        stream = await client.aio.models.generate_content_stream(
+            model="gemini-1.5-flash",
+            contents=prompt,
+            config=GEMINI_CONFIG
+        )
+        async for chunk in stream:
+            if chunk.text:
+                started = True
+                yield chunk.text
+    except Exception as e:
+        if not started:
+            yield GEMINI_ERROR
+        else:
+            print(f"⚠️ Gemini stream interrupted: {e}")
+
+
+# =============================
+# Structured output (single-call mode)
+# =============================
+GEMINI_JSON_CONFIG = types.GenerateContentConfig(
+    temperature=0.3,
+    max_output_tokens=700,
+    response_mime_type="application/json"
+)
+
+
+async def call_local_llm_json_async(system_prompt: str, user_message: str) -> Optional[str]:
+    url = os.getenv("LOCAL_LLM_URL", "http://localhost:11434") + "/api/generate"
+    count_llm_call("single_call")
+    # Ollama constrains the output to valid JSON
+    payload = {**build_local_payload(system_prompt, user_message), "format": "json"}
+
+    try:
+        r = await get_local_llm_async_client().post(url, json=payload)
+        return r.json()["response"]
+    except Exception:
+        return None
+
+
+async def call_gemini_json_async(system_prompt: str, user_message: str) -> Optional[str]:
+    client = get_gemini_client()
+    count_llm_call("single_call")
+
+    prompt = f"{system_prompt}\n\n{user_message}"
+
+    try:
+        res = await client.aio.models.generate_content(
+            model="gemini-1.5-flash",
+            contents=prompt,
+            config=GEMINI_JSON_CONFIG
+        )
+        return res.text
+    except Exception:
+        return None
+
+
+async def generate_structured_async(system_prompt: str, user_message: str) -> Optional[str]:
+    """One JSON-mode call to the configured provider; None when the call fails."""
+    if LLM_PROVIDER == "gemini":
+        return await call_gemini_json_async(system_prompt, user_message)
+
+    if LLM_PROVIDER == "local":
+        return await call_local_llm_json_async(system_prompt, user_message)
+
+    return None
@@ -0,0 +1,431 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from utils.helpers import normalize_query
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_DISK_PATH = os.getenv("RESPONSE_CACHE_DISK_PATH", "")
+# Seconds an answer stays reusable (0 = until invalidated); bounds anything invalidation misses
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Oldest rows of the disk tier are evicted past this size
+RESPONSE_CACHE_DISK_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Intents whose answers are matched by query embedding; the rest (order answers, which no
+# product search embeds the query for) are keyed by the exact normalized query only
+SEMANTIC_INTENTS = ("PRODUCT_DETAILS", "ORDER_PRODUCT_DETAILS")
+
+# Bytes a disk row is charged, matching _disk_row_size
+DISK_ROW_SIZE = ("length(CAST(query_key AS BLOB)) + length(embedding) + length(CAST(answer AS BLOB))"
+                 " + length(CAST(tags AS BLOB)) + 64")
+
+
+def context_bucket(intent: str, context: str, conversation_history: list = None) -> str:
+    """
+    Answers are only reusable against the exact same retrieved context
+    (and conversation window), so a changed price or order status lands
+    in a different bucket automatically.
+    """
+    digest = hashlib.sha256()
+    digest.update(intent.encode())
+    digest.update(b"\0")
+    digest.update(context.encode())
+    for msg in (conversation_history or [])[-5:]:
+        digest.update(b"\0")
+        digest.update(f"{msg['role']}:{msg['content']}".encode())
+    return digest.hexdigest()
+
+
+def collect_cache_tags(retrieval_result: dict, intent: str = None, user_email: str = None) -> List[str]:
+    """
+    Order and product ids a retrieval depended on, for invalidation. Answers
+    about a user's orders are also tagged with the user, so a new order
+    (which matches none of the existing order tags) drops them too.
+    """
+    tags = set()
+    if user_email and intent in ("ORDER_DETAILS", "ORDER_PRODUCT_DETAILS"):
+        tags.add(f"user:{user_email}")
+    results = retrieval_result.get("results") or []
+    if isinstance(results, dict):
+        results = list(results.get("orders") or []) + list(results.get("products") or [])
+
+    for item in results:
+        if isinstance(item, dict):
+            product = item.get("product", item)
+            if product.get("product_id"):
+                tags.add(f"product:{product['product_id']}")
+        elif hasattr(item, "items") and hasattr(item, "id"):
+            tags.add(f"order:{item.id}")
+            for order_item in item.items:
+                tags.add(f"product:{order_item.product_id}")
+
+    return sorted(tags)
+
+
+class CacheProbe:
+    """
+    Result of a lookup; carries the query embedding so a miss can be stored
+    without re-embedding (None for exactly keyed intents).
+    """
+
+    def __init__(self, bucket: str, query_key: str, embedding: Optional[np.ndarray]):
+        self.bucket = bucket
+        self.query_key = query_key
+        self.embedding = embedding
+
+
+class ResponseCache:
+    def __init__(self, threshold: float = RESPONSE_CACHE_THRESHOLD, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 disk_path: str = RESPONSE_CACHE_DISK_PATH, disk_max_bytes: int = RESPONSE_CACHE_DISK_MAX_BYTES,
+                 ttl: float = RESPONSE_CACHE_TTL):
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()   # entry_id -> entry dict
+        self._buckets = {}              # bucket -> set(entry_id)
+        self._tags = {}                 # tag -> set(entry_id)
+        self._next_id = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats_counts = {"exact_hits": 0, "semantic_hits": 0, "disk_hits": 0, "misses": 0,
+                             "evictions": 0, "disk_evictions": 0, "expirations": 0, "invalidations": 0}
+
+        self._disk = None
+        self._disk_bytes = 0
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "bucket TEXT, query_key TEXT, embedding BLOB, answer TEXT, tags TEXT, created_at REAL)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS idx_responses_bucket ON responses(bucket)")
+            self._disk.execute("CREATE INDEX IF NOT EXISTS idx_responses_created ON responses(created_at)")
+            self._disk.commit()
+            with self._lock:
+                self._count_disk_bytes_locked()
+                self._expire_disk_locked()
+                self._evict_disk_locked()
+                self._disk.commit()
+
+    # =============================
+    # Lookup / store
+    # =============================
+    def lookup_exact(self, bucket: str, query_key: str) -> Optional[str]:
+        with self._lock:
+            self._expire_bucket_locked(bucket)
+            for entry_id in self._buckets.get(bucket, ()):
+                entry = self._entries[entry_id]
+                if entry["query_key"] == query_key:
+                    self._entries.move_to_end(entry_id)
+                    self.stats_counts["exact_hits"] += 1
+                    return entry["answer"]
+        return None
+
+    def lookup_semantic(self, bucket: str, embedding: np.ndarray) -> Optional[str]:
+        with self._lock:
+            self._expire_bucket_locked(bucket)
+            best_id, best_score = None, self.threshold
+            for entry_id in self._buckets.get(bucket, ()):
+                score = float(np.dot(self._entries[entry_id]["embedding"], embedding))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is not None:
+                self._entries.move_to_end(best_id)
+                self.stats_counts["semantic_hits"] += 1
+                return self._entries[best_id]["answer"]
+
+        answer = self._lookup_disk(bucket, embedding)
+        if answer is None:
+            with self._lock:
+                self.stats_counts["misses"] += 1
+        return answer
+
+    def lookup_keyed(self, bucket: str, query_key: str) -> Optional[str]:
+        """Exact lookup through both tiers, for intents cached without embeddings."""
+        answer = self.lookup_exact(bucket, query_key)
+        if answer is not None:
+            return answer
+
+        row = None
+        with self._lock:
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT answer, tags, created_at FROM responses"
+                    " WHERE bucket = ? AND query_key = ? AND created_at >= ? ORDER BY rowid DESC LIMIT 1",
+                    (bucket, query_key, self._expired_before() or 0)
+                ).fetchone()
+            self.stats_counts["disk_hits" if row else "misses"] += 1
+        if row is None:
+            return None
+
+        answer, tags, created_at = row
+        self._store_memory(bucket, query_key, None, answer, json.loads(tags), created_at)
+        return answer
+
+    def store(self, probe: CacheProbe, answer: str, tags: Iterable[str] = ()):
+        tags = list(tags)
+        created_at = time.time()
+        self._store_memory(probe.bucket, probe.query_key, probe.embedding, answer, tags, created_at)
+
+        if self._disk is not None:
+            blob = probe.embedding.tobytes() if probe.embedding is not None else b""
+            tags_json = json.dumps(tags)
+            with self._lock:
+                self._disk.execute(
+                    "INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (probe.bucket, probe.query_key, blob, answer, tags_json, created_at)
+                )
+                self._disk_bytes += _disk_row_size(probe.query_key, blob, answer, tags_json)
+                self._expire_disk_locked()
+                self._evict_disk_locked()
+                self._disk.commit()
+
+    def _store_memory(self, bucket: str, query_key: str, embedding: Optional[np.ndarray], answer: str,
+                      tags: List[str], created_at: float):
+        size = (embedding.nbytes if embedding is not None else 0) + len(answer.encode()) + len(query_key) + 64
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "bucket": bucket,
+                "query_key": query_key,
+                "embedding": embedding,
+                "answer": answer,
+                "tags": tags,
+                "created_at": created_at,
+                "size": size
+            }
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(entry_id)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._entries:
+                oldest_id = next(iter(self._entries))
+                self._remove_locked(oldest_id)
+                self.stats_counts["evictions"] += 1
+
+    def _expired_before(self) -> Optional[float]:
+        return time.time() - self.ttl if self.ttl else None
+
+    def _expire_bucket_locked(self, bucket: str):
+        cutoff = self._expired_before()
+        if cutoff is None:
+            return
+        expired = [entry_id for entry_id in self._buckets.get(bucket, ())
+                   if self._entries[entry_id]["created_at"] < cutoff]
+        for entry_id in expired:
+            self._remove_locked(entry_id)
+        self.stats_counts["expirations"] += len(expired)
+
+    def _expire_disk_locked(self):
+        cutoff = self._expired_before()
+        if cutoff is None:
+            return
+        size = self._disk.execute(
+            f"SELECT COALESCE(SUM({DISK_ROW_SIZE}), 0) FROM responses WHERE created_at < ?", (cutoff,)
+        ).fetchone()[0]
+        if size:
+            self._disk.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+            self._disk_bytes -= size
+
+    def _count_disk_bytes_locked(self):
+        self._disk_bytes = self._disk.execute(f"SELECT COALESCE(SUM({DISK_ROW_SIZE}), 0) FROM responses").fetchone()[0]
+
+    def _evict_disk_locked(self):
+        """Delete the oldest disk rows (insertion order) until the tier fits disk_max_bytes."""
+        while self._disk_bytes > self.disk_max_bytes:
+            rows = self._disk.execute(
+                f"SELECT rowid, {DISK_ROW_SIZE} FROM responses ORDER BY rowid LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                return
+            evicted = []
+            for rowid, size in rows:
+                if self._disk_bytes <= self.disk_max_bytes:
+                    break
+                evicted.append((rowid,))
+                self._disk_bytes -= size
+            self._disk.executemany("DELETE FROM responses WHERE rowid = ?", evicted)
+            self.stats_counts["disk_evictions"] += len(evicted)
+
+    def _lookup_disk(self, bucket: str, embedding: np.ndarray) -> Optional[str]:
+        if self._disk is None:
+            return None
+
+        with self._lock:
+            rows = self._disk.execute(
+                "SELECT query_key, embedding, answer, tags, created_at FROM responses"
+                " WHERE bucket = ? AND created_at >= ?", (bucket, self._expired_before() or 0)
+            ).fetchall()
+
+        for query_key, blob, answer, tags, created_at in rows:
+            stored = np.frombuffer(blob, dtype="float32")
+            if float(np.dot(stored, embedding)) >= self.threshold:
+                self._store_memory(bucket, query_key, stored, answer, json.loads(tags), created_at)
+                with self._lock:
+                    self.stats_counts["disk_hits"] += 1
+                return answer
+        return None
+
+    # =============================
+    # Invalidation
+    # =============================
+    def invalidate(self, tags: Iterable[str]):
+        tags = list(tags)
+        with self._lock:
+            entry_ids = set()
+            for tag in tags:
+                entry_ids |= self._tags.get(tag, set())
+            for entry_id in entry_ids:
+                self._remove_locked(entry_id)
+            self.stats_counts["invalidations"] += len(entry_ids)
+
+            if self._disk is not None and tags:
+                for tag in tags:
+                    # Ids may contain LIKE wildcards (_ and %); match the quoted tag literally
+                    pattern = re.sub(r"([\\%_])", r"\\\1", json.dumps(tag))
+                    self._disk.execute("DELETE FROM responses WHERE tags LIKE ? ESCAPE '\\'", (f"%{pattern}%",))
+                self._count_disk_bytes_locked()
+                self._disk.commit()
+
+    def invalidate_products(self, product_ids: Iterable[str]):
+        self.invalidate(f"product:{pid}" for pid in product_ids)
+
+    def invalidate_orders(self, order_ids: Iterable[int]):
+        self.invalidate(f"order:{oid}" for oid in order_ids)
+
+    def invalidate_users(self, user_emails: Iterable[str]):
+        self.invalidate(f"user:{email}" for email in user_emails)
+
+    def _remove_locked(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._bytes -= entry["size"]
+        bucket_ids = self._buckets.get(entry["bucket"])
+        if bucket_ids is not None:
+            bucket_ids.discard(entry_id)
+            if not bucket_ids:
+                del self._buckets[entry["bucket"]]
+        for tag in entry["tags"]:
+            tag_ids = self._tags.get(tag)
+            if tag_ids is not None:
+                tag_ids.discard(entry_id)
+                if not tag_ids:
+                    del self._tags[tag]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._tags.clear()
+            self._bytes = 0
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM responses")
+                self._disk.commit()
+                self._disk_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.stats_counts["exact_hits"] + self.stats_counts["semantic_hits"] + self.stats_counts["disk_hits"]
+            lookups = hits + self.stats_counts["misses"]
+            return {
+                **self.stats_counts,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "disk_tier": self._disk is not None,
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
+
+
+def _disk_row_size(query_key: str, blob: bytes, answer: str, tags_json: str) -> int:
+    return len(query_key.encode()) + len(blob) + len(answer.encode()) + len(tags_json.encode()) + 64
+
+
+# =============================
+# GLOBAL INSTANCE
+# =============================
+RESPONSE_CACHE = ResponseCache()
+
+
+async def lookup_response(query: str, intent: str, context: str, conversation_history: list = None):
+    """
+    Returns (answer, probe). answer is None on a miss; pass the probe to
+    store_response once the LLM has answered.
+    """
+    from database.vector_db import embed_queries_async
+
+    bucket = context_bucket(intent, context, conversation_history)
+    query_key = normalize_query(query)
+
+    if intent not in SEMANTIC_INTENTS:
+        return RESPONSE_CACHE.lookup_keyed(bucket, query_key), CacheProbe(bucket, query_key, None)
+
+    answer = RESPONSE_CACHE.lookup_exact(bucket, query_key)
+    if answer is not None:
+        return answer, None
+
+    try:
+        embedding = (await embed_queries_async([query]))[0]
+        embedding = (embedding / (np.linalg.norm(embedding) or 1.0)).astype("float32")
+    except Exception as e:
+        print(f"⚠️ Response cache embedding failed: {e}")
+        return None, None
+
+    probe = CacheProbe(bucket, query_key, embedding)
+    return RESPONSE_CACHE.lookup_semantic(bucket, embedding), probe
+
+
+def store_response(probe: Optional[CacheProbe], answer: str, tags: Iterable[str] = ()):
+    if probe is not None:
+        RESPONSE_CACHE.store(probe, answer, tags)
+
+
+def get_response_cache_stats() -> dict:
+    return {"enabled": RESPONSE_CACHE_ENABLED, **RESPONSE_CACHE.stats()}
+
+
+# =============================
+# Invalidation hooks
+# =============================
+def _on_products_changed(product_ids):
+    RESPONSE_CACHE.invalidate_products(product_ids)
+
+
+def _on_orders_changed(order_ids):
+    RESPONSE_CACHE.invalidate_orders(order_ids)
+
+
+def _on_orders_placed(user_emails):
+    RESPONSE_CACHE.invalidate_users(user_emails)
+
+
+def register_invalidation_hooks():
+    from database.sql_db import subscribe_new_orders, subscribe_order_changes
+    from database.vector_db import VECTOR_DB
+
+    VECTOR_DB.subscribe(_on_products_changed)
+    subscribe_order_changes(_on_orders_changed)
+    subscribe_new_orders(_on_orders_placed)
+
+
+register_invalidation_hooks()
@@ -1,5 +1,30 @@
+import asyncio
+import os
+import re
+from collections import Counter
+from typing import List
 from database.sql_db import get_user_orders, get_order_by_tracking, get_recent_order_products
-from database.vector_db import search_products, get_product_by_id, search_products_by_ids
+from database.vector_db import (
+    search_products_many, search_products_many_async, get_product_by_id, search_products_by_ids
+)
+from services.product_resolver import resolve_product_ids
+
+# Most products sent to the LLM per question
+PRODUCT_TOP_K = int(os.getenv("PRODUCT_TOP_K", "3"))
+# Send only the relevant ones (score floor + relative cutoff in VectorDB.search; may leave none)
+PRODUCT_SEARCH_ADAPTIVE = os.getenv("PRODUCT_SEARCH_ADAPTIVE", "true").lower() == "true"
+
+PRODUCT_CONTEXT_STATS = Counter()
+
+# Comparison questions are split into one sub-query per product
+COMPARISON_CUE = re.compile(r"\b(?:compare|comparing|comparison|difference|differences|vs|versus|better)\b", re.I)
+COMPARISON_LEAD = re.compile(
+    r"^(?:please\s+|can you\s+)*(?:compare|comparing|comparison of|"
+    r"(?:what(?:'s| is| are)\s+)?(?:the\s+)?differences?\s+between|which(?: one)? is better[,:]?)\s+",
+    re.I
+)
+COMPARISON_SPLIT = re.compile(r"\s*,\s*|\s+(?:vs\.?|versus|compared (?:to|with)|and|or)\s+", re.I)
+ARTICLE = re.compile(r"^(?:the|a|an)\s+", re.I)
 
 
 def retrieve_order_details(query: str, entities: dict, user_email: str = "john@example.com") -> dict:
@@ -63,14 +88,135 @@ Order #{order.id}:
     }
 
 
+def resolve_named_products(query: str, filters: dict = None) -> list:
+    """Products named in the query ("Dell XPS 15", "WH-1000XM5"), fetched by id without a vector search."""
+    product_ids = resolve_product_ids(query)
+    if not product_ids:
+        return []
+    return search_products_by_ids(product_ids, query=query, filters=filters)
+
+
+def split_product_query(query: str) -> List[str]:
+    """
+    "Compare Samsung Galaxy S23 and Apple iPad Air" -> ["Samsung Galaxy S23", "Apple iPad Air"].
+    Queries without a comparison cue come back unchanged, so "phone with
+    good camera and battery" stays one query.
+    """
+    text = query.strip().rstrip("?!. ")
+    if not COMPARISON_CUE.search(text):
+        return [query]
+
+    parts = COMPARISON_SPLIT.split(COMPARISON_LEAD.sub("", text))
+    parts = list(dict.fromkeys(ARTICLE.sub("", part.strip()) for part in parts if part.strip()))
+    return parts if len(parts) >= 2 else [query]
+
+
+def merge_product_results(per_query: List[list], limit: int) -> list:
+    """Interleave sub-query results by rank, one entry per product."""
+    merged = []
+    seen = set()
+    for rank in range(max((len(results) for results in per_query), default=0)):
+        for results in per_query:
+            if rank < len(results):
+                product = results[rank].get("product", results[rank])
+                if product.get("product_id") not in seen:
+                    seen.add(product.get("product_id"))
+                    merged.append(results[rank])
+    return merged[:limit]
+
+
+def _merge_sub_queries(sub_queries: List[str], named: List[list], searched: List[list]) -> list:
+    searched = iter(searched)
+    per_query = [found or next(searched) for found in named]
+    limit = max(PRODUCT_TOP_K, len(sub_queries), *(len(found) for found in named))
+    return merge_product_results(per_query, limit)
+
+
+def _plan_product_search(query: str, entities: dict) -> dict:
+    """
+    First half of product retrieval, shared by the sync and async paths:
+    split the query, resolve named products, and list the sub-queries left
+    for vector search (embedded in one batch, searched in one FAISS call).
+    """
+    filters = entities.get("filters")
+    sub_queries = split_product_query(query)
+    named = [resolve_named_products(sub_query, filters) for sub_query in sub_queries]
+    return {
+        "filters": filters,
+        "sub_queries": sub_queries,
+        "named": named,
+        "pending": [sub_query for sub_query, found in zip(sub_queries, named) if not found],
+        "search": {"top_k": PRODUCT_TOP_K, "filters": filters, "adaptive": PRODUCT_SEARCH_ADAPTIVE}
+    }
+
+
+def _finish_product_search(plan: dict, searched: List[list]) -> dict:
+    """Second half: merge named and searched products into the retrieval result."""
+    results = _merge_sub_queries(plan["sub_queries"], plan["named"], searched)
+    return build_product_context(results, plan["filters"])
+
+
 def retrieve_product_details(query: str, entities: dict) -> dict:
-    results = search_products(query, top_k=3)
+    plan = _plan_product_search(query, entities)
+    searched = search_products_many(plan["pending"], **plan["search"]) if plan["pending"] else []
+    return log_product_context(_finish_product_search(plan, searched))
+
+
+async def retrieve_product_details_async(query: str, entities: dict) -> dict:
+    return log_product_context(await search_product_details_async(query, entities))
+
 
+async def search_product_details_async(query: str, entities: dict) -> dict:
+    """Product retrieval without the context log, for speculative searches that may be discarded."""
+    plan = _plan_product_search(query, entities)
+    searched = await search_products_many_async(plan["pending"], **plan["search"]) if plan["pending"] else []
+    return _finish_product_search(plan, searched)
+
+
+def log_product_context(retrieval_result: dict) -> dict:
+    """Record how many products and characters of context a product question sends to the LLM."""
+    products = len(retrieval_result["results"])
+    PRODUCT_CONTEXT_STATS["requests"] += 1
+    PRODUCT_CONTEXT_STATS["products"] += products
+    PRODUCT_CONTEXT_STATS["trimmed_slots"] += max(PRODUCT_TOP_K - products, 0)
+    PRODUCT_CONTEXT_STATS["context_chars"] += len(retrieval_result["context"])
+    return retrieval_result
+
+
+def get_product_context_stats() -> dict:
+    requests = PRODUCT_CONTEXT_STATS["requests"]
+    return {
+        "requests": requests,
+        "adaptive": PRODUCT_SEARCH_ADAPTIVE,
+        "top_k": PRODUCT_TOP_K,
+        "avg_products": PRODUCT_CONTEXT_STATS["products"] / requests if requests else 0.0,
+        "avg_context_chars": PRODUCT_CONTEXT_STATS["context_chars"] / requests if requests else 0.0,
+        "trimmed_slots": PRODUCT_CONTEXT_STATS["trimmed_slots"]
+    }
+
+
+def describe_filters(filters: dict) -> str:
+    parts = []
+    if filters.get("category"):
+        parts.append("category " + " or ".join(filters["category"]))
+    if filters.get("min_price") is not None:
+        parts.append(f"price from ${filters['min_price']:g}")
+    if filters.get("max_price") is not None:
+        parts.append(f"price up to ${filters['max_price']:g}")
+    if filters.get("in_stock"):
+        parts.append("in stock")
+    return ", ".join(parts)
+
+
+def build_product_context(results: list, filters: dict = None) -> dict:
     if not results:
+        context = "No products found matching your query."
+        if filters:
+            context = f"No products found matching: {describe_filters(filters)}."
         return {
             "data_source": "VECTOR",
             "results": [],
-            "context": "No products found matching your query."
+            "context": context
         }
 
     context = "Here are the relevant products:\n\n"
@@ -81,6 +227,7 @@ def retrieve_product_details(query: str, entities: dict) -> dict:
 Product {i}: {product.get('name')}
 - Category: {product.get('category')}
 - Price: ${product.get('price')}
+- In Stock: {product.get('stock')}
 - Description: {product.get('description')}
 """
 
@@ -154,3 +301,14 @@ def retrieve(intent: str, query: str, entities: dict, user_email: str = "john@ex
         "results": [],
         "context": "Could not understand your request."
     }
+
+
+async def retrieve_async(intent: str, query: str, entities: dict, user_email: str = "john@example.com") -> dict:
+    """
+    Non-blocking variant of retrieve. SQL lookups run in a worker thread,
+    product search embeds the query with the async client.
+    """
+    if intent == "PRODUCT_DETAILS":
+        return await retrieve_product_details_async(query, entities)
+
+    return await asyncio.to_thread(retrieve, intent, query, entities, user_email)
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import os
+from collections import Counter
+
+from services.intent_classifier import (
+    classify_intent_async, classify_intent_without_llm, extract_product_filters, record_llm_intent
+)
+from services.rag_engine import build_user_message, generate_structured_async
+from services.retriever import (
+    log_product_context, retrieve_async, retrieve_order_details, retrieve_order_product_details,
+    search_product_details_async
+)
+
+# One LLM call picks the intent and answers from candidate context (off by default: longer prompts)
+SINGLE_CALL_MODE = os.getenv("SINGLE_CALL_MODE", "false").lower() == "true"
+
+INTENTS = ("ORDER_DETAILS", "PRODUCT_DETAILS", "ORDER_PRODUCT_DETAILS")
+
+# local (intent known without the LLM) / answered (one call) / retrieved (LLM asked for a
+# retrieval, so a second call answers) / fallback (unusable output, classifier path)
+SINGLE_CALL_STATS = Counter()
+
+SINGLE_CALL_PROMPT = """
+You are a professional AI customer support assistant for an e-commerce store.
+
+The retrieved info holds the customer's orders, the catalog products that best match the question
+and current information about the products in the customer's recent order.
+First classify the question into ONE intent:
+- ORDER_DETAILS: the customer's orders, status, delivery or tracking
+- PRODUCT_DETAILS: products in the catalog (features, prices, comparisons)
+- ORDER_PRODUCT_DETAILS: current information about products the customer bought
+
+Then answer using ONLY the retrieved info. If it does not contain what the answer needs
+(for example a product the search did not find), leave "answer" empty and set
+"needs_retrieval" to true.
+
+Respond ONLY with JSON like:
+{
+  "intent": "ORDER_DETAILS",
+  "entities": {"tracking_number": "TRK12345"},
+  "needs_retrieval": false,
+  "answer": "..."
+}
+"""
+
+
+async def gather_candidates(query: str, user_email: str) -> dict:
+    """
+    The retrieval each intent runs without entities, all at once: the user's
+    orders (SQL), a product search (FAISS) and the current info for the
+    products of the recent order. Keyed by intent.
+    """
+    filters = extract_product_filters(query)
+    orders, products, order_products = await asyncio.gather(
+        asyncio.to_thread(retrieve_order_details, query, {}, user_email),
+        search_product_details_async(query, {"filters": filters} if filters else {}),
+        asyncio.to_thread(retrieve_order_product_details, query, {}, user_email)
+    )
+    return {"ORDER_DETAILS": orders, "PRODUCT_DETAILS": products, "ORDER_PRODUCT_DETAILS": order_products}
+
+
+def build_candidate_context(candidates: dict) -> str:
+    return (
+        f"Customer Orders:\n{candidates['ORDER_DETAILS']['context']}\n\n"
+        f"Matching Products:\n{candidates['PRODUCT_DETAILS']['context']}\n\n"
+        f"Products From Recent Order:\n{candidates['ORDER_PRODUCT_DETAILS']['context']}"
+    )
+
+
+def parse_decision(text: str):
+    """The model's JSON, or None when it is missing, malformed or names an unknown intent."""
+    try:
+        decision = json.loads(text) if text else None
+    except ValueError:
+        return None
+    if not isinstance(decision, dict) or decision.get("intent") not in INTENTS:
+        return None
+    if not isinstance(decision.get("entities"), dict):
+        decision["entities"] = {}
+    return decision
+
+
+async def classify_and_answer(query: str, user_email: str, conversation_history: list = None) -> dict:
+    """
+    Intent and answer from a single LLM call where the LLM is needed at all.
+    Queries the rules, intent model or intent cache can classify are
+    retrieved as usual (their answer is the only LLM call anyway). Otherwise
+    the candidate context goes to the LLM in JSON mode; if it asks for a
+    specific retrieval, that retrieval runs and the caller generates the answer.
+
+    Returns intent_result, retrieval_result and answer (None when the caller
+    still has to generate it).
+    """
+    intent_result = classify_intent_without_llm(query)
+    if intent_result is not None:
+        SINGLE_CALL_STATS["local"] += 1
+        return await _retrieve_for(intent_result, query, user_email)
+
+    candidates = await gather_candidates(query, user_email)
+    decision = parse_decision(await generate_structured_async(
+        SINGLE_CALL_PROMPT,
+        build_user_message(query, build_candidate_context(candidates), conversation_history)
+    ))
+
+    if decision is None:
+        print("⚠️ Single-call output unusable; classifying separately")
+        SINGLE_CALL_STATS["fallback"] += 1
+        return await _retrieve_for(await classify_intent_async(query), query, user_email)
+
+    intent_result = record_llm_intent(query, {
+        "intent": decision["intent"],
+        "entities": decision["entities"],
+        "reasoning": "Classified and answered in one call",
+        "source": "llm"
+    })
+    answer = str(decision.get("answer") or "").strip()
+
+    if decision.get("needs_retrieval") or not answer:
+        SINGLE_CALL_STATS["retrieved"] += 1
+        return await _retrieve_for(intent_result, query, user_email)
+
+    SINGLE_CALL_STATS["answered"] += 1
+    retrieval_result = candidates[intent_result["intent"]]
+    if intent_result["intent"] == "PRODUCT_DETAILS":
+        log_product_context(retrieval_result)
+    return {"intent_result": intent_result, "retrieval_result": retrieval_result, "answer": answer}
+
+
+async def _retrieve_for(intent_result: dict, query: str, user_email: str) -> dict:
+    retrieval_result = await retrieve_async(
+        intent_result["intent"], query, intent_result.get("entities", {}), user_email
+    )
+    return {"intent_result": intent_result, "retrieval_result": retrieval_result, "answer": None}
+
+
+def get_single_call_stats() -> dict:
+    turns = sum(SINGLE_CALL_STATS.values())
+    asked = SINGLE_CALL_STATS["answered"] + SINGLE_CALL_STATS["retrieved"] + SINGLE_CALL_STATS["fallback"]
+    return {
+        "enabled": SINGLE_CALL_MODE,
+        "turns": turns,
+        "local": SINGLE_CALL_STATS["local"],
+        "answered": SINGLE_CALL_STATS["answered"],
+        "retrieved": SINGLE_CALL_STATS["retrieved"],
+        "fallback": SINGLE_CALL_STATS["fallback"],
+        "one_call_rate": SINGLE_CALL_STATS["answered"] / asked if asked else 0.0
+    }
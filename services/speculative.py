@@ -0,0 +1,143 @@
+import asyncio
+import os
+import time
+from collections import Counter
+
+from services.intent_classifier import classify_intent_async, extract_product_filters
+from services.retriever import (
+    log_product_context, retrieve_async, retrieve_order_details, retrieve_order_product_details,
+    search_product_details_async
+)
+
+# Start likely retrievals while the LLM classifies the query (off by default: it spends extra lookups)
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+
+# hits / misses / skipped (classified without the LLM) and summed stage milliseconds
+SPECULATION_STATS = Counter()
+
+# Timing key of the speculative retrieval for each intent
+SPECULATIVE_STAGES = {
+    "ORDER_DETAILS": "retrieve_orders",
+    "PRODUCT_DETAILS": "retrieve_products",
+    "ORDER_PRODUCT_DETAILS": "retrieve_order_products"
+}
+
+
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def _timed(coro, timings: dict, stage: str) -> asyncio.Task:
+    """Run coro as a task and record its duration; cancelled stages record nothing."""
+    async def run():
+        start = time.perf_counter()
+        result = await coro
+        timings[stage] = _ms(start)
+        return result
+
+    return asyncio.create_task(run())
+
+
+def _speculate(query: str, user_email: str, timings: dict) -> dict:
+    """
+    One retrieval per intent, started before the intent is known. Each is
+    exactly what retrieve_async would run for that intent when the LLM
+    adds no entity that changes it (see _usable).
+    """
+    filters = extract_product_filters(query)
+    retrievals = {
+        "ORDER_DETAILS": asyncio.to_thread(retrieve_order_details, query, {}, user_email),
+        "PRODUCT_DETAILS": search_product_details_async(query, {"filters": filters} if filters else {}),
+        "ORDER_PRODUCT_DETAILS": asyncio.to_thread(retrieve_order_product_details, query, {}, user_email)
+    }
+    return {
+        intent: _timed(coro, timings, SPECULATIVE_STAGES[intent]) for intent, coro in retrievals.items()
+    }
+
+
+def _usable(intent_result: dict) -> bool:
+    # A tracking number switches order retrieval to a single-order lookup
+    entities = intent_result.get("entities") or {}
+    return not (intent_result["intent"] == "ORDER_DETAILS" and entities.get("tracking_number"))
+
+
+async def classify_and_retrieve_speculative(query: str, user_email: str, history=None) -> dict:
+    """
+    Intent classification with retrieval overlapped. When the query needs
+    the LLM classifier, the orders, product and order+product retrievals
+    start at once; the one the final intent needs is kept and the rest are
+    cancelled. history, an optional coroutine (conversation fetch), runs
+    alongside.
+
+    Returns intent_result, retrieval_result, history and timings (ms per
+    stage, total wall time and the latency saved over running them in turn).
+    """
+    start = time.perf_counter()
+    timings = {}
+    history_task = _timed(history, timings, "history") if history is not None else None
+    classify = _timed(classify_intent_async(query), timings, "classify")
+
+    # Rules, the intent model and the intent cache answer without awaiting anything
+    await asyncio.sleep(0)
+    speculative = _speculate(query, user_email, timings) if not classify.done() else {}
+
+    task = None
+    try:
+        intent_result = await classify
+        task = speculative.pop(intent_result["intent"], None) if _usable(intent_result) else None
+
+        if task is not None:
+            SPECULATION_STATS["hits"] += 1
+            waited = time.perf_counter()
+            retrieval_result = await task
+            timings["retrieve_wait"] = _ms(waited)
+            retrieved = timings[SPECULATIVE_STAGES[intent_result["intent"]]]
+        else:
+            SPECULATION_STATS["misses" if speculative else "skipped"] += 1
+            retrieval_result = await _timed(
+                retrieve_async(intent_result["intent"], query, intent_result.get("entities", {}), user_email),
+                timings, "retrieve"
+            )
+            retrieved = timings["retrieve"]
+    except Exception:
+        # The user message is still stored before the error surfaces
+        if history_task is not None:
+            await asyncio.gather(history_task, return_exceptions=True)
+        raise
+    finally:
+        # Thread-backed lookups finish in the background; their results are dropped
+        for other in speculative.values():
+            other.cancel()
+
+    if task is not None and intent_result["intent"] == "PRODUCT_DETAILS":
+        log_product_context(retrieval_result)
+
+    conversation_history = await history_task if history_task is not None else None
+
+    timings["total"] = _ms(start)
+    serial = timings.get("history", 0.0) + timings["classify"] + retrieved
+    timings["saved"] = round(max(serial - timings["total"], 0.0), 2)
+    SPECULATION_STATS["saved_ms"] += timings["saved"]
+    SPECULATION_STATS["total_ms"] += timings["total"]
+
+    return {
+        "intent_result": intent_result,
+        "retrieval_result": retrieval_result,
+        "history": conversation_history,
+        "timings": timings
+    }
+
+
+def get_speculation_stats() -> dict:
+    turns = SPECULATION_STATS["hits"] + SPECULATION_STATS["misses"] + SPECULATION_STATS["skipped"]
+    speculated = SPECULATION_STATS["hits"] + SPECULATION_STATS["misses"]
+    return {
+        "enabled": SPECULATIVE_RETRIEVAL,
+        "turns": turns,
+        "hits": SPECULATION_STATS["hits"],
+        "misses": SPECULATION_STATS["misses"],
+        "skipped": SPECULATION_STATS["skipped"],
+        "hit_rate": SPECULATION_STATS["hits"] / speculated if speculated else 0.0,
+        "avg_total_ms": SPECULATION_STATS["total_ms"] / turns if turns else 0.0,
+        "avg_saved_ms": SPECULATION_STATS["saved_ms"] / turns if turns else 0.0
+    }
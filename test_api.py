@@ -69,6 +69,7 @@ for i, test in enumerate(test_cases, 1):
                 print(f"\n📌 Metadata:")
                 print(f"   - Context Length: {data['metadata'].get('context_length', 'N/A')} chars")
                 print(f"   - Reasoning: {data['metadata'].get('reasoning', 'N/A')}")
+                print(f"   - LLM Calls: {data['metadata'].get('llm_calls', 'N/A')}")
         else:
             print(f"\n❌ Error: HTTP {response.status_code}")
             print(response.json())
@@ -78,6 +79,53 @@ for i, test in enumerate(test_cases, 1):
     except Exception as e:
         print(f"\n❌ Error: {str(e)}")
 
+# =============================
+# Streaming endpoint (SSE)
+# =============================
+import time
+
+print(f"\n{'='*80}")
+print("TESTING STREAMING ENDPOINT (/chat/stream)")
+print(f"{'='*80}")
+
+try:
+    start = time.perf_counter()
+    first_token = None
+    tokens = 0
+    final = None
+
+    with requests.post(
+        API_URL + "/stream",
+        json={"query": "Tell me about Samsung Galaxy S23 features", "user_email": "john@example.com"},
+        stream=True,
+        timeout=60
+    ) as response:
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                data = json.loads(line[6:])
+                if event == "token":
+                    tokens += 1
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                elif event == "done":
+                    final = data
+                elif event == "error":
+                    print(f"❌ Stream error: {data['detail']}")
+
+    total = time.perf_counter() - start
+    if final:
+        print(f"✅ {tokens} token events, first after {first_token * 1000:.0f} ms, done after {total * 1000:.0f} ms")
+        print(f"🎯 Intent: {final['intent']}")
+        print(f"🤖 Response: {final['response'][:200]}...")
+    else:
+        print("❌ Stream ended without a done event")
+
+except Exception as e:
+    print(f"\n❌ Error: {str(e)}")
+
 print("\n" + "="*80)
 print("✅ API TEST COMPLETE!")
 print("="*80)
\ No newline at end of file
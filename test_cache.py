@@ -0,0 +1,87 @@
+import time
+from utils.cache import LRUCache
+from utils.helpers import normalize_query
+
+print("="*60)
+print("TESTING LRU + TTL CACHE")
+print("="*60)
+
+# Test 1: Query normalization
+print("\n1️⃣ Normalized keys:")
+for query in ["Where is my order?", "where is my  ORDER", "Where's my order!!"]:
+    print(f"   '{query}' -> '{normalize_query(query)}'")
+
+# Test 2: LRU eviction
+print("\n2️⃣ LRU eviction (max_size=2):")
+cache = LRUCache(max_size=2, ttl=None)
+cache.set("a", 1)
+cache.set("b", 2)
+cache.get("a")          # 'a' is now most recently used
+cache.set("c", 3)       # evicts 'b'
+print(f"   a={cache.get('a')} b={cache.get('b')} c={cache.get('c')}")
+assert cache.get("b") is None
+
+# Test 3: TTL expiry
+print("\n3️⃣ TTL expiry (ttl=0.1s):")
+cache = LRUCache(max_size=10, ttl=0.1)
+cache.set("where is my order", {"intent": "ORDER_DETAILS"})
+print(f"   Before expiry: {cache.get('where is my order')}")
+time.sleep(0.15)
+print(f"   After expiry: {cache.get('where is my order')}")
+assert cache.get("where is my order") is None
+
+print(f"\n📊 Stats: {cache.stats()}")
+
+# Test 4: Response cache disk tier stays within its byte budget
+print("\n4️⃣ Response cache disk tier (disk_max_bytes=8KB):")
+import os
+import tempfile
+import numpy as np
+from services.response_cache import CacheProbe, ResponseCache
+
+disk_path = os.path.join(tempfile.mkdtemp(), "responses.db")
+responses = ResponseCache(disk_path=disk_path, disk_max_bytes=8 * 1024)
+for i in range(50):
+    embedding = np.random.default_rng(i).normal(size=64).astype("float32")
+    responses.store(CacheProbe(f"bucket{i}", f"question {i}", embedding), "answer " * 20)
+stats = responses.stats()
+rows = responses._disk.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+print(f"   {rows} rows, {stats['disk_bytes']} bytes, {stats['disk_evictions']} evicted")
+assert 0 < stats["disk_bytes"] <= 8 * 1024
+
+# Reopening counts what is already on disk
+reopened = ResponseCache(disk_path=disk_path, disk_max_bytes=8 * 1024)
+assert reopened.stats()["disk_bytes"] == stats["disk_bytes"]
+
+# Test 5: Order answers are dropped when the user places an order, and every answer expires
+print("\n5️⃣ Response cache user tags and TTL (ttl=0.1s):")
+from services.response_cache import collect_cache_tags
+
+tags = collect_cache_tags({"results": []}, "ORDER_DETAILS", "new@example.com")
+print(f"   Tags for a user with no orders: {tags}")
+responses = ResponseCache(ttl=0.1)
+probe = CacheProbe("orders", "where are my orders", np.ones(4, dtype="float32") / 2)
+responses.store(probe, "You have no orders yet.", tags)
+responses.invalidate_users(["new@example.com"])
+assert responses.lookup_exact("orders", "where are my orders") is None
+
+responses.store(probe, "You have no orders yet.", tags)
+time.sleep(0.15)
+assert responses.lookup_exact("orders", "where are my orders") is None
+print(f"   After invalidation and expiry: {responses.stats()['invalidations']} invalidated, "
+      f"{responses.stats()['expirations']} expired")
+
+# Test 6: Embedding cache disk tier evicts the oldest vectors and compacts its file
+print("\n6️⃣ Embedding cache disk tier (disk_max_bytes=16KB):")
+from database.embedding_cache import EmbeddingCache
+
+embeddings = EmbeddingCache(tempfile.mkdtemp(), memory_size=1, disk_max_bytes=16 * 1024)
+for i in range(5000):
+    embeddings.put("test-model", f"question {i}", np.full(64, i, dtype="float32"))
+stats = embeddings.stats()
+print(f"   {stats['disk_entries']} rows, {stats['disk_live_bytes']} live bytes in a {stats['disk_bytes']} byte file, "
+      f"{stats['disk_evictions']} evicted, {stats['compactions']} compactions")
+assert stats["disk_live_bytes"] <= 16 * 1024 and stats["compactions"] > 0
+assert embeddings.get("test-model", "question 4999")[0] == 4999
+assert embeddings.get("test-model", "question 0") is None
+print("\n✅ Cache test complete!")
@@ -0,0 +1,120 @@
+from services.intent_classifier import (
+    classify_intent_model, classify_intent_rules, extract_product_filters, extract_tracking_number
+)
+
+print("="*60)
+print("TESTING RULE-BASED INTENT FAST PATH")
+print("="*60)
+
+# (query, expected intent or None when the LLM should decide)
+test_cases = [
+    ("Where is my order?", "ORDER_DETAILS"),
+    ("Track order TRACK123456", "ORDER_DETAILS"),
+    ("Track order INVALID999", "ORDER_DETAILS"),
+    ("When will my package arrive?", "ORDER_DETAILS"),
+    ("I need support with my order", "ORDER_DETAILS"),
+    ("Tell me about Samsung Galaxy S23", "PRODUCT_DETAILS"),
+    ("Do you have wireless headphones?", "PRODUCT_DETAILS"),
+    ("Show me phones under $1000", "PRODUCT_DETAILS"),
+    ("What's the current price of the phone I bought?", "ORDER_PRODUCT_DETAILS"),
+    ("Does the laptop I purchased support fast charging?", "ORDER_PRODUCT_DETAILS"),
+    ("What features does my recent purchase have?", "ORDER_PRODUCT_DETAILS"),
+    ("hello", None),
+]
+
+correct = 0
+for query, expected in test_cases:
+    result = classify_intent_rules(query)
+    intent = result["intent"] if result else None
+    status = "✅" if intent == expected else "❌"
+    if intent == expected:
+        correct += 1
+    print(f"\n{status} '{query}'")
+    print(f"   Expected: {expected} | Got: {intent}")
+    if result and result["entities"]:
+        print(f"   📌 Entities: {result['entities']}")
+
+print("\n" + "="*60)
+print(f"Rule accuracy: {correct}/{len(test_cases)}")
+print("="*60)
+
+
+print("\n" + "="*60)
+print("TESTING TRACKING NUMBER EXTRACTION")
+print("="*60)
+
+tracking_cases = [
+    ("Track order TRACK123456", "TRACK123456"),
+    ("Track order INVALID999", "INVALID999"),
+    ("What's the status of TRK12345?", "TRK12345"),
+    ("Tracking number 12345678", "12345678"),
+    ("Track my 2 orders", None),
+    ("Track my order", None),
+]
+
+correct = 0
+for query, expected in tracking_cases:
+    tracking_number = extract_tracking_number(query)
+    status = "✅" if tracking_number == expected else "❌"
+    if tracking_number == expected:
+        correct += 1
+    print(f"{status} '{query}' -> {tracking_number} (expected {expected})")
+
+print("\n" + "="*60)
+print(f"Tracking accuracy: {correct}/{len(tracking_cases)}")
+print("="*60)
+
+
+print("\n" + "="*60)
+print("TESTING PRODUCT FILTER EXTRACTION")
+print("="*60)
+
+filter_cases = [
+    ("Headphones under $300 that are in stock",
+     {"category": ["Audio", "Gaming"], "max_price": 300.0, "in_stock": True}),
+    ("Laptops between $1000 and $1800", {"category": ["Laptop"], "min_price": 1000.0, "max_price": 1800.0}),
+    ("Monitor $400-$500", {"category": ["Monitor"], "min_price": 400.0, "max_price": 500.0}),
+    ("8TB external hard drive", {"category": ["Storage"]}),
+    ("Phones over 1k", {"category": ["Smartphone"], "min_price": 1000.0}),
+    ("What's your return policy?", {}),
+]
+
+correct = 0
+for query, expected in filter_cases:
+    filters = extract_product_filters(query)
+    status = "✅" if filters == expected else "❌"
+    if filters == expected:
+        correct += 1
+    print(f"\n{status} '{query}'")
+    print(f"   Expected: {expected}")
+    print(f"   Got:      {filters}")
+
+print("\n" + "="*60)
+print(f"Filter accuracy: {correct}/{len(filter_cases)}")
+print("="*60)
+
+
+print("\n" + "="*60)
+print("TESTING INTENT MODEL GATES")
+print("="*60)
+
+# Off-topic or one-word queries must reach the LLM however confident the softmax is
+model_cases = [
+    ("tell me a joke", None),
+    ("my", None),
+    ("what's the weather like today", None),
+    ("What's the current price of the laptop I bought?", "ORDER_PRODUCT_DETAILS"),
+]
+
+correct = 0
+for query, expected in model_cases:
+    result = classify_intent_model(query)
+    intent = result["intent"] if result else None
+    status = "✅" if intent == expected else "❌"
+    if intent == expected:
+        correct += 1
+    print(f"{status} '{query}' -> {intent} (expected {expected})")
+
+print("\n" + "="*60)
+print(f"Model gate accuracy: {correct}/{len(model_cases)}")
+print("="*60)
\ No newline at end of file
@@ -44,4 +44,19 @@ products = search_products_by_ids(["PROD001", "PROD003"], query="tablet for draw
 for product in products:
     print(f"   - {product['name']}")
 
+# Test 5: Adaptive search with filters keeps matches the filters already narrowed to
+print("\n5️⃣ Adaptive search: 'headphones under $300 in stock' (filtered)")
+filters = {"category": ["Audio", "Gaming"], "max_price": 300, "in_stock": True}
+results = search_products("headphones under $300 in stock", top_k=3, filters=filters, adaptive=True)
+status = "✅" if results else "❌"
+print(f"   {status} {len(results)} result(s)")
+for result in results:
+    print(f"   - {result['product']['name']} (${result['product']['price']})")
+
+# Test 6: Adaptive search without filters leaves unrelated questions empty
+print("\n6️⃣ Adaptive search: 'what is the capital of France' (unrelated)")
+results = search_products("what is the capital of France", top_k=3, adaptive=True)
+status = "✅" if not results else "❌"
+print(f"   {status} {len(results)} result(s)")
+
 print("\n✅ Vector DB test complete!")
\ No newline at end of file
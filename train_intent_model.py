@@ -0,0 +1,147 @@
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+
+from services.intent_model import (
+    IntentModel, load_corpus, load_out_of_domain, INTENT_CORPUS_PATH, INTENT_MODEL_PATH, INTENT_OUT_OF_DOMAIN_PATH
+)
+
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99]
+SIMILARITY_FLOORS = [0.0, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4]
+MARGIN_FLOORS = [0.0, 0.02, 0.05, 0.1, 0.15, 0.2]
+
+
+def held_out_scores(examples: list, out_of_domain: list, temperature: float, folds: int = 5):
+    """
+    Each corpus example scored by a model trained without it (k-fold), and
+    each out-of-domain query (never trained on) by the full-corpus model.
+    Returns (model.score() result, expected intent or None) pairs.
+    """
+    scored = []
+    for fold in range(folds):
+        train = [ex for i, ex in enumerate(examples) if i % folds != fold]
+        model = IntentModel.train(train, temperature=temperature)
+        scored += [(model.score(ex["text"]), ex["intent"]) for i, ex in enumerate(examples) if i % folds == fold]
+
+    model = IntentModel.train(examples, temperature=temperature)
+    scored += [(model.score(text), None) for text in out_of_domain]
+    return scored
+
+
+def calibrate(scored: list, target_precision: float) -> dict:
+    """
+    The gates (confidence threshold, similarity and margin floors) that let
+    the model answer the most held-out corpus queries while its accepted
+    answers stay at least target_precision correct. An accepted
+    out-of-domain query counts as a wrong answer.
+    """
+    probe = IntentModel(idf={}, centroids={})
+    best, best_key = None, None
+
+    for threshold in THRESHOLDS:
+        for min_similarity in SIMILARITY_FLOORS:
+            for min_margin in MARGIN_FLOORS:
+                probe.threshold, probe.min_similarity, probe.min_margin = threshold, min_similarity, min_margin
+                accepted = [(s, expected) for s, expected in scored if probe.accepts(s)]
+                correct = sum(s["intent"] == expected for s, expected in accepted)
+                if not accepted or correct / len(accepted) < target_precision:
+                    continue
+                # Most coverage first; among equals, the strictest gates
+                key = (correct, threshold, min_similarity, min_margin)
+                if best_key is None or key > best_key:
+                    best_key = key
+                    best = {"threshold": threshold, "min_similarity": min_similarity, "min_margin": min_margin}
+
+    # Nothing reaches the target: gates no query clears, so everything goes to the LLM
+    return best or {"threshold": 1.0, "min_similarity": 1.0, "min_margin": 1.0}
+
+
+def report(scored: list, gates: dict):
+    probe = IntentModel(idf={}, centroids={}, **gates)
+    in_domain = [(s, expected) for s, expected in scored if expected is not None]
+    accepted = [(s, expected) for s, expected in scored if probe.accepts(s)]
+    accepted_in_domain = [(s, expected) for s, expected in accepted if expected is not None]
+
+    print(f"   Accuracy (held out): {sum(s['intent'] == e for s, e in in_domain) / len(in_domain):.1%}")
+    print(f"   Gates: confidence >= {gates['threshold']}, similarity >= {gates['min_similarity']}, "
+          f"margin >= {gates['min_margin']}")
+    print(f"   Coverage: {len(accepted_in_domain) / len(in_domain):.1%} of corpus queries skip the LLM")
+    if accepted:
+        print(f"   Accuracy when accepted: {sum(s['intent'] == e for s, e in accepted) / len(accepted):.1%} "
+              f"({len(accepted) - len(accepted_in_domain)} out-of-domain accepted)")
+
+
+def versioned_path(path: str, version: int) -> str:
+    """data/intent_model.json -> data/intent_model.v3.json"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.v{version}{ext}"
+
+
+def saved_versions(path: str) -> list:
+    root, ext = os.path.splitext(path)
+    pattern = re.compile(re.escape(root) + r"\.v(\d+)" + re.escape(ext) + "$")
+    return sorted(int(m.group(1)) for m in map(pattern.match, glob.glob(f"{root}.v*{ext}")) if m)
+
+
+def activate(source: str, path: str):
+    """Make source the model served from path (copied, then swapped in atomically)."""
+    shutil.copyfile(source, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the in-process intent classifier")
+    parser.add_argument("--corpus", default=INTENT_CORPUS_PATH, help="Labeled corpus (JSON list of {text, intent})")
+    parser.add_argument("--output", default=INTENT_MODEL_PATH, help="Where to write the model artifact")
+    parser.add_argument("--out-of-domain", default=INTENT_OUT_OF_DOMAIN_PATH,
+                        help="Held-out queries the model must leave to the LLM (JSON list of strings)")
+    parser.add_argument("--temperature", type=float, default=0.05, help="Softmax temperature for confidences")
+    parser.add_argument("--target-precision", type=float, default=0.95,
+                        help="Accuracy the accepted held-out predictions must reach")
+    parser.add_argument("--rollback", type=int, metavar="VERSION", help="Serve a previously trained version again")
+    args = parser.parse_args()
+
+    if args.rollback is not None:
+        source = versioned_path(args.output, args.rollback)
+        if not os.path.exists(source):
+            raise SystemExit(f"{source} not found; saved versions: {saved_versions(args.output) or 'none'}")
+        activate(source, args.output)
+        print(f"✅ {args.output} now serves intent model v{args.rollback}")
+        return
+
+    examples = load_corpus(args.corpus)
+
+    current = 0
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            current = json.load(f).get("version", 0)
+        # Keep the model being replaced, so it can be rolled back to
+        if current and not os.path.exists(versioned_path(args.output, current)):
+            shutil.copyfile(args.output, versioned_path(args.output, current))
+    version = max([current] + saved_versions(args.output)) + 1
+
+    print("="*60)
+    print(f"TRAINING INTENT MODEL v{version} ({len(examples)} examples)")
+    print("="*60)
+
+    scored = held_out_scores(examples, load_out_of_domain(args.out_of_domain), args.temperature)
+    gates = calibrate(scored, args.target_precision)
+    report(scored, gates)
+
+    model = IntentModel.train(examples, temperature=args.temperature, version=version)
+    model.threshold = gates["threshold"]
+    model.min_similarity = gates["min_similarity"]
+    model.min_margin = gates["min_margin"]
+    model.save(versioned_path(args.output, version))
+    activate(versioned_path(args.output, version), args.output)
+
+    print(f"\n✅ Saved intent model v{version} to {versioned_path(args.output, version)} (served from {args.output})")
+    if current:
+        print(f"   Roll back with: python train_intent_model.py --rollback {current}")
+
+
+if __name__ == "__main__":
+    main()
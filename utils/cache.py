@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class CacheBackend:
+    """
+    Minimal key/value cache interface. Values must be JSON-serializable
+    so any backend (in-process or shared) can hold them.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+# =============================
+# In-process LRU + TTL
+# =============================
+class LRUCache(CacheBackend):
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+# =============================
+# Shared Redis backend (optional)
+# =============================
+class RedisCache(CacheBackend):
+    """
+    Shares entries across uvicorn workers and hosts. Eviction is left to
+    Redis (maxmemory-policy allkeys-lru); TTL is set per key.
+    """
+
+    def __init__(self, url: str, namespace: str, ttl: Optional[float] = 3600):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package (pip install redis)")
+
+        self._client = redis.Redis.from_url(url)
+        self.namespace = namespace
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(self._key(key))
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key: str, value: Any):
+        ttl = int(self.ttl) if self.ttl else None
+        self._client.set(self._key(key), json.dumps(value), ex=ttl)
+
+    def delete(self, key: str):
+        self._client.delete(self._key(key))
+
+    def clear(self):
+        for key in self._client.scan_iter(f"{self.namespace}:*"):
+            self._client.delete(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "redis",
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": None,  # tracked by the Redis server (INFO stats)
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+def create_cache(namespace: str, max_size: int = 1024, ttl: Optional[float] = 3600) -> CacheBackend:
+    """
+    Build the cache backend selected by CACHE_BACKEND ("memory" or "redis").
+    """
+    backend = os.getenv("CACHE_BACKEND", "memory").lower()
+
+    if backend == "redis":
+        return RedisCache(os.getenv("REDIS_URL", "redis://localhost:6379/0"), namespace, ttl)
+
+    return LRUCache(max_size=max_size, ttl=ttl)
@@ -0,0 +1,44 @@
+import os
+import re
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Fold case, punctuation and whitespace so near-identical phrasings
+    ("Where is my order?" / "where is my  order") share a cache key.
+    """
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def mapped_file_usage(path: str) -> dict:
+    """
+    Memory of this process's mappings of `path`, from /proc/self/smaps
+    (Linux only; zeros elsewhere). `resident` counts pages in RAM,
+    `shared` the part also mapped by other processes (e.g. other workers),
+    `proportional` this process's fair share of the resident pages.
+    """
+    usage = {"mapped_bytes": 0, "resident_bytes": 0, "shared_bytes": 0, "proportional_bytes": 0}
+    fields = {"Size:": "mapped_bytes", "Rss:": "resident_bytes", "Pss:": "proportional_bytes",
+              "Shared_Clean:": "shared_bytes", "Shared_Dirty:": "shared_bytes"}
+    target = os.path.realpath(path)
+
+    try:
+        with open("/proc/self/smaps") as f:
+            matching = False
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                if not parts[0].endswith(":"):
+                    # Mapping header: address perms offset dev inode [path]
+                    matching = len(parts) >= 6 and parts[5] == target
+                elif matching and parts[0] in fields:
+                    usage[fields[parts[0]]] += int(parts[1]) * 1024
+    except OSError:
+        pass
+
+    return usage